@@ -1,9 +1,17 @@
-# Vercel Python Serverless entry wrapping Flask as ASGI
-from asgiref.wsgi import WsgiToAsgi
-from app import create_app
+# Vercel Python Serverless entry serving the Flask app over ASGI
+import os
+
+# بدء سريع: مع قاعدة مُدارة (DATABASE_URL) لا create_all ولا استعلامات عند كل تشغيل بارد؛
+# الهيكل يُنشأ بـ flask db init عند النشر. بدونها تبقى الترحيلات التلقائية لقاعدة SQLite المحلية
+if os.environ.get("DATABASE_URL"):
+    os.environ.setdefault("AUTO_MIGRATE", "0")
+
+from app import create_app  # noqa: E402
+from app.asgi import create_asgi_app  # noqa: E402
 
 # Create the original Flask WSGI app
 _flask_app = create_app()
 
-# Export ASGI app for Vercel runtime detection
-app = WsgiToAsgi(_flask_app)
+# Export ASGI app for Vercel runtime detection: hot POS endpoints run natively
+# on the event loop, everything else goes through the wrapped Flask app
+app = create_asgi_app(_flask_app)
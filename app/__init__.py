@@ -3,6 +3,14 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 from .config import Config
+from .utils.barcode import BarcodeAllocator, BarcodeCache
+from .utils.cli import LazyGroup
+from .utils.http_cache import Compression
+from .utils.jobs import JobRunner
+from .utils.metrics import Metrics
+from .utils.search_index import ProductSearchIndex
+from .utils.settings import SettingsStore
+from .utils.user_cache import UserCache
 import os
 
 # Extensions
@@ -11,6 +19,26 @@ db = SQLAlchemy()
 login_manager = LoginManager()
 login_manager.login_view = "auth.login"
 login_manager.login_message = "الرجاء تسجيل الدخول"  # Arabic message
+product_index = ProductSearchIndex()
+barcode_cache = BarcodeCache()
+barcode_allocator = BarcodeAllocator()
+site_settings = SettingsStore()
+metrics = Metrics()
+user_cache = UserCache()
+jobs = JobRunner()
+compression = Compression()
+
+# أوامر الصيانة (flask <group> ...)؛ وحداتها لا تُحمّل إلا عند تشغيل الأمر
+CLI_GROUPS = [
+    ("rollups", "app.rollups:rollups_cli", "Maintain the sales rollup tables."),
+    ("products", "app.imports:products_cli", "Bulk product maintenance."),
+    ("sales", "app.idempotency:sales_cli", "Sale maintenance."),
+    ("inventory", "app.ledger:inventory_cli", "Inventory ledger maintenance."),
+    ("alerts", "app.alerts:alerts_cli", "Low-stock alert maintenance."),
+    ("customers", "app.customers:customers_cli", "Customer maintenance."),
+    ("jobs", "app.tasks:jobs_cli", "Background job queue."),
+    ("db", "app.database:db_cli", "Database schema management."),
+]
 
 
 def create_app():
@@ -18,12 +46,26 @@ def create_app():
     app.config.from_object(Config)
 
     os.makedirs(app.instance_path, exist_ok=True)
+    app.logger.setLevel(app.config["LOG_LEVEL"])
+
+    from .database import engine_options, normalize_url
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = normalize_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config))
 
     bcrypt.init_app(app)
     db.init_app(app)
     login_manager.init_app(app)
+    product_index.init_app(app)
+    barcode_cache.init_app(app)
+    barcode_allocator.init_app(app)
+    site_settings.init_app(app)
+    metrics.init_app(app)
+    user_cache.init_app(app)
+    jobs.init_app(app)
+    compression.init_app(app)
 
-    from .models import User, Setting  # noqa: F401
+    from .models import User  # noqa: F401
 
     # Register blueprints
     from .auth import auth_bp
@@ -32,21 +74,22 @@ def create_app():
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
 
+    # المهام الخلفية تُسجَّل هنا لأن enqueue يرفض الأنواع غير المعروفة
+    from . import tasks  # noqa: F401
+
+    for name, import_name, help_text in CLI_GROUPS:
+        app.cli.add_command(LazyGroup(name, import_name, help=help_text))
+
+    from .database import configure_engine, initialize
+
     @app.context_processor
     def inject_logo():
-        logo_setting = Setting.query.get("logo_path")
-        return {"logo_path": logo_setting.value if logo_setting else ""}
+        return {"logo_path": site_settings.get("logo_path")}
 
     with app.app_context():
-        db.create_all()
-
-        # إنشاء مستخدم مدير افتراضي إذا لم يكن موجودًا
-        if not User.query.first():
-            admin = User(
-                username="admin",
-                role="admin",
-                password_hash=bcrypt.generate_password_hash("admin123").decode("utf-8"),
-            )
-            db.session.add(admin)
-            db.session.commit()
+        configure_engine(app)
+        metrics.watch(db.engine)
+        if app.config["AUTO_MIGRATE"]:
+            # AUTO_MIGRATE=0: لا اتصال بقاعدة البيانات عند البدء؛ الهيكل عبر flask db init
+            initialize()
     return app
@@ -0,0 +1,147 @@
+"""Low-stock and out-of-stock alert set, maintained on write.
+
+``stock_qty <= min_stock_alert`` compares two columns, so no index can
+answer it and every check used to scan ``products``. Instead each write that
+changes stock or a threshold calls ``refresh`` with the touched product ids
+inside its transaction, and ``stock_alerts`` holds exactly the flagged
+products. Badges, the inventory page and reports read that small table.
+``reorder_suggestions`` sizes a purchase for every flagged product from its
+recent sales velocity.
+"""
+import math
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .models import db, Product, Sale, SaleItem, StockAlert
+
+LOW, OUT = "low", "out"
+
+
+def _level(stock_qty, min_stock_alert):
+    if stock_qty <= 0:
+        return OUT
+    if stock_qty <= (min_stock_alert or 0):
+        return LOW
+    return None
+
+
+def refresh(product_ids):
+    """Re-evaluate ``product_ids`` against their thresholds (call before commit)."""
+    ids = {int(pid) for pid in product_ids if pid}
+    if not ids:
+        return
+    wanted = {}
+    for pid, stock_qty, min_stock_alert in db.session.execute(
+        db.select(Product.id, Product.stock_qty, Product.min_stock_alert).where(Product.id.in_(ids))
+    ).all():
+        level = _level(stock_qty, min_stock_alert)
+        if level:
+            wanted[pid] = level
+    flagged = dict(
+        db.session.execute(
+            db.select(StockAlert.product_id, StockAlert.level).where(StockAlert.product_id.in_(ids))
+        ).all()
+    )
+    cleared = [pid for pid in flagged if pid not in wanted]
+    if cleared:
+        db.session.execute(db.delete(StockAlert).where(StockAlert.product_id.in_(cleared)))
+    new = [{"product_id": pid, "level": level} for pid, level in wanted.items() if pid not in flagged]
+    if new:
+        db.session.execute(db.insert(StockAlert), new)
+    changed = [
+        {"product_id": pid, "level": level}
+        for pid, level in wanted.items()
+        if pid in flagged and flagged[pid] != level
+    ]
+    if changed:
+        db.session.execute(db.update(StockAlert), changed)
+
+
+def rebuild(conn):
+    """Recompute the whole set from ``products``; return the flagged count."""
+    conn.execute(db.delete(StockAlert))
+    level = db.case((Product.stock_qty <= 0, OUT), else_=LOW)
+    return conn.execute(
+        db.insert(StockAlert).from_select(
+            ["product_id", "level", "flagged_at"],
+            db.select(Product.id, level, db.literal(datetime.utcnow())).where(
+                (Product.stock_qty <= 0) | (Product.stock_qty <= db.func.coalesce(Product.min_stock_alert, 0))
+            ),
+        )
+    ).rowcount
+
+
+def counts():
+    """``{"low": n, "out": n}`` for dashboard badges."""
+    found = dict(
+        db.session.execute(
+            db.select(StockAlert.level, db.func.count()).group_by(StockAlert.level)
+        ).all()
+    )
+    return {LOW: found.get(LOW, 0), OUT: found.get(OUT, 0)}
+
+
+def flagged_products(level=None):
+    """Flagged ``Product`` rows (optionally one level), lowest stock first."""
+    query = Product.query.join(StockAlert, StockAlert.product_id == Product.id)
+    if level:
+        query = query.filter(StockAlert.level == level)
+    return query.order_by(Product.stock_qty, Product.id).all()
+
+
+def reorder_suggestions(days=None, lead_days=None, cover_days=None):
+    """Suggested purchase per flagged product from its average daily sales.
+
+    The target stock covers the supplier lead time plus ``cover_days`` at
+    the rate sold over the last ``days`` days, and is never below the
+    product's alert threshold.
+    """
+    config = current_app.config
+    days = days or config["REORDER_WINDOW_DAYS"]
+    lead_days = config["REORDER_LEAD_DAYS"] if lead_days is None else lead_days
+    cover_days = config["REORDER_COVER_DAYS"] if cover_days is None else cover_days
+
+    products = flagged_products()
+    if not products:
+        return []
+    since = datetime.utcnow() - timedelta(days=days)
+    sold = dict(
+        db.session.execute(
+            db.select(SaleItem.product_id, db.func.sum(SaleItem.qty))
+            .join(Sale, Sale.id == SaleItem.sale_id)
+            .where(Sale.created_at >= since, SaleItem.product_id.in_([p.id for p in products]))
+            .group_by(SaleItem.product_id)
+        ).all()
+    )
+    suggestions = []
+    for p in products:
+        per_day = (sold.get(p.id) or 0) / days
+        target = max(math.ceil(per_day * (lead_days + cover_days)), (p.min_stock_alert or 0) + 1)
+        suggestions.append({
+            "product_id": p.id,
+            "name": p.name,
+            "stock_qty": p.stock_qty,
+            "min_stock_alert": p.min_stock_alert,
+            "per_day": round(per_day, 2),
+            "days_left": round(max(p.stock_qty, 0) / per_day, 1) if per_day else None,
+            "suggested_qty": max(target - max(p.stock_qty, 0), 0),
+        })
+    # الأسرع نفادًا أولًا، ثم الأصناف بدون مبيعات حديثة
+    suggestions.sort(key=lambda s: (s["days_left"] is None, s["days_left"] or 0, s["product_id"]))
+    return suggestions
+
+
+@click.group("alerts")
+def alerts_cli():
+    """Low-stock alert maintenance."""
+
+
+@alerts_cli.command("rebuild")
+@with_appcontext
+def rebuild_command():
+    """Recompute the alert set from all products."""
+    with db.engine.begin() as conn:
+        click.echo(f"flagged products: {rebuild(conn)}")
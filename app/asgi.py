@@ -0,0 +1,320 @@
+"""ASGI entry point with native async handlers for the hot POS endpoints.
+
+``WsgiToAsgi`` runs the Flask app through asgiref's thread-sensitive
+``sync_to_async``, so a process answers one wrapped request at a time.
+``AsyncRoutes`` serves the read endpoints the POS screen hits on every
+scan and sale (product search, sale details, barcode images) on the event
+loop instead, reading through an ``AsyncEngine``. Everything else — HTML
+pages, writes such as ``POST /api/sale``, 404s and requests without a
+valid session cookie — goes to the wrapped Flask app unchanged, so login
+redirects, the remember-me cookie and error pages behave as before.
+Native responses carry the same JSON, validators, ``Cache-Control`` and
+gzip as the Flask views. ``ASYNC_ROUTES=0`` sends every request to Flask.
+"""
+import asyncio
+import contextvars
+import time
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+from sqlalchemy import event
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_accept_header, parse_cookie
+
+from . import barcode_cache, compression, login_manager, metrics, product_index, user_cache
+from .database import create_async_engine
+from .models import db, Customer, Sale, SaleItem, User
+from .routes import barcode_etag, sale_etag, sale_payload
+from .utils.barcode import svg_data_uri
+from .utils.http_cache import COMPRESSIBLE, IMMUTABLE, REVALIDATE, content_etag, is_fresh, validator_headers
+
+# عدّاد استعلامات الطلب الحالي (للقياسات)؛ لا يوجد g خارج Flask
+_request_sql = contextvars.ContextVar("request_sql", default=None)
+
+
+class _Request:
+    __slots__ = ("headers", "args", "root_path")
+
+    def __init__(self, scope):
+        headers = {}
+        for name, value in scope["headers"]:
+            name, value = name.decode("latin-1").lower(), value.decode("latin-1")
+            if name in headers:
+                value = headers[name] + ("; " if name == "cookie" else ", ") + value
+            headers[name] = value
+        self.headers = headers
+        self.args = parse_qs(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)
+        self.root_path = scope.get("root_path", "")
+
+    def arg(self, name, default=""):
+        values = self.args.get(name)
+        return values[0] if values else default
+
+    @property
+    def has_validators(self):
+        return "if-none-match" in self.headers or "if-modified-since" in self.headers
+
+
+class _Reply:
+    __slots__ = ("status", "body", "content_type", "headers")
+
+    def __init__(self, status, body=b"", content_type=None, headers=()):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.headers = list(headers)
+
+
+class _LazyConnection:
+    """Opens an ``AsyncConnection`` on the first ``execute`` only."""
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._conn = None
+
+    async def execute(self, statement):
+        if self._conn is None:
+            self._conn = await self._engine.connect()
+        return await self._conn.execute(statement)
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+
+
+class AsyncRoutes:
+    """ASGI app: native handlers for ``HANDLERS`` endpoints, Flask for the rest."""
+
+    HANDLERS = {
+        "main.api_products_search": "products_search",
+        "main.api_sale_details": "sale_details",
+        "main.barcode_image": "barcode_image",
+        "main.barcode_svg": "barcode_svg",
+    }
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self._adapter = flask_app.url_map.bind("localhost")
+        self._serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        self._cookie_name = flask_app.config["SESSION_COOKIE_NAME"]
+        self._max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        self._engine = None
+        self._index_lock = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = create_async_engine(self.flask_app)
+            metrics.watch(self._engine.sync_engine)
+            if metrics.enabled:
+                event.listen(self._engine.sync_engine, "before_cursor_execute", _before_cursor)
+                event.listen(self._engine.sync_engine, "after_cursor_execute", _after_cursor)
+                event.listen(self._engine.sync_engine, "handle_error", _cursor_error)
+        return self._engine
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        route = self._match(scope)
+        if route is None or not await self._respond(scope, send, *route):
+            await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._engine is not None:
+                    await self._engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _match(self, scope):
+        if scope["type"] != "http" or scope["method"] != "GET" or self._serializer is None:
+            return None
+        path, root = scope["path"], scope.get("root_path", "")
+        if root and path.startswith(root):
+            path = path[len(root):]
+        try:
+            endpoint, values = self._adapter.match(path, method="GET")
+        except HTTPException:
+            return None
+        handler = self.HANDLERS.get(endpoint)
+        return (endpoint, getattr(self, handler), values) if handler else None
+
+    async def _respond(self, scope, send, endpoint, handler, values):
+        """Answer natively; ``False`` leaves the request to Flask (nothing sent yet)."""
+        request = _Request(scope)
+        start = time.perf_counter()
+        sql = {"count": 0, "seconds": 0.0}
+        token = _request_sql.set(sql)
+        conn = _LazyConnection(self.engine)
+        try:
+            reply = None
+            if await self._authenticated(request, conn):
+                reply = await handler(request, conn, **values)
+        except Exception:
+            if metrics.enabled:
+                metrics.observe(endpoint, time.perf_counter() - start, sql["count"], sql["seconds"], 500)
+            raise
+        finally:
+            await conn.close()
+            _request_sql.reset(token)
+        if reply is None:
+            return False
+        if metrics.enabled:
+            elapsed = time.perf_counter() - start
+            metrics.observe(endpoint, elapsed, sql["count"], sql["seconds"], reply.status)
+            reply.headers.append(("Server-Timing", (
+                f'app;dur={elapsed * 1000:.1f}, '
+                f'db;dur={sql["seconds"] * 1000:.1f};desc="{sql["count"]} queries"'
+            )))
+        await self._send(request, send, reply)
+        return True
+
+    async def _authenticated(self, request, conn):
+        """Whether the Flask session cookie belongs to an existing user (as ``login_required``)."""
+        if login_manager.session_protection == "strong":
+            return False  # التحقق من بصمة العميل يبقى في Flask-Login
+        cookie = parse_cookie(request.headers.get("cookie")).get(self._cookie_name)
+        if not cookie:
+            return False
+        try:
+            user_id = int(self._serializer.loads(cookie, max_age=self._max_age).get("_user_id"))
+        except (BadSignature, TypeError, ValueError):
+            return False
+        if user_cache.peek(user_id) is not None:
+            return True
+        row = (await conn.execute(
+            db.select(User.id, User.username, User.role).where(User.id == user_id)
+        )).first()
+        return user_cache.remember(user_id, row) is not None
+
+    async def _send(self, request, send, reply):
+        headers = [("Content-Type", reply.content_type)] if reply.content_type else []
+        headers += reply.headers
+        body = reply.body
+        if 200 <= reply.status < 300 and compression.min_size and reply.content_type.split(";")[0] in COMPRESSIBLE:
+            headers.append(("Vary", "Accept-Encoding, Cookie"))
+            gzipped = None
+            if parse_accept_header(request.headers.get("accept-encoding"))["gzip"]:
+                gzipped = compression.compress_body(body)
+            if gzipped is not None:
+                body = gzipped
+                headers.append(("Content-Encoding", "gzip"))
+                # النسخة المضغوطة تحمل وسمًا ضعيفًا كما في Compression._compress
+                headers = [("ETag", "W/" + v) if k == "ETag" and not v.startswith("W/") else (k, v) for k, v in headers]
+        else:
+            headers.append(("Vary", "Cookie"))
+        if reply.status != 304:
+            headers.append(("Content-Length", str(len(body))))
+        await send({
+            "type": "http.response.start",
+            "status": reply.status,
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    def _json(self, payload, headers=()):
+        response = self.flask_app.json.response(payload)
+        return _Reply(200, response.get_data(), response.content_type, headers)
+
+    @staticmethod
+    def _not_modified(etag, cache_control=REVALIDATE):
+        # 304 بدون Last-Modified كما يفعل werkzeug
+        return _Reply(304, headers=validator_headers(etag, cache_control=cache_control))
+
+    # --- handlers --------------------------------------------------------
+
+    async def products_search(self, request, conn):
+        if self._index_lock is None:
+            self._index_lock = asyncio.Lock()
+        # طلب واحد يعيد تحميل الفهرس والباقي ينتظرونه بدل تحميله كلٌ على حدة
+        async with self._index_lock:
+            await product_index.refresh_async(conn)
+        results = product_index.search(request.arg("q").strip(), limit=10, refresh=False)
+        etag = content_etag(results)
+        if is_fresh(request.headers, etag):
+            return self._not_modified(etag)
+        return self._json(results, validator_headers(etag))
+
+    async def sale_details(self, request, conn, sale_id):
+        if request.has_validators:
+            version = (await conn.execute(
+                db.select(Sale.customer_id, Sale.created_at).where(Sale.id == sale_id)
+            )).first()
+            if version is None:
+                return None
+            etag = sale_etag(sale_id, version.customer_id)
+            if is_fresh(request.headers, etag, version.created_at):
+                return self._not_modified(etag)
+        sale = (await conn.execute(
+            db.select(
+                Sale.id, Sale.customer_id, Sale.total, Sale.net_total, Sale.discount, Sale.tax,
+                Sale.created_at, Customer.name.label("customer_name"),
+            )
+            .outerjoin(Customer, Customer.id == Sale.customer_id)
+            .where(Sale.id == sale_id)
+        )).first()
+        if sale is None:
+            return None
+        items = (await conn.execute(
+            db.select(SaleItem.product_id, SaleItem.product_name, SaleItem.qty, SaleItem.price, SaleItem.total)
+            .where(SaleItem.sale_id == sale_id)
+            .order_by(SaleItem.id)
+        )).all()
+        return self._json(
+            sale_payload(sale, sale.customer_name, items),
+            validator_headers(sale_etag(sale.id, sale.customer_id), sale.created_at),
+        )
+
+    async def barcode_svg(self, request, conn, code):
+        etag = barcode_etag(code)
+        if is_fresh(request.headers, etag):
+            return self._not_modified(etag, IMMUTABLE)
+        # الرسم وقراءة القرص متزامنان؛ نشغلهما في خيط حتى لا توقف الحلقة
+        svg = await asyncio.to_thread(barcode_cache.get, code)
+        if not svg:
+            return None
+        return _Reply(200, svg, "image/svg+xml; charset=utf-8", validator_headers(etag, cache_control=IMMUTABLE))
+
+    async def barcode_image(self, request, conn, code):
+        etag = barcode_etag(code)
+        if is_fresh(request.headers, etag):
+            return self._not_modified(etag, IMMUTABLE)
+        try:
+            img = svg_data_uri(await asyncio.to_thread(barcode_cache.get, code))
+        except Exception as e:
+            return self._json({"success": False, "image": "", "error": str(e)})
+        url = request.root_path + self._adapter.build("main.barcode_svg", {"code": code})
+        headers = validator_headers(etag, cache_control=IMMUTABLE) if img else ()
+        return self._json({"success": bool(img), "image": img, "url": url}, headers)
+
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("asgi_started", []).append(time.perf_counter())
+
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    sql, started = _request_sql.get(), conn.info.get("asgi_started")
+    if started:
+        elapsed = time.perf_counter() - started.pop()
+        if sql is not None:
+            sql["count"] += 1
+            sql["seconds"] += elapsed
+
+
+def _cursor_error(context):
+    started = context.connection.info.get("asgi_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def create_asgi_app(flask_app):
+    """``AsyncRoutes`` around ``flask_app``, or plain ``WsgiToAsgi`` when ``ASYNC_ROUTES`` is off."""
+    if not flask_app.config.get("ASYNC_ROUTES", True):
+        return WsgiToAsgi(flask_app)
+    return AsyncRoutes(flask_app)
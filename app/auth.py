@@ -1,24 +1,34 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required
-from .models import User, Setting
+from .models import db, User
 from . import bcrypt
 
 auth_bp = Blueprint("auth", __name__)
 
 
+def hash_rounds(password_hash):
+    """Work factor stored in a ``$2b$12$...`` bcrypt hash, or ``None``."""
+    try:
+        return int(password_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
 @auth_bp.route("/login", methods=["GET", "POST"])
 def login():
-    logo = Setting.query.get("logo_path")
-
     if request.method == "POST":
         username = request.form.get("username")
         password = request.form.get("password")
         user = User.query.filter_by(username=username).first()
         if user and bcrypt.check_password_hash(user.password_hash, password):
+            if hash_rounds(user.password_hash) != current_app.config["BCRYPT_LOG_ROUNDS"]:
+                # تغيرت تكلفة bcrypt: نعيد التشفير الآن ونحن نعرف كلمة المرور
+                user.password_hash = bcrypt.generate_password_hash(password).decode("utf-8")
+                db.session.commit()
             login_user(user)
             return redirect(url_for("main.dashboard"))
         flash("بيانات الدخول غير صحيحة", "danger")
-    return render_template("login.html", logo_path=logo.value if logo else "")
+    return render_template("login.html")
 
 
 @auth_bp.route("/logout")
@@ -0,0 +1,152 @@
+"""Versioned product catalog for offline tills.
+
+Every write that changes a product (create, edit, delete, stock movement)
+calls ``touch`` inside its transaction. Once that transaction commits, the
+touched products are stamped in ``catalog_versions`` with the next version
+number in a short transaction of their own: the counter row is locked only
+for that stamp, not for the whole sale, so tills checking out concurrently
+do not queue behind it, and stamps still commit in version order. A till
+downloads the full snapshot once and afterwards asks only for products
+stamped after the version it already has; deleted products come back as
+tombstones. The table holds one row per product, so it never needs pruning.
+"""
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, BarcodeSequence, CatalogVersion, Product
+
+FIELDS = ["id", "barcode", "name", "price", "stock_qty", "min_stock_alert"]
+_COLUMNS = [getattr(Product, f) for f in FIELDS]
+# صف العداد في جدول التسلسلات (نفس آلية BarcodeAllocator)
+SEQUENCE = "catalog_version"
+# مفتاح المنتجات المنتظرة للختم في session.info
+_PENDING = "catalog_touched"
+
+
+def seed_counter(conn):
+    """Create the version counter after the highest version already stamped (if missing)."""
+    if conn.execute(db.select(BarcodeSequence.name).where(BarcodeSequence.name == SEQUENCE)).first():
+        return
+    highest = conn.execute(db.select(db.func.max(CatalogVersion.version))).scalar() or 0
+    conn.execute(db.insert(BarcodeSequence).values(name=SEQUENCE, next_value=highest + 1))
+
+
+def _next_version(conn):
+    # UPDATE ذري في معاملة الختم القصيرة: الصف يبقى مقفولًا حتى الـ commit
+    # فلا يأخذ كاتبان نفس الرقم ولا يظهر رقم أقدم بعد رقم أحدث
+    bump = (
+        db.update(BarcodeSequence)
+        .where(BarcodeSequence.name == SEQUENCE)
+        .values(next_value=BarcodeSequence.next_value + 1)
+    )
+    for _ in range(2):
+        if conn.dialect.update_returning:
+            value = conn.execute(bump.returning(BarcodeSequence.next_value)).scalar()
+        elif conn.execute(bump).rowcount:
+            value = conn.execute(
+                db.select(BarcodeSequence.next_value).where(BarcodeSequence.name == SEQUENCE)
+            ).scalar()
+        else:
+            value = None
+        if value is not None:
+            return value - 1
+        try:
+            with conn.begin_nested():
+                seed_counter(conn)
+        except IntegrityError:
+            pass  # عامل آخر أنشأ العداد في نفس اللحظة
+    raise RuntimeError("could not allocate a catalog version")
+
+
+def stamp(conn, product_ids):
+    """Stamp ``product_ids`` with a new catalog version on ``conn``; return the version."""
+    ids = sorted({int(pid) for pid in product_ids if pid})
+    if not ids:
+        return None
+    version = _next_version(conn)
+    dialect = conn.dialect.name
+    rows = [{"product_id": pid, "version": version} for pid in ids]
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(CatalogVersion)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["product_id"], set_={"version": stmt.excluded.version}
+        )
+        conn.execute(stmt, rows)
+        return version
+    # MySQL: لا RETURNING؛ العداد المقفول في _next_version يمنع كاتبًا آخر بين القراءة والإدخال
+    stamped = set(conn.execute(
+        db.select(CatalogVersion.product_id).where(CatalogVersion.product_id.in_(ids))
+    ).scalars())
+    if stamped:
+        conn.execute(
+            db.update(CatalogVersion).where(CatalogVersion.product_id.in_(stamped)).values(version=version)
+        )
+    missing = [row for row in rows if row["product_id"] not in stamped]
+    if missing:
+        conn.execute(db.insert(CatalogVersion), missing)
+    return version
+
+
+def touch(product_ids):
+    """Stamp ``product_ids`` with a new catalog version once the current transaction commits."""
+    ids = {int(pid) for pid in product_ids if pid}
+    if ids:
+        db.session.info.setdefault(_PENDING, set()).update(ids)
+
+
+@event.listens_for(db.session, "after_commit")
+def _stamp_touched(session):
+    ids = session.info.pop(_PENDING, None)
+    if not ids:
+        return
+    try:
+        with db.engine.begin() as conn:
+            stamp(conn, ids)
+    except Exception:
+        # البيانات حُفظت بالفعل؛ المنتج يصل للأجهزة مع تعديله التالي
+        current_app.logger.exception("stamping catalog versions for %d products failed", len(ids))
+
+
+@event.listens_for(db.session, "after_rollback")
+def _drop_touched(session):
+    session.info.pop(_PENDING, None)
+
+
+def current_version():
+    return db.session.execute(db.select(db.func.max(CatalogVersion.version))).scalar() or 0
+
+
+def snapshot(since=0):
+    """Return the catalog payload for a till that already has ``since``.
+
+    ``since=0`` gives the whole catalog (``"full": true``). Products are
+    sent as arrays in ``FIELDS`` order to keep the payload small.
+    """
+    version = current_version()
+    if since and since > version:
+        # نسخة من قاعدة بيانات أخرى (أو بعد إعادة التهيئة): نرسل الكتالوج كاملًا
+        since = 0
+    if not since:
+        products = db.session.execute(db.select(*_COLUMNS).order_by(Product.id)).all()
+        deleted = []
+    else:
+        rows = db.session.execute(
+            db.select(CatalogVersion.product_id, *_COLUMNS)
+            .outerjoin(Product, Product.id == CatalogVersion.product_id)
+            .where(CatalogVersion.version > since)
+            .order_by(CatalogVersion.product_id)
+        ).all()
+        products = [row[1:] for row in rows if row.id is not None]
+        deleted = [row.product_id for row in rows if row.id is None]
+    return {
+        "version": version,
+        "full": not since,
+        "fields": FIELDS,
+        "products": [list(p) for p in products],
+        "deleted": deleted,
+    }
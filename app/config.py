@@ -6,6 +6,80 @@ class Config:
         "DATABASE_URL", f"sqlite:///{os.path.join(os.getcwd(), 'instance', 'verdi.db')}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # إنشاء الجداول وتطبيق الترحيلات والمدير الافتراضي عند كل بدء تشغيل
+    # (0 = بدء سريع بلا استعلامات؛ شغّل flask db init عند النشر)
+    AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "1") == "1"
+    # مدخل ASGI (api/index.py): مسارات POS الساخنة تُخدم مباشرة بمحرك async (0 = كل الطلبات عبر Flask)
+    ASYNC_ROUTES = os.environ.get("ASYNC_ROUTES", "1") == "1"
+    # رابط القاعدة بمشغل asyncio إن لم يكن الافتراضي مناسبًا (aiosqlite / asyncpg / aiomysql)
+    ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL", "")
+    # مجمع الاتصالات لكل عامل (PostgreSQL/MySQL فقط)
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 10))
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    # SQLite: وضع WAL وإعدادات pragma للأجهزة المنفردة
+    SQLITE_WAL = os.environ.get("SQLITE_WAL", "1") == "1"
+    # تكلفة bcrypt (كل +1 يضاعف زمن تسجيل الدخول)؛ كلمات المرور القديمة يُعاد تشفيرها عند الدخول
+    BCRYPT_LOG_ROUNDS = int(os.environ.get("BCRYPT_LOG_ROUNDS", 12))
+    # ثواني الاحتفاظ بالمستخدم المسجّل في ذاكرة العامل بدل قراءته مع كل طلب (0 = إيقاف)
+    USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 30))
     SESSION_COOKIE_HTTPONLY = True
     REMEMBER_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = "Lax"
+    # ثواني قبل إعادة بناء فهرس البحث بالكامل (0 = بدون انتهاء)
+    PRODUCT_INDEX_TTL = int(os.environ.get("PRODUCT_INDEX_TTL", 300))
+    # كل كم ثانية يتحقق الفهرس من منتجات عدّلها عامل آخر (0 = مع كل بحث)
+    PRODUCT_INDEX_CHECK_SECONDS = float(os.environ.get("PRODUCT_INDEX_CHECK_SECONDS", 1))
+    # clamp: المخزون لا ينزل تحت الصفر ويكتمل البيع / strict: رفض البيع عند نقص المخزون
+    STOCK_MODE = os.environ.get("STOCK_MODE", "clamp")
+    # عدد محاولات إعادة المعاملة عند تعارض الكتابة المتزامنة
+    DB_RETRY_ATTEMPTS = int(os.environ.get("DB_RETRY_ATTEMPTS", 3))
+    # عدد صور الباركود المحفوظة في الذاكرة لكل عامل (الباقي من القرص)
+    BARCODE_CACHE_SIZE = int(os.environ.get("BARCODE_CACHE_SIZE", 512))
+    # بادئة EAN-13 للباركود الداخلي (20-29 مخصصة للترقيم داخل المتجر)
+    BARCODE_PREFIX = os.environ.get("BARCODE_PREFIX", "20")
+    # عدد الأرقام التي يحجزها كل عامل من التسلسل في المرة الواحدة
+    BARCODE_BLOCK_SIZE = int(os.environ.get("BARCODE_BLOCK_SIZE", 50))
+    # كل كم ثانية يتحقق العامل من تغيّر الإعدادات في عامل آخر
+    SETTINGS_CHECK_SECONDS = float(os.environ.get("SETTINGS_CHECK_SECONDS", 2))
+    # مدة الاحتفاظ بمفاتيح منع تكرار البيع (ساعات) - تغطي طوابير الكاشير أوفلاين
+    SALE_KEY_TTL_HOURS = int(os.environ.get("SALE_KEY_TTL_HOURS", 168))
+    # أقصى عدد مفاتيح منتهية تُحذف في المرة الواحدة
+    SALE_KEY_PURGE_BATCH = int(os.environ.get("SALE_KEY_PURGE_BATCH", 500))
+    # عدد الصفوف في كل دفعة كتابة عند استيراد المنتجات
+    IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", 1000))
+    # لقطات المخزون تتجاهل الحركات الأحدث من هذه الثواني (معاملات لم تكتمل بعد)
+    INVENTORY_SNAPSHOT_LAG = int(os.environ.get("INVENTORY_SNAPSHOT_LAG", 60))
+    # اقتراحات إعادة الطلب: أيام حساب معدل البيع، ومدة التوريد، والأيام التي يغطيها الطلب
+    REORDER_WINDOW_DAYS = int(os.environ.get("REORDER_WINDOW_DAYS", 28))
+    REORDER_LEAD_DAYS = int(os.environ.get("REORDER_LEAD_DAYS", 7))
+    REORDER_COVER_DAYS = int(os.environ.get("REORDER_COVER_DAYS", 14))
+    # كود الدولة: ‎+20 100… و 0100… نفس رقم العميل (فارغ = بدون تحويل)
+    CUSTOMER_COUNTRY_CODE = os.environ.get("CUSTOMER_COUNTRY_CODE", "20")
+    # عدد خيوط المهام الخلفية في كل عامل ويب (0 = تشغيلها فقط عبر flask jobs work)
+    JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+    # محاولات المهمة قبل اعتبارها فاشلة، والانتظار قبل الإعادة (يتضاعف مع كل محاولة)
+    JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+    JOB_RETRY_DELAY = int(os.environ.get("JOB_RETRY_DELAY", 10))
+    # ثواني بين فحص الطابور، وبعد آخر نبض تُعتبر المهمة الجارية متروكة (عامل توقف) وتُعاد
+    JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 2))
+    JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT", 600))
+    # أيام الاحتفاظ بالمهام المنتهية وملفات التصدير الناتجة عنها
+    JOB_RETENTION_DAYS = int(os.environ.get("JOB_RETENTION_DAYS", 7))
+    # ضغط gzip للاستجابات الأكبر من هذا الحجم بالبايت (0 = إيقاف، مثلًا عند الضغط في nginx)
+    COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 500))
+    COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", 6))
+    # مستوى السجلات (DEBUG يطبع سطرًا لكل طلب عند تفعيل القياسات)
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    # قياس زمن الطلبات والاستعلامات لكل صفحة (/metrics بصيغة Prometheus للمدير)
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "0") == "1"
+    # توكن اختياري لجامع Prometheus (Authorization: Bearer ...)
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+    # عدد آخر الطلبات المحفوظة لكل صفحة لحساب p50/p95/p99
+    METRICS_WINDOW = int(os.environ.get("METRICS_WINDOW", 1024))
+    # تسجيل الاستعلامات الأبطأ من هذا الحد بالمللي ثانية (0 = إيقاف) ونسبة ما يُسجل منها
+    SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+    SLOW_QUERY_SAMPLE = float(os.environ.get("SLOW_QUERY_SAMPLE", 1.0))
+    # أقصى حجم لملف الرفع (ميجابايت)
+    MAX_CONTENT_LENGTH = int(os.environ.get("MAX_UPLOAD_MB", 64)) * 1024 * 1024
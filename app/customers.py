@@ -0,0 +1,240 @@
+"""Customer resolution at checkout, typeahead and duplicate merging.
+
+Names and phones are stored a second time in normalized form: ``name_key``
+folds case, Arabic letter variants and diacritics like the product search,
+``phone_key`` keeps only the digits (Arabic-Indic digits included) and turns
+an international prefix for ``CUSTOMER_COUNTRY_CODE`` into the local leading
+zero. Both are indexed, so ``resolve`` finds the customer of a sale with one
+index lookup and ``search`` answers the POS typeahead with prefix range
+scans. ``flask customers merge`` folds customers that share a key into the
+oldest one and recomputes ``total_purchases`` from ``sales``.
+"""
+import re
+from collections import defaultdict
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, event
+
+from .models import db, Customer, Sale
+from .utils.search_index import normalize
+
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+_NON_DIGITS = re.compile(r"\D")
+
+
+def phone_key(phone):
+    """Digits of ``phone`` in local form (``+20 100…`` → ``0100…``), or ``None``."""
+    digits = _NON_DIGITS.sub("", (phone or "").translate(_DIGITS))
+    code = current_app.config["CUSTOMER_COUNTRY_CODE"]
+    if code:
+        for prefix in ("00" + code, code):
+            # رقم دولي كامل فقط؛ الأرقام المحلية تبدأ بصفر
+            if digits.startswith(prefix) and len(digits) - len(prefix) >= 9:
+                digits = "0" + digits[len(prefix):].lstrip("0")
+                break
+    return digits or None
+
+
+def name_key(name):
+    return normalize(name)[:120] or None
+
+
+@event.listens_for(Customer, "before_insert")
+@event.listens_for(Customer, "before_update")
+def _stamp_keys(mapper, connection, target):
+    target.name_key = name_key(target.name)
+    target.phone_key = phone_key(target.phone)
+
+
+def _prefix(column, text):
+    # مقارنة نطاق بدل LIKE حتى يُستخدم الفهرس في SQLite وPostgreSQL؛ صحيحة لأن
+    # المفاتيح مرتبة بنقاط الكود (BINARY في SQLite و"C" في PostgreSQL)
+    return (column >= text) & (column < text + "\U0010ffff")
+
+
+def resolve(name, phone=None):
+    """Customer for a sale's name/phone, created (and flushed) when new.
+
+    A phone match wins; otherwise the oldest customer with the same
+    normalized name, skipping customers registered under another phone.
+    Returns ``None`` for an anonymous sale.
+    """
+    name, phone = (name or "").strip(), (phone or "").strip()
+    nkey, pkey = name_key(name), phone_key(phone)
+    customer = None
+    if pkey:
+        customer = Customer.query.filter_by(phone_key=pkey).order_by(Customer.id).first()
+    if customer is None and nkey:
+        query = Customer.query.filter_by(name_key=nkey)
+        if pkey:
+            query = query.filter(Customer.phone_key.is_(None))
+        customer = query.order_by(Customer.id).first()
+        if customer is not None and pkey:
+            customer.phone = phone
+    if customer is None and name:
+        customer = Customer(name=name, phone=phone or None, total_purchases=0)
+        db.session.add(customer)
+        db.session.flush()
+    return customer
+
+
+def search(q, limit=10):
+    """Typeahead: phone prefix, then name prefix, then names containing ``q``."""
+    nq = name_key(q)
+    if not nq:
+        return []
+    columns = (Customer.id, Customer.name, Customer.phone, Customer.total_purchases)
+    found = {}
+
+    def take(query):
+        if len(found) < limit:
+            for row in db.session.execute(query.limit(limit)).all():
+                found.setdefault(row.id, row)
+
+    digits = phone_key(q)
+    if digits and len(digits) >= 3:
+        take(db.select(*columns).where(_prefix(Customer.phone_key, digits)).order_by(Customer.phone_key))
+    take(db.select(*columns).where(_prefix(Customer.name_key, nq)).order_by(Customer.name_key, Customer.id))
+    if len(nq) >= 2:
+        # بداية أي كلمة في الاسم أو جزء منه (مسح محدود بـ limit)
+        take(
+            db.select(*columns)
+            .where(Customer.name_key.contains(nq, autoescape=True))
+            .order_by(Customer.name_key, Customer.id)
+        )
+    return [
+        {"id": r.id, "name": r.name, "phone": r.phone or "", "total_purchases": r.total_purchases or 0}
+        for r in list(found.values())[:limit]
+    ]
+
+
+def reindex(conn):
+    """Recompute ``name_key``/``phone_key`` for every customer; return the rows changed."""
+    rows = [
+        {"cid": cid, "nkey": name_key(name), "pkey": phone_key(phone)}
+        for cid, name, phone, nkey, pkey in conn.execute(
+            db.select(Customer.id, Customer.name, Customer.phone, Customer.name_key, Customer.phone_key)
+        ).all()
+        if (nkey, pkey) != (name_key(name), phone_key(phone))
+    ]
+    if rows:
+        conn.execute(
+            db.update(Customer.__table__)
+            .where(Customer.__table__.c.id == bindparam("cid"))
+            .values(name_key=bindparam("nkey"), phone_key=bindparam("pkey")),
+            rows,
+        )
+    return len(rows)
+
+
+def find_duplicates(conn):
+    """Return ``{duplicate_id: keeper_id}``; the keeper is the oldest customer.
+
+    Customers with the same phone are one customer. A customer without a
+    phone joins the customer of the same name that has one, or the oldest
+    phoneless one; a name shared by several phones is left alone.
+    """
+    rows = conn.execute(
+        db.select(Customer.id, Customer.name_key, Customer.phone_key).order_by(Customer.id)
+    ).all()
+    target = {}
+    by_phone = {}
+    for cid, _, pkey in rows:
+        if pkey:
+            keeper = by_phone.setdefault(pkey, cid)
+            if keeper != cid:
+                target[cid] = keeper
+    phoned = defaultdict(set)
+    for cid, nkey, pkey in rows:
+        if pkey and nkey:
+            phoned[nkey].add(target.get(cid, cid))
+    bare = {}
+    for cid, nkey, pkey in rows:
+        if pkey or not nkey:
+            continue
+        owners = phoned.get(nkey)
+        if owners and len(owners) > 1:
+            continue
+        keeper = next(iter(owners)) if owners else bare.setdefault(nkey, cid)
+        if keeper != cid:
+            target[cid] = keeper
+    return target
+
+
+def recompute_totals(conn):
+    """Set ``total_purchases`` from one aggregate over ``sales``; return the rows changed."""
+    totals = dict(
+        conn.execute(
+            db.select(Sale.customer_id, db.func.sum(Sale.net_total))
+            .where(Sale.customer_id.isnot(None))
+            .group_by(Sale.customer_id)
+        ).all()
+    )
+    rows = [
+        {"cid": cid, "total": totals.get(cid) or 0.0}
+        for cid, current in conn.execute(db.select(Customer.id, Customer.total_purchases)).all()
+        if abs((current or 0) - (totals.get(cid) or 0)) > 1e-6
+    ]
+    if rows:
+        conn.execute(
+            db.update(Customer.__table__)
+            .where(Customer.__table__.c.id == bindparam("cid"))
+            .values(total_purchases=bindparam("total")),
+            rows,
+        )
+    return len(rows)
+
+
+def merge(conn, duplicates):
+    """Move the sales of ``{duplicate_id: keeper_id}`` to the keepers and delete the duplicates."""
+    if not duplicates:
+        return 0
+    sales = Sale.__table__
+    conn.execute(
+        db.update(sales).where(sales.c.customer_id == bindparam("old")).values(customer_id=bindparam("new")),
+        [{"old": old, "new": new} for old, new in duplicates.items()],
+    )
+    conn.execute(db.delete(Customer.__table__).where(Customer.__table__.c.id.in_(list(duplicates))))
+    return len(duplicates)
+
+
+@click.group("customers")
+def customers_cli():
+    """Customer maintenance."""
+
+
+@customers_cli.command("merge")
+@click.option("--dry-run", is_flag=True, help="Only list the duplicates.")
+@with_appcontext
+def merge_command(dry_run):
+    """Fold duplicate customers into the oldest one and recompute totals."""
+    with db.engine.begin() as conn:
+        duplicates = find_duplicates(conn)
+        groups = defaultdict(list)
+        for old, new in duplicates.items():
+            groups[new].append(old)
+        for keeper, olds in sorted(groups.items()):
+            click.echo(f"customer {keeper} <- {', '.join(map(str, olds))}")
+        if dry_run:
+            click.echo(f"duplicates: {len(duplicates)} (dry run)")
+            return
+        click.echo(f"merged: {merge(conn, duplicates)}")
+        click.echo(f"totals updated: {recompute_totals(conn)}")
+
+
+@customers_cli.command("recompute")
+@with_appcontext
+def recompute_command():
+    """Recompute every customer's total purchases from the sales."""
+    with db.engine.begin() as conn:
+        click.echo(f"totals updated: {recompute_totals(conn)}")
+
+
+@customers_cli.command("reindex")
+@with_appcontext
+def reindex_command():
+    """Recompute the normalized name/phone keys (after changing CUSTOMER_COUNTRY_CODE)."""
+    with db.engine.begin() as conn:
+        click.echo(f"keys updated: {reindex(conn)}")
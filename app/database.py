@@ -0,0 +1,254 @@
+"""Database engine profile and schema migrations.
+
+``engine_options`` sizes the connection pool for server databases
+(PostgreSQL/MySQL); SQLite gets WAL journaling and tuned pragmas on every
+new connection instead. ``create_async_engine`` builds the same profile on
+an asyncio driver for the native ASGI routes. ``upgrade`` creates missing tables and then applies
+the numbered ``MIGRATIONS`` that ``create_all`` cannot (indexes on existing
+tables, data fixes), recording each one in ``schema_migrations``.
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, inspect, make_url, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex
+
+from .alerts import rebuild as rebuild_alerts
+from .catalog import seed_counter as seed_catalog_counter
+from .customers import reindex as reindex_customers
+from .ledger import OPENING_NOTE, close_gaps
+from .models import db, Customer, Sale, SchemaMigration, Shift, User
+from .rollups import backfill as backfill_rollups, rebuild_shift_totals
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",  # القراءة لا تنتظر الكتابة
+    "synchronous": "NORMAL",  # آمن مع WAL وأسرع بكثير من FULL
+    "busy_timeout": 5000,
+    "cache_size": -32000,  # ~32 ميجابايت
+    "temp_store": "MEMORY",
+}
+
+# مشغلات asyncio المقابلة لكل قاعدة (ASYNC_DATABASE_URL يتجاوزها)
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def normalize_url(url):
+    # Render/Heroku تعطي postgres:// وSQLAlchemy يقبل postgresql:// فقط
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def engine_options(config):
+    """``SQLALCHEMY_ENGINE_OPTIONS`` for the configured database."""
+    if config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": True,
+    }
+
+
+def _apply_sqlite_pragmas(dbapi_conn, _record):
+    cursor = dbapi_conn.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def configure_engine(app):
+    """Install per-connection SQLite pragmas (call inside an app context)."""
+    engine = db.engine
+    if engine.dialect.name == "sqlite" and app.config["SQLITE_WAL"]:
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
+
+
+def async_url(url):
+    """The asyncio-driver equivalent of a (normalized) database URL."""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def create_async_engine(app):
+    """``AsyncEngine`` with the same pool profile and SQLite pragmas as ``db.engine``."""
+    from sqlalchemy.ext.asyncio import create_async_engine as create
+
+    url = app.config.get("ASYNC_DATABASE_URL") or async_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    engine = create(url, **engine_options(app.config))
+    if engine.dialect.name == "sqlite" and app.config["SQLITE_WAL"]:
+        event.listen(engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    return engine
+
+
+def _create_indexes(*names):
+    def migrate(conn):
+        indexes = {ix.name: ix for table in db.metadata.tables.values() for ix in table.indexes}
+        for name in names:
+            conn.execute(CreateIndex(indexes[name], if_not_exists=True))
+    migrate.index_names = names
+    return migrate
+
+
+def _add_columns(*columns):
+    """Migration adding model columns ``(table, column)`` that an older table lacks."""
+    def migrate(conn):
+        inspector = inspect(conn)
+        for table_name, name in columns:
+            if name in {c["name"] for c in inspector.get_columns(table_name)}:
+                continue  # قاعدة جديدة: create_all أنشأ العمود بالفعل
+            column = db.metadata.tables[table_name].c[name]
+            ddl = f"ALTER TABLE {table_name} ADD COLUMN {name} {column.type.compile(conn.dialect)}"
+            for fk in column.foreign_keys:
+                ddl += f" REFERENCES {fk.column.table.name}({fk.column.name})"
+            conn.execute(text(ddl))
+    return migrate
+
+
+def _link_sales_to_shifts(conn):
+    _add_columns(("sales", "shift_id"), ("returns", "shift_id"))(conn)
+    _create_indexes("ix_sales_shift_id", "ix_returns_shift_id")(conn)
+    # المبيعات القديمة: شيفت نفس الكاشير الذي يغطي وقت الفاتورة
+    covering = (
+        db.select(Shift.id)
+        .where(
+            Shift.cashier_name == Sale.cashier,
+            Shift.start_time <= Sale.created_at,
+            db.or_(Shift.end_time.is_(None), Shift.end_time >= Sale.created_at),
+        )
+        .order_by(Shift.start_time.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    conn.execute(db.update(Sale).where(Sale.shift_id.is_(None)).values(shift_id=covering))
+    rebuild_shift_totals(conn)
+
+
+def _index_customers(conn):
+    _add_columns(("customers", "name_key"), ("customers", "phone_key"))(conn)
+    _create_indexes("ix_customers_name_key_id", "ix_customers_phone_key", "ix_sales_customer_id")(conn)
+    reindex_customers(conn)
+
+
+def _collate_customer_keys(conn):
+    # SQLite يقارن النصوص بالبايتات أصلًا؛ PostgreSQL وMySQL يتبعان ترتيب لغة القاعدة
+    alter = {
+        "postgresql": "ALTER TABLE customers ALTER COLUMN {name} TYPE {type}",
+        "mysql": "ALTER TABLE customers MODIFY {name} {type}",
+    }.get(conn.dialect.name)
+    if alter is None:
+        return
+    for name in ("name_key", "phone_key"):
+        column = Customer.__table__.c[name]
+        conn.execute(text(alter.format(name=name, type=column.type.compile(conn.dialect))))
+
+
+MIGRATIONS = [
+    ("0001_query_indexes", _create_indexes(
+        "ix_sale_items_sale_id",
+        "ix_sales_created_at",
+        "ix_inventory_log_product_id",
+        "ix_inventory_log_created_at",
+        "ix_supplier_invoices_supplier_id",
+        "ix_supplier_invoices_created_at",
+        "ix_supplier_invoice_items_invoice_id",
+        "ix_returns_created_at",
+        "ix_return_items_return_id",
+        "ix_shifts_start_time",
+        "ix_shifts_end_time",
+        "ix_customers_name_id",
+        "ix_customers_total_id",
+        "ix_products_name_id",
+        "ix_products_price_id",
+        "ix_products_stock_qty_id",
+    )),
+    # المخزون الموجود قبل دفتر الحركات يدخل كرصيد افتتاحي
+    ("0002_inventory_opening_balance", lambda conn: close_gaps(conn, OPENING_NOTE)),
+    ("0003_stock_alerts", rebuild_alerts),
+    ("0004_shift_links", _link_sales_to_shifts),
+    ("0005_customer_keys", _index_customers),
+    ("0006_catalog_counter", seed_catalog_counter),
+    ("0007_customer_key_collation", _collate_customer_keys),
+    # ملخصات التقارير للمبيعات السابقة لها
+    ("0008_sales_rollups", backfill_rollups),
+]
+
+
+def pending():
+    applied = set(db.session.execute(db.select(SchemaMigration.id)).scalars())
+    return [(mid, fn) for mid, fn in MIGRATIONS if mid not in applied]
+
+
+def upgrade():
+    """Create missing tables, then apply pending migrations; return their ids."""
+    db.create_all()
+    done = []
+    for mid, migrate in pending():
+        try:
+            with db.engine.begin() as conn:
+                migrate(conn)
+                conn.execute(db.insert(SchemaMigration).values(id=mid))
+        except IntegrityError:
+            continue  # عامل آخر طبّقها في نفس اللحظة
+        done.append(mid)
+    db.session.remove()
+    return done
+
+
+def seed_admin():
+    """Create the default ``admin`` user on an empty users table; return whether it did."""
+    from . import bcrypt
+
+    if db.session.execute(db.select(User.id).limit(1)).first():
+        return False
+    db.session.add(User(
+        username="admin",
+        role="admin",
+        password_hash=bcrypt.generate_password_hash("admin123").decode("utf-8"),
+    ))
+    db.session.commit()
+    return True
+
+
+def initialize():
+    """``upgrade`` plus the default admin; return the applied migration ids."""
+    done = upgrade()
+    seed_admin()
+    return done
+
+
+@click.group("db")
+def db_cli():
+    """Database schema management."""
+
+
+@db_cli.command("init")
+@with_appcontext
+def init_command():
+    """Create tables, apply migrations and add the default admin (run on every deploy)."""
+    done = upgrade()
+    click.echo("applied: " + (", ".join(done) if done else "nothing, schema is up to date"))
+    if seed_admin():
+        click.echo("created user admin")
+
+
+@db_cli.command("upgrade")
+@with_appcontext
+def upgrade_command():
+    """Create tables and apply pending migrations."""
+    done = upgrade()
+    click.echo("applied: " + (", ".join(done) if done else "nothing, schema is up to date"))
+
+
+@db_cli.command("status")
+@with_appcontext
+def status_command():
+    """List migrations that have not been applied yet."""
+    waiting = [mid for mid, _ in pending()]
+    click.echo("pending: " + (", ".join(waiting) if waiting else "none"))
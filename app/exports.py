@@ -0,0 +1,128 @@
+"""Dataset definitions for the streaming CSV/XLSX exports.
+
+Each dataset is a column-only ``select`` read with ``yield_per`` so rows are
+fetched from a server-side cursor in chunks and never materialised as ORM
+objects; memory stays flat whatever the table size.
+"""
+from datetime import datetime, timedelta
+
+from .models import (
+    db,
+    Customer,
+    InventoryLog,
+    Product,
+    Sale,
+    SaleItem,
+    Supplier,
+    SupplierInvoice,
+    SupplierInvoiceItem,
+)
+
+YIELD_PER = 1000
+
+
+def _customers():
+    header = ["id", "name", "phone", "total_purchases"]
+    stmt = db.select(
+        Customer.id,
+        Customer.name,
+        Customer.phone,
+        db.func.coalesce(Customer.total_purchases, 0.0),
+    ).order_by(Customer.name.asc(), Customer.id.asc())
+    return header, stmt, None
+
+
+def _sales():
+    header = ["sale_id", "created_at", "cashier", "customer", "total", "discount", "tax",
+              "net_total", "product_id", "product_name", "qty", "price", "line_total"]
+    stmt = (
+        db.select(
+            Sale.id, Sale.created_at, Sale.cashier, Customer.name, Sale.total, Sale.discount,
+            Sale.tax, Sale.net_total, SaleItem.product_id, SaleItem.product_name,
+            SaleItem.qty, SaleItem.price, SaleItem.total,
+        )
+        .outerjoin(Customer, Customer.id == Sale.customer_id)
+        .outerjoin(SaleItem, SaleItem.sale_id == Sale.id)
+        .order_by(Sale.id.asc(), SaleItem.id.asc())
+    )
+    return header, stmt, Sale.created_at
+
+
+def _inventory():
+    header = ["id", "name", "barcode", "price", "stock_qty", "min_stock_alert", "stock_value"]
+    stmt = db.select(
+        Product.id, Product.name, Product.barcode, Product.price, Product.stock_qty,
+        Product.min_stock_alert, Product.price * Product.stock_qty,
+    ).order_by(Product.id.asc())
+    return header, stmt, None
+
+
+def _inventory_log():
+    header = ["id", "created_at", "product_id", "product_name", "change_qty", "note"]
+    stmt = (
+        db.select(
+            InventoryLog.id, InventoryLog.created_at, InventoryLog.product_id, Product.name,
+            InventoryLog.change_qty, InventoryLog.note,
+        )
+        .outerjoin(Product, Product.id == InventoryLog.product_id)
+        .order_by(InventoryLog.id.asc())
+    )
+    return header, stmt, InventoryLog.created_at
+
+
+def _supplier_invoices():
+    header = ["invoice_id", "created_at", "supplier", "total", "paid", "remaining",
+              "product_id", "product_name", "qty", "cost", "line_total"]
+    stmt = (
+        db.select(
+            SupplierInvoice.id, SupplierInvoice.created_at, Supplier.name, SupplierInvoice.total,
+            SupplierInvoice.paid, SupplierInvoice.remaining, SupplierInvoiceItem.product_id,
+            SupplierInvoiceItem.product_name, SupplierInvoiceItem.qty, SupplierInvoiceItem.cost,
+            SupplierInvoiceItem.total,
+        )
+        .outerjoin(Supplier, Supplier.id == SupplierInvoice.supplier_id)
+        .outerjoin(SupplierInvoiceItem, SupplierInvoiceItem.invoice_id == SupplierInvoice.id)
+        .order_by(SupplierInvoice.id.asc(), SupplierInvoiceItem.id.asc())
+    )
+    return header, stmt, SupplierInvoice.created_at
+
+
+DATASETS = {
+    "customers": _customers,
+    "sales": _sales,
+    "inventory": _inventory,
+    "inventory_log": _inventory_log,
+    "supplier_invoices": _supplier_invoices,
+}
+
+
+def parse_day(value):
+    """Parse a ``YYYY-MM-DD`` query argument, ignoring bad input."""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d") if value else None
+    except ValueError:
+        return None
+
+
+def export_rows(name, start=None, end=None):
+    """Return ``(header, rows)`` for dataset ``name``; ``rows`` is lazy.
+
+    ``start``/``end`` are inclusive days applied to the dataset's date
+    column; they are ignored for snapshot datasets (customers, inventory).
+    """
+    header, stmt, date_col = DATASETS[name]()
+    if date_col is not None:
+        if start:
+            stmt = stmt.where(date_col >= start)
+        if end:
+            stmt = stmt.where(date_col < end + timedelta(days=1))
+
+    def rows():
+        result = db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+        try:
+            for partition in result.partitions():
+                yield from (tuple(row) for row in partition)
+        finally:
+            result.close()
+
+    return header, rows()
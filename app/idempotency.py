@@ -0,0 +1,94 @@
+"""Idempotency keys for sale submissions.
+
+A till sends the same key every time it retries a sale: the
+``Idempotency-Key`` header on ``/api/sale`` or the ``client_id`` of a
+queued offline sale. The key is inserted in the sale's own transaction under
+a primary key, so a repeat either finds the stored sale id up front or loses
+the insert race, rolls back and reads the winner's id. Keys older than
+``SALE_KEY_TTL_HOURS`` are deleted in bounded batches.
+"""
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.exc import SQLAlchemyError
+
+from .models import db, SaleKey
+
+MAX_KEY_LENGTH = SaleKey.__table__.c.key.type.length
+PURGE_INTERVAL = 60
+
+_last_purge = 0.0
+
+
+def find(keys):
+    """Map each already-used key in ``keys`` to its sale id."""
+    keys = [k for k in keys if k]
+    if not keys:
+        return {}
+    return dict(
+        db.session.query(SaleKey.key, SaleKey.sale_id).filter(SaleKey.key.in_(keys)).all()
+    )
+
+
+def remember(sale_ids):
+    """Stage ``{key: sale_id}`` rows; a reused key fails the transaction."""
+    if sale_ids:
+        db.session.execute(
+            db.insert(SaleKey), [{"key": k, "sale_id": sid} for k, sid in sale_ids.items()]
+        )
+
+
+def purge_expired(batch=None):
+    """Delete up to ``batch`` expired keys, oldest first; return the count."""
+    batch = batch or current_app.config["SALE_KEY_PURGE_BATCH"]
+    cutoff = datetime.utcnow() - timedelta(hours=current_app.config["SALE_KEY_TTL_HOURS"])
+    stale = (
+        db.select(SaleKey.key)
+        .where(SaleKey.created_at < cutoff)
+        .order_by(SaleKey.created_at)
+        .limit(batch)
+    )
+    if db.session.get_bind().dialect.name == "mysql":
+        # MySQL لا يقبل LIMIT داخل IN (subquery)؛ نقرأ المفاتيح أولًا
+        stale = db.session.execute(stale).scalars().all()
+    deleted = db.session.execute(
+        db.delete(SaleKey).where(SaleKey.key.in_(stale)).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return deleted
+
+
+def maybe_purge():
+    """Run one bounded purge at most every ``PURGE_INTERVAL`` seconds per process."""
+    global _last_purge
+    now = time.monotonic()
+    if now - _last_purge < PURGE_INTERVAL:
+        return
+    _last_purge = now
+    try:
+        purge_expired()
+    except SQLAlchemyError:
+        db.session.rollback()
+        current_app.logger.exception("purging expired sale keys failed")
+
+
+@click.group("sales")
+def sales_cli():
+    """Sale maintenance."""
+
+
+@sales_cli.command("purge-keys")
+@with_appcontext
+def purge_keys_command():
+    """Delete all expired idempotency keys, one batch at a time."""
+    total = 0
+    batch = current_app.config["SALE_KEY_PURGE_BATCH"]
+    while True:
+        deleted = purge_expired(batch)
+        total += deleted
+        if deleted < batch:
+            break
+    click.echo(f"deleted keys: {total}")
@@ -0,0 +1,384 @@
+"""Bulk product import from CSV/XLSX files.
+
+Rows are streamed from the file, validated one by one and written in chunks
+of ``IMPORT_CHUNK_SIZE``: one ``IN`` query finds which barcodes already
+exist and locks those rows (``FOR UPDATE``) so the ledger delta is taken
+from the stock a concurrent sale cannot change underneath it, then a single
+executemany ``UPDATE`` and ``INSERT`` per chunk. Rows
+without a barcode get codes from ``barcode_allocator.allocate`` and their
+SVGs are rendered afterwards by a background job.
+
+Web uploads run as a ``products.import`` background job (see
+``app.tasks``): the counters and errors of ``ImportJob`` are stored in the
+job's result after every chunk, so any worker can serve the status page.
+"""
+import csv
+import math
+import os
+import time
+import zipfile
+from itertools import islice
+from xml.etree.ElementTree import iterparse
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import alerts, barcode_allocator, catalog, jobs, ledger, product_index
+from .models import db, Product
+from .utils.stock import run_transaction
+
+MAX_ERRORS = 1000
+
+# أسماء الأعمدة المقبولة (نفس رؤوس تصدير المخزون + العربية)
+HEADERS = {
+    "name": ("name", "الاسم", "اسم المنتج"),
+    "barcode": ("barcode", "الباركود", "باركود"),
+    "price": ("price", "السعر"),
+    "stock_qty": ("stock_qty", "stock", "المخزون", "الكمية"),
+    "min_stock_alert": ("min_stock_alert", "حد التنبيه"),
+}
+_ALIASES = {alias: field for field, names in HEADERS.items() for alias in names}
+_NAME_MAX = Product.__table__.c.name.type.length
+_BARCODE_MAX = Product.__table__.c.barcode.type.length
+
+
+class ImportFileError(ValueError):
+    """The file as a whole cannot be imported (bad format or header)."""
+
+
+# ---------------------------------------------------------------- readers
+
+def _csv_rows(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        yield from csv.reader(f)
+
+
+_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+
+def _column_index(ref):
+    col = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        col = col * 26 + ord(ch.upper()) - 64
+    return col - 1
+
+
+def _first_sheet(zf):
+    """Path of the first worksheet, following workbook relationships."""
+    try:
+        with zf.open("xl/workbook.xml") as f:
+            sheet = next(el for _, el in iterparse(f) if el.tag == f"{_NS}sheet")
+        rid = sheet.get(f"{_REL_NS}id")
+        with zf.open("xl/_rels/workbook.xml.rels") as f:
+            for _, el in iterparse(f):
+                if el.get("Id") == rid:
+                    target = el.get("Target").lstrip("/")
+                    return target if target.startswith("xl/") else f"xl/{target}"
+    except (KeyError, StopIteration):
+        pass
+    return "xl/worksheets/sheet1.xml"
+
+
+def _xlsx_rows(path):
+    """Yield the first sheet's rows as lists of strings, parsing incrementally."""
+    try:
+        zf = zipfile.ZipFile(path)
+    except zipfile.BadZipFile:
+        raise ImportFileError("ملف XLSX غير صالح")
+    with zf:
+        shared = []
+        if "xl/sharedStrings.xml" in zf.namelist():
+            with zf.open("xl/sharedStrings.xml") as f:
+                for _, el in iterparse(f):
+                    if el.tag == f"{_NS}si":
+                        shared.append("".join(t.text or "" for t in el.iter(f"{_NS}t")))
+                        el.clear()
+        with zf.open(_first_sheet(zf)) as f:
+            line = 0
+            for _, el in iterparse(f):
+                if el.tag != f"{_NS}row":
+                    continue
+                # Excel يحذف الصفوف الفارغة؛ نعيدها حتى تبقى أرقام الأسطر صحيحة
+                row_num = int(el.get("r", line + 1))
+                while line + 1 < row_num:
+                    line += 1
+                    yield []
+                line = row_num
+                values = []
+                for cell in el.iter(f"{_NS}c"):
+                    idx = _column_index(cell.get("r", "")) if cell.get("r") else len(values)
+                    kind = cell.get("t")
+                    if kind == "inlineStr":
+                        text = "".join(t.text or "" for t in cell.iter(f"{_NS}t"))
+                    else:
+                        v = cell.find(f"{_NS}v")
+                        text = v.text if v is not None and v.text else ""
+                        if kind == "s" and text:
+                            text = shared[int(text)]
+                    values.extend([""] * (idx - len(values)))
+                    values.append(text)
+                el.clear()
+                yield values
+
+
+def read_rows(path):
+    """Yield raw rows from a ``.csv`` or ``.xlsx`` file."""
+    if path.lower().endswith(".xlsx"):
+        return _xlsx_rows(path)
+    return _csv_rows(path)
+
+
+# ------------------------------------------------------------- validation
+
+def _number(value, cast, label):
+    value = value.strip()
+    if value.endswith(".0") and cast is int:
+        value = value[:-2]
+    try:
+        number = cast(value)
+    except ValueError:
+        raise ValueError(f"{label} غير صالح: {value}")
+    if not math.isfinite(number):
+        raise ValueError(f"{label} غير صالح: {value}")
+    if number < 0:
+        raise ValueError(f"{label} لا يمكن أن يكون سالبًا")
+    return number
+
+
+def _map_header(header):
+    columns = {}
+    for i, title in enumerate(header):
+        field = _ALIASES.get(title.strip().lower())
+        if field and field not in columns:
+            columns[field] = i
+    missing = [f for f in ("name", "price") if f not in columns]
+    if missing:
+        raise ImportFileError("أعمدة ناقصة في الملف: " + ", ".join(missing))
+    return columns
+
+
+def parse_row(raw, columns):
+    """Validate one raw row; return a product dict or raise ``ValueError``.
+
+    Empty optional cells come back as ``None`` so updates leave them alone.
+    """
+    def cell(field):
+        i = columns.get(field)
+        return raw[i].strip() if i is not None and i < len(raw) else ""
+
+    name = cell("name")
+    if not name:
+        raise ValueError("الاسم مطلوب")
+    if len(name) > _NAME_MAX:
+        raise ValueError(f"الاسم أطول من {_NAME_MAX} حرفًا")
+    if not cell("price"):
+        raise ValueError("السعر مطلوب")
+    barcode = cell("barcode")
+    if barcode.endswith(".0") and barcode[:-2].isdigit():
+        barcode = barcode[:-2]  # أرقام Excel
+    if len(barcode) > _BARCODE_MAX:
+        raise ValueError("الباركود طويل جدًا")
+    return {
+        "name": name,
+        "barcode": barcode or None,
+        "price": _number(cell("price"), float, "السعر"),
+        "stock_qty": _number(cell("stock_qty"), int, "المخزون") if cell("stock_qty") else None,
+        "min_stock_alert": (
+            _number(cell("min_stock_alert"), int, "حد التنبيه") if cell("min_stock_alert") else None
+        ),
+    }
+
+
+# ----------------------------------------------------------------- writer
+
+class ImportJob:
+    """Progress and outcome of one import."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.status = "queued"
+        self.rows = self.inserted = self.updated = self.failed = 0
+        self.errors = []
+        self.message = ""
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "filename": self.filename,
+            "status": self.status,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+            "message": self.message,
+            "rows_per_sec": round(self.rows / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+def _write_chunk(chunk, job, new_codes):
+    """Upsert a chunk of ``(line, product)`` pairs by barcode."""
+    missing = [p for _, p in chunk if not p["barcode"]]
+    if missing:
+        # حجز الأكواد قبل فتح معاملة الكتابة (SQLite يسمح بكاتب واحد)
+        for product, code in zip(missing, barcode_allocator.allocate(len(missing))):
+            product["barcode"] = code
+    # كود محجوز قد يطابق باركودًا مكتوبًا في نفس الدفعة؛ نُبقي أول صف فقط
+    unique = {}
+    for line, product in chunk:
+        if product["barcode"] in unique:
+            job.error(line, "باركود مكرر في الملف")
+        else:
+            unique[product["barcode"]] = product
+    products = list(unique.values())
+
+    def write():
+        # قفل الصفوف حتى لا يضيع بيع متزامن بين قراءة الرصيد وكتابته
+        existing, stock = {}, {}
+        for barcode, pid, qty in db.session.execute(
+            db.select(Product.barcode, Product.id, Product.stock_qty)
+            .where(Product.barcode.in_(unique))
+            .order_by(Product.id)
+            .with_for_update()
+        ).all():
+            existing[barcode] = pid
+            stock[pid] = qty
+
+        inserts, updates, changes = [], [], {}
+        for product in products:
+            pid = existing.get(product["barcode"])
+            if pid is not None and product["stock_qty"] is not None:
+                changes[pid] = product["stock_qty"] - stock[pid]
+            if pid is None:
+                inserts.append({
+                    **product,
+                    "stock_qty": product["stock_qty"] or 0,
+                    "min_stock_alert": product["min_stock_alert"] or 0,
+                })
+            else:
+                updates.append({"id": pid, **{k: v for k, v in product.items() if v is not None}})
+
+        if updates:
+            db.session.execute(db.update(Product), updates)
+        if inserts:
+            db.session.execute(db.insert(Product), inserts)
+            existing.update(
+                db.session.execute(
+                    db.select(Product.barcode, Product.id).where(
+                        Product.barcode.in_([p["barcode"] for p in inserts])
+                    )
+                ).all()
+            )
+            for product in inserts:
+                changes[existing[product["barcode"]]] = product["stock_qty"]
+        ledger.record(changes, f"استيراد {job.filename}")
+        catalog.touch(existing.values())
+        alerts.refresh(existing.values())
+        return len(inserts), len(updates)
+
+    try:
+        inserted, updated = run_transaction(write)
+    except SQLAlchemyError as exc:
+        for line, product in chunk:
+            if unique.get(product["barcode"]) is product:
+                job.error(line, f"تعذر حفظ الدفعة: {exc.__class__.__name__}")
+        return
+    job.inserted += inserted
+    job.updated += updated
+    new_codes.extend(p["barcode"] for p in missing if unique.get(p["barcode"]) is p)
+
+
+def import_products(path, job=None, chunk_size=None, progress=None):
+    """Import products from ``path`` and return the finished ``ImportJob``.
+
+    Must run inside an app context. Existing products (matched by barcode)
+    are updated with the non-empty cells of their row; new products are
+    inserted, with a fresh barcode when the row has none. ``progress`` is
+    called with ``job.to_dict()`` after every chunk.
+    """
+    job = job or ImportJob(os.path.basename(path))
+    chunk_size = chunk_size or current_app.config.get("IMPORT_CHUNK_SIZE", 1000)
+    job.status = "running"
+    if progress:
+        progress(job.to_dict())
+    new_codes = []
+    try:
+        rows = read_rows(path)
+        header = next(rows, None)
+        if header is None:
+            raise ImportFileError("الملف فارغ")
+        columns = _map_header(header)
+
+        seen = set()
+        numbered = enumerate(rows, 2)
+        while True:
+            batch = list(islice(numbered, chunk_size))
+            if not batch:
+                break
+            chunk = []
+            for line, raw in batch:
+                if not any(v.strip() for v in raw):
+                    continue
+                job.rows += 1
+                try:
+                    product = parse_row(raw, columns)
+                except ValueError as exc:
+                    job.error(line, str(exc))
+                    continue
+                if product["barcode"]:
+                    if product["barcode"] in seen:
+                        job.error(line, "باركود مكرر في الملف")
+                        continue
+                    seen.add(product["barcode"])
+                chunk.append((line, product))
+            if chunk:
+                _write_chunk(chunk, job, new_codes)
+            if progress:
+                progress(job.to_dict())
+    except (ImportFileError, UnicodeDecodeError, csv.Error) as exc:
+        db.session.rollback()
+        job.status = "failed"
+        job.message = str(exc) if isinstance(exc, ImportFileError) else "تعذر قراءة الملف"
+    else:
+        job.status = "done"
+    finally:
+        job.finished_at = time.time()
+        if job.inserted or job.updated:
+            product_index.invalidate()
+        if new_codes:
+            jobs.enqueue("barcodes.render", codes=new_codes)
+    return job
+
+
+@click.group("products")
+def products_cli():
+    """Bulk product maintenance."""
+
+
+@products_cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--chunk-size", type=int, default=None, help="Rows per write batch.")
+@with_appcontext
+def import_command(path, chunk_size):
+    """Import products from a CSV or XLSX file."""
+    job = import_products(path, chunk_size=chunk_size)
+    summary = job.to_dict()
+    for err in job.errors:
+        click.echo(f"line {err['line']}: {err['error']}", err=True)
+    if job.status == "failed":
+        raise click.ClickException(job.message)
+    click.echo(f"rows: {summary['rows']}, inserted: {summary['inserted']}, "
+               f"updated: {summary['updated']}, failed: {summary['failed']} "
+               f"({summary['rows_per_sec']} rows/s)")
@@ -0,0 +1,207 @@
+"""Inventory ledger: every stock movement as a row in ``inventory_log``.
+
+Each write that changes ``stock_qty`` calls ``record`` in the same
+transaction with the signed quantities it applied, so the sum of a product's
+log rows always equals its stock. ``flask inventory snapshot`` (run it from
+cron, e.g. nightly) stores the running balance of every product that moved
+since its previous snapshot. ``stock_at`` then starts from the newest
+snapshot before the requested time and adds only the log rows written after
+that snapshot run, instead of summing the whole history.
+"""
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .models import db, InventoryLog, InventorySnapshot, Product
+
+OPENING_NOTE = "رصيد افتتاحي"
+ADJUSTMENT_NOTE = "تسوية جرد"
+
+
+def record(changes, note):
+    """Stage one log row per product for ``{product_id: signed qty}``."""
+    rows = [
+        {"product_id": pid, "change_qty": qty, "note": note}
+        for pid, qty in changes.items()
+        if pid and qty
+    ]
+    if rows:
+        db.session.execute(db.insert(InventoryLog), rows)
+
+
+def forget(product_id):
+    """Stage deleting a product's log rows and snapshots (call before deleting the product).
+
+    A deleted product leaves no ledger behind: its history goes with it, so
+    ``stock_at`` and ``movement`` simply stop listing it.
+    """
+    db.session.execute(db.delete(InventoryLog).where(InventoryLog.product_id == product_id))
+    db.session.execute(db.delete(InventorySnapshot).where(InventorySnapshot.product_id == product_id))
+
+
+def balance_gaps():
+    """Select ``(product_id, gap)`` for products whose log does not add up to their stock."""
+    logged = (
+        db.select(InventoryLog.product_id, db.func.sum(InventoryLog.change_qty).label("qty"))
+        .group_by(InventoryLog.product_id)
+        .subquery()
+    )
+    gap = Product.stock_qty - db.func.coalesce(logged.c.qty, 0)
+    return (
+        db.select(Product.id, gap.label("gap"))
+        .outerjoin(logged, logged.c.product_id == Product.id)
+        .where(gap != 0)
+    )
+
+
+def close_gaps(conn, note):
+    """Insert a log row for every balance gap; return how many were written."""
+    gaps = balance_gaps().subquery()
+    return conn.execute(
+        db.insert(InventoryLog).from_select(
+            ["product_id", "change_qty", "note", "created_at"],
+            db.select(gaps.c.id, gaps.c.gap, db.literal(note), db.literal(datetime.utcnow())),
+        )
+    ).rowcount
+
+
+def _latest(when=None):
+    """Newest snapshot row per product, taken at or before ``when``."""
+    newest = db.select(
+        InventorySnapshot.product_id, db.func.max(InventorySnapshot.log_id).label("log_id")
+    ).group_by(InventorySnapshot.product_id)
+    if when is not None:
+        newest = newest.where(InventorySnapshot.taken_at <= when)
+    newest = newest.subquery()
+    return (
+        db.select(InventorySnapshot.product_id, InventorySnapshot.log_id, InventorySnapshot.qty)
+        .join(
+            newest,
+            (InventorySnapshot.product_id == newest.c.product_id)
+            & (InventorySnapshot.log_id == newest.c.log_id),
+        )
+        .subquery()
+    )
+
+
+def take_snapshot(now=None):
+    """Snapshot every product that moved since its last snapshot; return the row count.
+
+    Only log rows older than ``INVENTORY_SNAPSHOT_LAG`` seconds are folded
+    in, so a transaction still in flight when the snapshot runs is never
+    skipped over.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=current_app.config["INVENTORY_SNAPSHOT_LAG"])
+    upto = db.session.execute(
+        db.select(db.func.max(InventoryLog.id)).where(InventoryLog.created_at <= cutoff)
+    ).scalar()
+    done = db.session.execute(db.select(db.func.max(InventorySnapshot.log_id))).scalar() or 0
+    if upto is None or upto <= done:
+        return 0
+    last = _latest()
+    moved = (
+        db.select(
+            InventoryLog.product_id,
+            db.literal(upto),
+            db.func.coalesce(last.c.qty, 0) + db.func.sum(InventoryLog.change_qty),
+            db.literal(cutoff),
+        )
+        .outerjoin(last, last.c.product_id == InventoryLog.product_id)
+        .where(InventoryLog.id > done, InventoryLog.id <= upto)
+        .group_by(InventoryLog.product_id, last.c.qty)
+    )
+    count = db.session.execute(
+        db.insert(InventorySnapshot).from_select(["product_id", "log_id", "qty", "taken_at"], moved)
+    ).rowcount
+    db.session.commit()
+    return count
+
+
+def stock_at(when, product_ids=None):
+    """Return ``{product_id: qty}`` as it stood at ``when``.
+
+    Every snapshot run covers all products that moved since the previous
+    run, so past the newest run at or before ``when`` only the log rows
+    written after it need to be added.
+    """
+    base = _latest(when)
+    start = db.session.execute(
+        db.select(db.func.max(InventorySnapshot.log_id)).where(InventorySnapshot.taken_at <= when)
+    ).scalar() or 0
+    opening = db.select(base.c.product_id, base.c.qty)
+    tail = (
+        db.select(InventoryLog.product_id, db.func.sum(InventoryLog.change_qty))
+        .where(InventoryLog.id > start, InventoryLog.created_at <= when)
+        .group_by(InventoryLog.product_id)
+    )
+    if product_ids is not None:
+        opening = opening.where(base.c.product_id.in_(product_ids))
+        tail = tail.where(InventoryLog.product_id.in_(product_ids))
+    stock = dict(db.session.execute(opening).all())
+    for pid, qty in db.session.execute(tail).all():
+        stock[pid] = stock.get(pid, 0) + qty
+    return stock
+
+
+def movement(start, end, product_ids=None):
+    """Return ``{product_id: {opening, received, issued, closing}}`` between two times.
+
+    Opening and closing balances come from ``stock_at``; the totals in
+    between are one aggregate over the period's log rows only.
+    """
+    flows = (
+        db.select(
+            InventoryLog.product_id,
+            db.func.sum(db.case((InventoryLog.change_qty > 0, InventoryLog.change_qty), else_=0)),
+            db.func.sum(db.case((InventoryLog.change_qty < 0, -InventoryLog.change_qty), else_=0)),
+        )
+        .where(InventoryLog.created_at > start, InventoryLog.created_at <= end)
+        .group_by(InventoryLog.product_id)
+    )
+    if product_ids is not None:
+        flows = flows.where(InventoryLog.product_id.in_(product_ids))
+    flows = db.session.execute(flows).all()
+    if not flows:
+        return {}
+    moved = [pid for pid, _, _ in flows]
+    opening = stock_at(start, moved)
+    closing = stock_at(end, moved)
+    return {
+        pid: {
+            "opening": opening.get(pid, 0),
+            "received": received,
+            "issued": issued,
+            "closing": closing.get(pid, 0),
+        }
+        for pid, received, issued in flows
+    }
+
+
+@click.group("inventory")
+def inventory_cli():
+    """Inventory ledger maintenance."""
+
+
+@inventory_cli.command("snapshot")
+@with_appcontext
+def snapshot_command():
+    """Store the current balance of every product that moved since the last snapshot."""
+    click.echo(f"snapshot rows: {take_snapshot()}")
+
+
+@inventory_cli.command("check")
+@click.option("--fix", is_flag=True, help="Record the differences as adjustment rows.")
+@with_appcontext
+def check_command(fix):
+    """List products whose stock differs from the sum of their ledger rows."""
+    gaps = db.session.execute(balance_gaps().order_by(Product.id)).all()
+    for pid, gap in gaps:
+        click.echo(f"product {pid}: stock - ledger = {gap}")
+    if fix and gaps:
+        with db.engine.begin() as conn:
+            click.echo(f"adjusted: {close_gaps(conn, ADJUSTMENT_NOTE)}")
+    elif not gaps:
+        click.echo("ledger matches stock")
@@ -1,11 +1,13 @@
 from datetime import datetime
-from . import db, login_manager
+from . import db, login_manager, user_cache
 from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.dialects.mysql import LONGBLOB
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id), lambda uid: db.session.get(User, uid))
 
 
 class User(UserMixin, db.Model):
@@ -16,6 +18,12 @@ class User(UserMixin, db.Model):
     role = db.Column(db.String(20), nullable=False, default="cashier")
 
 
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _forget_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+
 class Product(db.Model):
     __tablename__ = "products"
     id = db.Column(db.Integer, primary_key=True)
@@ -25,14 +33,21 @@ class Product(db.Model):
     min_stock_alert = db.Column(db.Integer, nullable=False, default=0)
     barcode = db.Column(db.String(32), unique=True, nullable=False)
 
+    # فهارس الترتيب في صفحات المنتجات (keyset)
+    __table_args__ = (
+        db.Index("ix_products_name_id", "name", "id"),
+        db.Index("ix_products_price_id", "price", "id"),
+        db.Index("ix_products_stock_qty_id", "stock_qty", "id"),
+    )
+
 
 class InventoryLog(db.Model):
     __tablename__ = "inventory_log"
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False, index=True)
     change_qty = db.Column(db.Integer, nullable=False)
     note = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 
 class Customer(db.Model):
@@ -41,6 +56,25 @@ class Customer(db.Model):
     name = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(30))
     total_purchases = db.Column(db.Float, default=0)
+    # الاسم والهاتف بعد التوحيد (customers.py) للبحث وربط الفواتير بالعميل؛
+    # ترتيب بنقاط الكود لمقارنات البادئة ("C" / utf8mb4_bin، وBINARY أصلًا في SQLite)
+    name_key = db.Column(
+        db.String(120)
+        .with_variant(db.String(120, collation="C"), "postgresql")
+        .with_variant(db.String(120, collation="utf8mb4_bin"), "mysql")
+    )
+    phone_key = db.Column(
+        db.String(30)
+        .with_variant(db.String(30, collation="C"), "postgresql")
+        .with_variant(db.String(30, collation="utf8mb4_bin"), "mysql")
+    )
+
+    __table_args__ = (
+        db.Index("ix_customers_name_id", "name", "id"),  # الترتيب بالاسم
+        db.Index("ix_customers_total_id", db.func.coalesce(total_purchases, 0), "id"),
+        db.Index("ix_customers_name_key_id", "name_key", "id"),
+        db.Index("ix_customers_phone_key", "phone_key"),
+    )
 
 
 class Supplier(db.Model):
@@ -54,29 +88,35 @@ class Supplier(db.Model):
 class Sale(db.Model):
     __tablename__ = "sales"
     id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey("customers.id"))
+    customer_id = db.Column(db.Integer, db.ForeignKey("customers.id"), index=True)
     total = db.Column(db.Float, default=0)
     discount = db.Column(db.Float, default=0)
     tax = db.Column(db.Float, default=0)
     net_total = db.Column(db.Float, default=0)
     cashier = db.Column(db.String(80))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    shift_id = db.Column(db.Integer, db.ForeignKey("shifts.id"), index=True)  # الشيفت المفتوح وقت البيع
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # كل صفحة تحدد طريقة التحميل (joinedload/selectinload) بدل استعلام لكل صف
+    customer = db.relationship("Customer")
+    items = db.relationship("SaleItem", order_by="SaleItem.id")
 
 
 class SupplierInvoice(db.Model):
     __tablename__ = "supplier_invoices"
     id = db.Column(db.Integer, primary_key=True)
-    supplier_id = db.Column(db.Integer, db.ForeignKey("suppliers.id"), nullable=False)
+    supplier_id = db.Column(db.Integer, db.ForeignKey("suppliers.id"), nullable=False, index=True)
     total = db.Column(db.Float, default=0)
     paid = db.Column(db.Float, default=0)
     remaining = db.Column(db.Float, default=0)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    supplier = db.relationship("Supplier")
+    items = db.relationship("SupplierInvoiceItem", order_by="SupplierInvoiceItem.id")
 
 
 class SupplierInvoiceItem(db.Model):
     __tablename__ = "supplier_invoice_items"
     id = db.Column(db.Integer, primary_key=True)
-    invoice_id = db.Column(db.Integer, db.ForeignKey("supplier_invoices.id"), nullable=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey("supplier_invoices.id"), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey("products.id"))
     product_name = db.Column(db.String(120), nullable=False)
     qty = db.Column(db.Integer, nullable=False)
@@ -87,7 +127,7 @@ class SupplierInvoiceItem(db.Model):
 class SaleItem(db.Model):
     __tablename__ = "sale_items"
     id = db.Column(db.Integer, primary_key=True)
-    sale_id = db.Column(db.Integer, db.ForeignKey("sales.id"), nullable=False)
+    sale_id = db.Column(db.Integer, db.ForeignKey("sales.id"), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey("products.id"))
     product_name = db.Column(db.String(120), nullable=False)
     qty = db.Column(db.Integer, nullable=False)
@@ -101,13 +141,14 @@ class Return(db.Model):
     sale_id = db.Column(db.Integer, db.ForeignKey("sales.id"))
     refund_total = db.Column(db.Float, default=0)
     note = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    shift_id = db.Column(db.Integer, db.ForeignKey("shifts.id"), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 
 class ReturnItem(db.Model):
     __tablename__ = "return_items"
     id = db.Column(db.Integer, primary_key=True)
-    return_id = db.Column(db.Integer, db.ForeignKey("returns.id"), nullable=False)
+    return_id = db.Column(db.Integer, db.ForeignKey("returns.id"), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey("products.id"))
     product_name = db.Column(db.String(120), nullable=False)
     qty = db.Column(db.Integer, nullable=False)
@@ -123,8 +164,120 @@ class Shift(db.Model):
     sales_total = db.Column(db.Float, default=0)
     net_cash = db.Column(db.Float, default=0)
     diff_cash = db.Column(db.Float, default=0)
-    start_time = db.Column(db.DateTime, default=datetime.utcnow)
-    end_time = db.Column(db.DateTime)
+    start_time = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    end_time = db.Column(db.DateTime, index=True)
+    totals = db.relationship("ShiftTotals", uselist=False)
+
+
+class ShiftTotals(db.Model):
+    __tablename__ = "shift_totals"
+    # إجماليات الشيفت الجارية، تتحدث مع كل فاتورة ومرتجع
+    shift_id = db.Column(db.Integer, db.ForeignKey("shifts.id"), primary_key=True)
+    sales_count = db.Column(db.Integer, nullable=False, default=0)
+    gross_total = db.Column(db.Float, nullable=False, default=0)
+    discount_total = db.Column(db.Float, nullable=False, default=0)
+    tax_total = db.Column(db.Float, nullable=False, default=0)
+    net_total = db.Column(db.Float, nullable=False, default=0)
+    refund_total = db.Column(db.Float, nullable=False, default=0)
+
+
+class DailySales(db.Model):
+    __tablename__ = "daily_sales"
+    day = db.Column(db.Date, primary_key=True)
+    sales_count = db.Column(db.Integer, nullable=False, default=0)
+    gross_total = db.Column(db.Float, nullable=False, default=0)
+    discount_total = db.Column(db.Float, nullable=False, default=0)
+    tax_total = db.Column(db.Float, nullable=False, default=0)
+    net_total = db.Column(db.Float, nullable=False, default=0)
+    refund_total = db.Column(db.Float, nullable=False, default=0)
+
+
+class DailyProductSales(db.Model):
+    __tablename__ = "daily_product_sales"
+    day = db.Column(db.Date, primary_key=True)
+    product_name = db.Column(db.String(120), primary_key=True)
+    qty_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    qty_returned = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ProductSalesTotal(db.Model):
+    __tablename__ = "product_sales_totals"
+    product_name = db.Column(db.String(120), primary_key=True)
+    qty_sold = db.Column(db.Integer, nullable=False, default=0, index=True)
+
+
+class SaleKey(db.Model):
+    __tablename__ = "sale_keys"
+    key = db.Column(db.String(64), primary_key=True)  # مفتاح منع التكرار من الكاشير
+    sale_id = db.Column(db.Integer, db.ForeignKey("sales.id"), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class CatalogVersion(db.Model):
+    __tablename__ = "catalog_versions"
+    product_id = db.Column(db.Integer, primary_key=True)  # بدون FK: يبقى بعد حذف المنتج
+    version = db.Column(db.Integer, nullable=False, index=True)
+
+
+class InventorySnapshot(db.Model):
+    __tablename__ = "inventory_snapshots"
+    # رصيد المنتج بعد كل حركات inventory_log حتى log_id (تشمله)
+    product_id = db.Column(db.Integer, primary_key=True)  # بدون FK: يُحذف مع المنتج (ledger.forget)
+    log_id = db.Column(db.Integer, primary_key=True)
+    qty = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class StockAlert(db.Model):
+    __tablename__ = "stock_alerts"
+    # المنتجات التي وصلت للحد الأدنى فقط؛ تتحدث مع كل تغيير في المخزون
+    product_id = db.Column(db.Integer, primary_key=True)  # بدون FK: يُحذف مع المنتج
+    level = db.Column(db.String(8), nullable=False, index=True)  # low / out
+    flagged_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class BarcodeSequence(db.Model):
+    __tablename__ = "barcode_sequences"
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False)
+
+
+class Job(db.Model):
+    __tablename__ = "jobs"
+    # طابور المهام الخلفية (utils/jobs.py)؛ يبقى بعد إعادة التشغيل
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default="{}")  # JSON
+    status = db.Column(db.String(10), nullable=False, default="queued")  # queued / running / done / failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("ix_jobs_status_run_after", "status", "run_after"),  # أقدم مهمة جاهزة
+    )
+
+
+class JobUpload(db.Model):
+    __tablename__ = "job_uploads"
+    # ملف مرفوع لمهمة خلفية؛ في القاعدة حتى يقرأه عامل على أي خادم، ويُحذف بعد تنفيذها
+    id = db.Column(db.String(32), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    data = db.Column(db.LargeBinary().with_variant(LONGBLOB(), "mysql"), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class SchemaMigration(db.Model):
+    __tablename__ = "schema_migrations"
+    id = db.Column(db.String(80), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
 class Setting(db.Model):
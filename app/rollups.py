@@ -0,0 +1,329 @@
+"""Sales rollups (per day, per product, per shift) maintained inside the sale/return transactions.
+
+``reports()`` and the shift close-out read these small tables instead of
+aggregating ``sales`` and ``sale_items`` on every page view. ``flask rollups
+backfill`` rebuilds them from the raw history and ``flask rollups
+reconcile-shifts`` checks the running shift totals against it.
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, Sale, SaleItem, Return, ReturnItem, Shift, ShiftTotals, DailySales, DailyProductSales, ProductSalesTotal
+
+SHIFT_FIELDS = ["sales_count", "gross_total", "discount_total", "tax_total", "net_total", "refund_total"]
+
+
+def _upsert(model, keys, rows):
+    """Insert ``rows`` or add their non-key values onto existing rows."""
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    columns = [c for c in rows[0] if c not in keys]
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={c: getattr(model, c) + getattr(stmt.excluded, c) for c in columns},
+        )
+        db.session.execute(stmt, rows)
+        return
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+
+        stmt = insert(model)
+        stmt = stmt.on_duplicate_key_update({c: getattr(model, c) + stmt.inserted[c] for c in columns})
+        db.session.execute(stmt, rows)
+        return
+
+    for row in rows:
+        key = {k: row[k] for k in keys}
+        values = {c: getattr(model, c) + v for c, v in row.items() if c not in keys}
+        update = db.update(model).filter_by(**key).values(**values)
+        if db.session.execute(update).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(model).values(**row))
+        except IntegrityError:
+            # كاشير آخر أدخل نفس الصف بين الـ UPDATE والـ INSERT
+            db.session.execute(update)
+
+
+def _merge_lines(lines):
+    merged = {}
+    for line in lines:
+        entry = merged.setdefault(line["product_name"], {"qty": 0, "total": 0.0})
+        entry["qty"] += line["qty"]
+        entry["total"] += line.get("total", 0)
+    return merged
+
+
+def record_sale(sale, lines):
+    """Add a flushed ``sale`` and its item dicts to the rollups."""
+    day = sale.created_at.date()
+    _upsert(DailySales, ["day"], [{
+        "day": day,
+        "sales_count": 1,
+        "gross_total": sale.total or 0,
+        "discount_total": sale.discount or 0,
+        "tax_total": sale.tax or 0,
+        "net_total": sale.net_total or 0,
+        "refund_total": 0.0,
+    }])
+    merged = _merge_lines(lines)
+    _upsert(DailyProductSales, ["day", "product_name"], [
+        {"day": day, "product_name": name, "qty_sold": v["qty"], "revenue": v["total"], "qty_returned": 0}
+        for name, v in merged.items()
+    ])
+    _upsert(ProductSalesTotal, ["product_name"], [
+        {"product_name": name, "qty_sold": v["qty"]} for name, v in merged.items()
+    ])
+    if sale.shift_id:
+        _upsert(ShiftTotals, ["shift_id"], [{
+            "shift_id": sale.shift_id,
+            "sales_count": 1,
+            "gross_total": sale.total or 0,
+            "discount_total": sale.discount or 0,
+            "tax_total": sale.tax or 0,
+            "net_total": sale.net_total or 0,
+            "refund_total": 0.0,
+        }])
+
+
+def record_return(ret, lines):
+    """Add a flushed return and its item dicts to the rollups."""
+    day = ret.created_at.date()
+    _upsert(DailySales, ["day"], [{
+        "day": day,
+        "sales_count": 0,
+        "gross_total": 0.0,
+        "discount_total": 0.0,
+        "tax_total": 0.0,
+        "net_total": 0.0,
+        "refund_total": ret.refund_total or 0,
+    }])
+    merged = _merge_lines(lines)
+    _upsert(DailyProductSales, ["day", "product_name"], [
+        {"day": day, "product_name": name, "qty_sold": 0, "revenue": 0.0, "qty_returned": v["qty"]}
+        for name, v in merged.items()
+    ])
+    if ret.shift_id:
+        _upsert(ShiftTotals, ["shift_id"], [{
+            "shift_id": ret.shift_id,
+            "sales_count": 0,
+            "gross_total": 0.0,
+            "discount_total": 0.0,
+            "tax_total": 0.0,
+            "net_total": 0.0,
+            "refund_total": ret.refund_total or 0,
+        }])
+
+
+def sales_since(start_day):
+    """Net sales total from ``start_day`` (inclusive) to now."""
+    return (
+        db.session.query(db.func.sum(DailySales.net_total))
+        .filter(DailySales.day >= start_day)
+        .scalar()
+        or 0
+    )
+
+
+def best_sellers(limit=5):
+    return (
+        db.session.query(ProductSalesTotal.product_name, ProductSalesTotal.qty_sold)
+        .order_by(ProductSalesTotal.qty_sold.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def _shift_aggregates():
+    """Select per-shift totals computed from the raw ``sales``/``returns`` rows."""
+    sales = (
+        db.select(
+            Sale.shift_id.label("shift_id"),
+            db.func.count(Sale.id).label("sales_count"),
+            db.func.coalesce(db.func.sum(Sale.total), 0).label("gross_total"),
+            db.func.coalesce(db.func.sum(Sale.discount), 0).label("discount_total"),
+            db.func.coalesce(db.func.sum(Sale.tax), 0).label("tax_total"),
+            db.func.coalesce(db.func.sum(Sale.net_total), 0).label("net_total"),
+        )
+        .where(Sale.shift_id.isnot(None))
+        .group_by(Sale.shift_id)
+        .subquery()
+    )
+    refunds = (
+        db.select(Return.shift_id.label("shift_id"), db.func.sum(Return.refund_total).label("refund_total"))
+        .where(Return.shift_id.isnot(None))
+        .group_by(Return.shift_id)
+        .subquery()
+    )
+    return (
+        db.select(
+            Shift.id,
+            db.func.coalesce(sales.c.sales_count, 0),
+            db.func.coalesce(sales.c.gross_total, 0),
+            db.func.coalesce(sales.c.discount_total, 0),
+            db.func.coalesce(sales.c.tax_total, 0),
+            db.func.coalesce(sales.c.net_total, 0),
+            db.func.coalesce(refunds.c.refund_total, 0),
+        )
+        .outerjoin(sales, sales.c.shift_id == Shift.id)
+        .outerjoin(refunds, refunds.c.shift_id == Shift.id)
+    )
+
+
+def rebuild_shift_totals(conn):
+    """Recompute ``shift_totals`` for every shift on ``conn``."""
+    conn.execute(db.delete(ShiftTotals))
+    conn.execute(db.insert(ShiftTotals).from_select(["shift_id", *SHIFT_FIELDS], _shift_aggregates()))
+
+
+def shift_drift(tolerance=0.005):
+    """Return ``(shift_id, field, running, actual)`` for totals that disagree with the raw rows."""
+    actual = {row[0]: row[1:] for row in db.session.execute(_shift_aggregates()).all()}
+    running = {
+        row[0]: row[1:]
+        for row in db.session.query(ShiftTotals.shift_id, *[getattr(ShiftTotals, f) for f in SHIFT_FIELDS]).all()
+    }
+    drift = []
+    for shift_id, values in actual.items():
+        stored = running.get(shift_id, (0,) * len(SHIFT_FIELDS))
+        for field, have, want in zip(SHIFT_FIELDS, stored, values):
+            if abs((have or 0) - (want or 0)) > tolerance:
+                drift.append((shift_id, field, have, want))
+    return drift
+
+
+def backfill(conn):
+    """Rebuild all rollup tables from ``sales``/``returns`` on ``conn`` with set-based queries."""
+    conn.execute(db.delete(DailyProductSales))
+    conn.execute(db.delete(DailySales))
+    conn.execute(db.delete(ProductSalesTotal))
+
+    day = db.func.date(Sale.created_at)
+    sales = (
+        db.select(
+            day.label("day"),
+            db.func.count(Sale.id).label("sales_count"),
+            db.func.coalesce(db.func.sum(Sale.total), 0).label("gross_total"),
+            db.func.coalesce(db.func.sum(Sale.discount), 0).label("discount_total"),
+            db.func.coalesce(db.func.sum(Sale.tax), 0).label("tax_total"),
+            db.func.coalesce(db.func.sum(Sale.net_total), 0).label("net_total"),
+        )
+        .group_by(day)
+        .subquery()
+    )
+    ret_day = db.func.date(Return.created_at)
+    refunds = (
+        db.select(ret_day.label("day"), db.func.sum(Return.refund_total).label("refund_total"))
+        .group_by(ret_day)
+        .subquery()
+    )
+    days = db.union(db.select(sales.c.day), db.select(refunds.c.day)).subquery()
+    conn.execute(
+        db.insert(DailySales).from_select(
+            ["day", "sales_count", "gross_total", "discount_total", "tax_total", "net_total", "refund_total"],
+            db.select(
+                days.c.day,
+                db.func.coalesce(sales.c.sales_count, 0),
+                db.func.coalesce(sales.c.gross_total, 0),
+                db.func.coalesce(sales.c.discount_total, 0),
+                db.func.coalesce(sales.c.tax_total, 0),
+                db.func.coalesce(sales.c.net_total, 0),
+                db.func.coalesce(refunds.c.refund_total, 0),
+            )
+            .outerjoin(sales, sales.c.day == days.c.day)
+            .outerjoin(refunds, refunds.c.day == days.c.day),
+        )
+    )
+
+    sold = (
+        db.select(
+            day.label("day"),
+            SaleItem.product_name.label("product_name"),
+            db.func.sum(SaleItem.qty).label("qty_sold"),
+            db.func.sum(SaleItem.total).label("revenue"),
+        )
+        .join(Sale, Sale.id == SaleItem.sale_id)
+        .group_by(day, SaleItem.product_name)
+        .subquery()
+    )
+    returned = (
+        db.select(
+            ret_day.label("day"),
+            ReturnItem.product_name.label("product_name"),
+            db.func.sum(ReturnItem.qty).label("qty_returned"),
+        )
+        .join(Return, Return.id == ReturnItem.return_id)
+        .group_by(ret_day, ReturnItem.product_name)
+        .subquery()
+    )
+    keys = db.union(
+        db.select(sold.c.day, sold.c.product_name),
+        db.select(returned.c.day, returned.c.product_name),
+    ).subquery()
+    conn.execute(
+        db.insert(DailyProductSales).from_select(
+            ["day", "product_name", "qty_sold", "revenue", "qty_returned"],
+            db.select(
+                keys.c.day,
+                keys.c.product_name,
+                db.func.coalesce(sold.c.qty_sold, 0),
+                db.func.coalesce(sold.c.revenue, 0),
+                db.func.coalesce(returned.c.qty_returned, 0),
+            )
+            .outerjoin(sold, (sold.c.day == keys.c.day) & (sold.c.product_name == keys.c.product_name))
+            .outerjoin(
+                returned,
+                (returned.c.day == keys.c.day) & (returned.c.product_name == keys.c.product_name),
+            ),
+        )
+    )
+
+    conn.execute(
+        db.insert(ProductSalesTotal).from_select(
+            ["product_name", "qty_sold"],
+            db.select(SaleItem.product_name, db.func.sum(SaleItem.qty)).group_by(SaleItem.product_name),
+        )
+    )
+    rebuild_shift_totals(conn)
+
+
+@click.group("rollups")
+def rollups_cli():
+    """Maintain the sales rollup tables."""
+
+
+@rollups_cli.command("backfill")
+@with_appcontext
+def backfill_command():
+    """Rebuild rollups from the full sales history."""
+    backfill(db.session)
+    db.session.commit()
+    click.echo(f"daily rows: {DailySales.query.count()}, "
+               f"product-day rows: {DailyProductSales.query.count()}")
+
+
+@rollups_cli.command("reconcile-shifts")
+@click.option("--fix", is_flag=True, help="Rebuild the running totals from the raw rows.")
+@with_appcontext
+def reconcile_shifts_command(fix):
+    """Verify running shift totals against the sales and returns they cover."""
+    drift = shift_drift()
+    for shift_id, field, have, want in drift:
+        click.echo(f"shift {shift_id}: {field} running={have} actual={want}")
+    if not drift:
+        click.echo("shift totals match the sales history")
+    elif fix:
+        rebuild_shift_totals(db.session)
+        db.session.commit()
+        click.echo(f"rebuilt totals for {ShiftTotals.query.count()} shifts")
+    if drift and not fix:
+        raise SystemExit(1)
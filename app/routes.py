@@ -6,18 +6,57 @@ from flask import (
     url_for,
     flash,
     jsonify,
-    make_response,
+    abort,
+    Response,
+    stream_with_context,
+    current_app,
+    send_from_directory,
 )
 from flask_login import login_required, current_user
-from datetime import datetime, timedelta
-from .models import db, Product, InventoryLog, Customer, Sale, SaleItem, Shift, Setting, Supplier, SupplierInvoice, SupplierInvoiceItem, Return, ReturnItem
-from .utils.barcode import generate_unique_code, generate_barcode_image, barcode_svg_base64
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
+from datetime import datetime, timedelta, timezone
+from . import alerts, barcode_allocator, barcode_cache, catalog, idempotency, jobs, ledger, product_index, rollups, site_settings
+from .customers import name_key, phone_key, resolve as resolve_customer, search as search_customers
+from .exports import DATASETS, export_rows, parse_day
+from .tasks import export_dir
+from .models import db, Product, InventoryLog, JobUpload, Customer, Sale, SaleItem, Shift, ShiftTotals, Supplier, SupplierInvoice, SupplierInvoiceItem, Return, ReturnItem
+from .utils.barcode import svg_data_uri
+from .utils.http_cache import IMMUTABLE, content_etag, not_modified, stamp
+from .utils.labels import DEFAULT_STOCK, LABEL_STOCKS, label_sheet
+from .utils.pagination import paginate
+from .utils.stock import InsufficientStock, collect_deltas, decrement_stock, increment_stock, run_transaction
+import json
 import os
-import csv
-import io
+import uuid
 
 main_bp = Blueprint("main", __name__)
 
+MAX_BARCODE_BATCH = 5000
+BARCODE_RENDER_VERSION = 1  # غيّره إذا تغير شكل رسم الباركود حتى تُحمّل المتصفحات الصور الجديدة
+MAX_LABEL_COPIES = 100
+MAX_SYNC_BATCH = 200
+
+PRODUCT_SORTS = {
+    "id": (Product.id,),
+    "name": (Product.name, Product.id),
+    "price": (Product.price, Product.id),
+    "stock": (Product.stock_qty, Product.id),
+}
+CUSTOMER_SORTS = {
+    "total": (db.func.coalesce(Customer.total_purchases, 0), Customer.id),
+    "name": (Customer.name, Customer.id),
+    "id": (Customer.id,),
+}
+
+
+def filter_products(query):
+    """Apply the ``q`` search argument (name or barcode) to a product query."""
+    q = request.args.get("q", "").strip()
+    if q:
+        query = query.filter(Product.name.ilike(f"%{q}%") | Product.barcode.ilike(f"%{q}%"))
+    return query
+
 
 @main_bp.route("/")
 @login_required
@@ -34,11 +73,7 @@ def products():
         price = float(request.form.get("price", 0))
         stock_qty = int(request.form.get("stock_qty", 0))
         min_stock_alert = int(request.form.get("min_stock_alert", 0))
-        existing_codes = {p.barcode for p in Product.query.all()}
-        code = generate_unique_code(existing_codes)
-        generate_barcode_image(
-            code, os.path.join("app", "static", "barcodes")
-        )
+        code = barcode_allocator.next()
         p = Product(
             name=name,
             price=price,
@@ -47,23 +82,63 @@ def products():
             barcode=code,
         )
         db.session.add(p)
+        db.session.flush()
+        ledger.record({p.id: stock_qty}, ledger.OPENING_NOTE)
+        catalog.touch([p.id])
+        alerts.refresh([p.id])
         db.session.commit()
+        product_index.invalidate([p.id])
+        jobs.enqueue("barcodes.render", codes=[code])
         flash("تم إضافة المنتج", "success")
         return redirect(url_for("main.products"))
 
-    products = Product.query.order_by(Product.id.desc()).all()
-    return render_template("products.html", products=products)
+    page = paginate(filter_products(Product.query), PRODUCT_SORTS, "id", default_desc=True)
+    return render_template("products.html", products=page)
+
+
+@main_bp.route("/products/import", methods=["POST"])
+@login_required
+def product_import():
+    upload = request.files.get("file")
+    ext = os.path.splitext(upload.filename)[1].lower() if upload and upload.filename else ""
+    if ext not in (".csv", ".xlsx"):
+        flash("اختر ملف CSV أو XLSX", "danger")
+        return redirect(url_for("main.products"))
+    # الملف يُحفظ في القاعدة لا على قرص هذا الخادم: العامل المنفذ قد يكون على خادم آخر
+    stored = JobUpload(id=uuid.uuid4().hex, filename=upload.filename, data=upload.read())
+    db.session.add(stored)
+    db.session.commit()
+    # مهمة في قاعدة البيانات: أي عامل ينفذها ويعرض حالتها، ولا تُعاد لأن الصفوف بلا باركود ستتكرر
+    job_id = jobs.enqueue("products.import", max_attempts=1, upload_id=stored.id, filename=upload.filename)
+    return redirect(url_for("main.product_import_status", job_id=job_id))
+
+
+@main_bp.route("/products/import/<job_id>")
+@login_required
+def product_import_status(job_id):
+    job = jobs.get(job_id)
+    if job is None or job["kind"] != "products.import":
+        abort(404)
+    return render_template("product_import.html", job=job)
 
 
 @main_bp.route("/products/<int:pid>/update", methods=["POST"])
 @login_required
 def product_update(pid):
-    product = Product.query.get_or_404(pid)
-    product.name = request.form.get("name", product.name)
-    product.price = float(request.form.get("price", product.price) or 0)
-    product.stock_qty = int(request.form.get("stock_qty", product.stock_qty) or 0)
-    product.min_stock_alert = int(request.form.get("min_stock_alert", product.min_stock_alert) or 0)
-    db.session.commit()
+    def save():
+        # قفل الصف: بيع متزامن بين قراءة الرصيد وكتابته يجعل فرق السجل خاطئًا
+        product = Product.query.filter_by(id=pid).with_for_update().populate_existing().first_or_404()
+        product.name = request.form.get("name", product.name)
+        product.price = float(request.form.get("price", product.price) or 0)
+        old_qty = product.stock_qty
+        product.stock_qty = int(request.form.get("stock_qty", product.stock_qty) or 0)
+        product.min_stock_alert = int(request.form.get("min_stock_alert", product.min_stock_alert) or 0)
+        ledger.record({pid: product.stock_qty - old_qty}, "تعديل يدوي")
+        catalog.touch([pid])
+        alerts.refresh([pid])
+
+    run_transaction(save)
+    product_index.invalidate([pid])
     flash("تم تحديث المنتج", "success")
     return redirect(url_for("main.products"))
 
@@ -72,8 +147,15 @@ def product_update(pid):
 @login_required
 def product_delete(pid):
     product = Product.query.get_or_404(pid)
+    # حذف المنتج يحذف سجل مخزونه معه؛ سطور الفواتير والمرتجعات تبقى باسم المنتج بلا ربط
+    for model in (SaleItem, SupplierInvoiceItem, ReturnItem):
+        db.session.execute(db.update(model).where(model.product_id == pid).values(product_id=None))
+    ledger.forget(pid)
     db.session.delete(product)
+    catalog.touch([pid])
+    alerts.refresh([pid])
     db.session.commit()
+    product_index.invalidate([pid])
     flash("تم حذف المنتج", "success")
     return redirect(url_for("main.products"))
 
@@ -81,57 +163,197 @@ def product_delete(pid):
 @main_bp.route("/print-barcodes")
 @login_required
 def print_barcodes():
-    products = Product.query.order_by(Product.name.asc()).all()
-    return render_template("print_barcodes.html", products=products)
+    page = paginate(filter_products(Product.query), PRODUCT_SORTS, "name", per_page=100)
+    return render_template("print_barcodes.html", products=page, label_stocks=LABEL_STOCKS)
+
+
+@main_bp.route("/print-barcodes/sheet", methods=["POST"])
+@login_required
+def barcode_sheet():
+    """Lay out the print list server-side as paginated SVG label sheets."""
+    try:
+        items = json.loads(request.form.get("items_json", "[]"))
+    except ValueError:
+        items = []
+    quantities = []
+    for it in items:
+        try:
+            pid, copies = int(it.get("id")), int(it.get("qty", 1))
+        except (TypeError, ValueError):
+            continue
+        if copies > 0:
+            quantities.append((pid, min(copies, MAX_LABEL_COPIES)))
+
+    rows = (
+        db.session.query(Product.id, Product.name, Product.price, Product.barcode)
+        .filter(Product.id.in_([pid for pid, _ in quantities]))
+        .all()
+    ) if quantities else []
+    products = {r.id: {"name": r.name, "price": r.price, "barcode": r.barcode} for r in rows}
+    quantities = [(pid, copies) for pid, copies in quantities if pid in products]
+
+    stock = LABEL_STOCKS.get(request.form.get("stock"), LABEL_STOCKS[DEFAULT_STOCK])
+    return Response(label_sheet(products, quantities, stock), content_type="text/html; charset=utf-8")
 
 
 @main_bp.route("/inventory")
 @login_required
 def inventory():
-    products = Product.query.order_by(Product.name.asc()).all()
-    low = Product.query.filter(Product.stock_qty <= Product.min_stock_alert, Product.stock_qty > 0).all()
-    zero = Product.query.filter(Product.stock_qty <= 0).all()
+    products = paginate(filter_products(Product.query), PRODUCT_SORTS, "name")
+    low = alerts.flagged_products(alerts.LOW)
+    zero = alerts.flagged_products(alerts.OUT)
     return render_template(
         "inventory.html", products=products, low=low, zero=zero
     )
 
 
+@main_bp.route("/api/stock-alerts/counts")
+@login_required
+def api_stock_alert_counts():
+    """Low/out-of-stock counts for navigation badges."""
+    return jsonify(alerts.counts())
+
+
+@main_bp.route("/api/stock-alerts")
+@login_required
+def api_stock_alerts():
+    products = alerts.flagged_products(request.args.get("level"))
+    return jsonify({
+        "counts": alerts.counts(),
+        "products": [
+            {
+                "id": p.id,
+                "name": p.name,
+                "stock_qty": p.stock_qty,
+                "min_stock_alert": p.min_stock_alert,
+                "level": alerts.OUT if p.stock_qty <= 0 else alerts.LOW,
+            }
+            for p in products
+        ],
+    })
+
+
+@main_bp.route("/api/reorder-suggestions")
+@login_required
+def api_reorder_suggestions():
+    """Purchase suggestions for flagged products from recent sales velocity."""
+    days = request.args.get("days", type=int)
+    return jsonify(alerts.reorder_suggestions(days=max(1, min(days, 365)) if days else None))
+
+
+def _ledger_products():
+    ids = request.args.getlist("product_id", type=int)
+    return ids or None
+
+
+@main_bp.route("/api/inventory/at")
+@login_required
+def api_stock_at():
+    """Stock per product at the end of ``?date=YYYY-MM-DD``, from the ledger."""
+    day = parse_day(request.args.get("date"))
+    if day is None:
+        return jsonify({"error": "حدد التاريخ بصيغة YYYY-MM-DD"}), 400
+    stock = ledger.stock_at(day + timedelta(days=1), _ledger_products())
+    return jsonify({
+        "date": day.strftime("%Y-%m-%d"),
+        "stock": [{"product_id": pid, "qty": qty} for pid, qty in sorted(stock.items())],
+    })
+
+
+@main_bp.route("/api/inventory/movement")
+@login_required
+def api_stock_movement():
+    """Opening/closing stock and quantities in and out per product, ``start`` to end of ``end``."""
+    start, end = parse_day(request.args.get("start")), parse_day(request.args.get("end"))
+    if start is None or end is None or end < start:
+        return jsonify({"error": "حدد فترة صحيحة (start و end بصيغة YYYY-MM-DD)"}), 400
+    moved = ledger.movement(start, end + timedelta(days=1), _ledger_products())
+    return jsonify({
+        "start": start.strftime("%Y-%m-%d"),
+        "end": end.strftime("%Y-%m-%d"),
+        "products": [{"product_id": pid, **totals} for pid, totals in sorted(moved.items())],
+    })
+
+
 @main_bp.route("/pos")
 @login_required
 def pos():
-    logo = Setting.query.get("logo_path")
-    return render_template("pos.html", logo_path=logo.value if logo else "")
+    return render_template("pos.html")
 
 
 @main_bp.route("/api/products/search")
 @login_required
 def api_products_search():
     q = request.args.get("q", "").strip()
-    results = (
-        Product.query.filter(
-            (Product.name.ilike(f"%{q}%")) | (Product.barcode.ilike(f"%{q}%"))
-        )
-        .limit(10)
+    # النتائج من الفهرس في الذاكرة، فبصمتها تُحسب بدون قاعدة البيانات
+    results = product_index.search(q, limit=10)
+    etag = content_etag(results)
+    return not_modified(etag) or stamp(jsonify(results), etag)
+
+
+@main_bp.route("/api/customers/search")
+@login_required
+def api_customers_search():
+    return jsonify(search_customers(request.args.get("q", "").strip(), limit=10))
+
+
+def _product_names(product_ids):
+    if not product_ids:
+        return {}
+    return dict(
+        db.session.query(Product.id, Product.name)
+        .filter(Product.id.in_(product_ids))
         .all()
     )
-    return jsonify(
-        [
-            {
-                "id": p.id,
-                "name": p.name,
-                "price": p.price,
-                "stock_qty": p.stock_qty,
-                "barcode": p.barcode,
-            }
-            for p in results
-        ]
-    )
 
 
-@main_bp.route("/api/sale", methods=["POST"])
-@login_required
-def api_sale():
-    data = request.get_json(force=True)
+def _open_shift_id(cashier):
+    """Id of ``cashier``'s open shift (the newest if several), or ``None``."""
+    return db.session.execute(
+        db.select(Shift.id)
+        .where(Shift.cashier_name == cashier, Shift.end_time.is_(None))
+        .order_by(Shift.id.desc())
+        .limit(1)
+    ).scalar()
+
+
+def _shift_finder(cashier, times):
+    """Return ``find(created_at)`` giving the cashier's shift that covered that time.
+
+    Loads the cashier's shifts overlapping ``times`` in one query; a sale
+    without a timestamp belongs to the open shift.
+    """
+    times = [t for t in times if t is not None]
+    query = db.select(Shift.id, Shift.start_time, Shift.end_time).where(Shift.cashier_name == cashier)
+    if times:
+        query = query.where(
+            Shift.start_time <= max(times),
+            db.or_(Shift.end_time.is_(None), Shift.end_time >= min(times)),
+        )
+    else:
+        query = query.where(Shift.end_time.is_(None))
+    shifts = db.session.execute(query.order_by(Shift.start_time.desc())).all()
+
+    def find(created_at):
+        for shift_id, start, end in shifts:
+            if created_at is None:
+                if end is None:
+                    return shift_id
+            elif start <= created_at and (end is None or end >= created_at):
+                return shift_id
+        return None
+
+    return find
+
+
+def _stage_sale(data, cashier, names, created_at=None, shift_id=None):
+    """Add one POS sale payload to the session and return the flushed sale.
+
+    Writes the sale, its lines, the customer's running total and the rollups
+    (including the running totals of ``shift_id``); stock is left to the
+    caller so a batch can decrement it once. ``names`` maps product ids to
+    names for lines sent without one.
+    """
     items = data.get("items", [])
     discount = float(data.get("discount", 0))
     tax = float(data.get("tax", 0))
@@ -141,81 +363,232 @@ def api_sale():
     subtotal = sum(float(it["price"]) * int(it["qty"]) for it in items)
     net_total = subtotal - discount + tax
 
-    customer = None
-    if customer_name:
-        customer = Customer.query.filter_by(name=customer_name).first()
-        if not customer:
-            customer = Customer(name=customer_name, phone=customer_phone)
-            db.session.add(customer)
-        customer.total_purchases = (customer.total_purchases or 0) + net_total
+    customer_id = None
+    customer = resolve_customer(customer_name, customer_phone)
+    if customer:
+        # زيادة ذرية داخل قاعدة البيانات حتى لا تضيع مع البيع المتزامن
+        db.session.execute(
+            db.update(Customer)
+            .where(Customer.id == customer.id)
+            .values(total_purchases=db.func.coalesce(Customer.total_purchases, 0) + net_total)
+            .execution_options(synchronize_session=False)
+        )
+        customer_id = customer.id
 
     sale = Sale(
-        customer_id=customer.id if customer else None,
+        customer_id=customer_id,
         total=subtotal,
         discount=discount,
         tax=tax,
         net_total=net_total,
-        cashier=current_user.username,
+        cashier=cashier,
+        shift_id=shift_id,
     )
+    if created_at:
+        sale.created_at = created_at
     db.session.add(sale)
     db.session.flush()
 
-    for it in items:
-        qty = int(it["qty"])
-        price = float(it["price"])
-        total = qty * price
-        item = SaleItem(
-            sale_id=sale.id,
-            product_id=it.get("id"),
-            product_name=it.get("name"),
-            qty=qty,
-            price=price,
-            total=total,
-        )
-        db.session.add(item)
-        if it.get("id"):
-            product = Product.query.get(int(it["id"]))
-            if product:
-                product.stock_qty = max(0, product.stock_qty - qty)
-    db.session.commit()
+    lines = [
+        {
+            "sale_id": sale.id,
+            "product_id": it.get("id"),
+            "product_name": it.get("name") or names.get(int(it.get("id") or 0), ""),
+            "qty": int(it["qty"]),
+            "price": float(it["price"]),
+            "total": int(it["qty"]) * float(it["price"]),
+        }
+        for it in items
+    ]
+    if lines:
+        db.session.execute(db.insert(SaleItem), lines)
+    rollups.record_sale(sale, lines)
+    return sale
+
+
+def _sale_saved(sale_id, replayed=False):
+    resp = jsonify({"message": "تم حفظ الفاتورة", "sale_id": sale_id})
+    if replayed:
+        resp.headers["Idempotent-Replayed"] = "true"
+    return resp
 
-    return jsonify({"message": "تم حفظ الفاتورة", "sale_id": sale.id})
+
+@main_bp.route("/api/sale", methods=["POST"])
+@login_required
+def api_sale():
+    data = request.get_json(force=True)
+    key = (request.headers.get("Idempotency-Key") or data.get("client_id") or "").strip()
+    if len(key) > idempotency.MAX_KEY_LENGTH:
+        return jsonify({"error": "مفتاح الطلب طويل جدًا"}), 400
+    if key:
+        # إعادة إرسال نفس الفاتورة: نرجع رقمها الأصلي بدون أي كتابة
+        sale_id = idempotency.find([key]).get(key)
+        if sale_id:
+            return _sale_saved(sale_id, replayed=True)
+    deltas = collect_deltas(data.get("items", []))
+    cashier = current_user.username
+
+    def record_sale():
+        names = _product_names(deltas)
+        sale = _stage_sale(data, cashier, names, shift_id=_open_shift_id(cashier))
+        taken = decrement_stock({pid: qty for pid, qty in deltas.items() if pid in names})
+        ledger.record({pid: -qty for pid, qty in taken.items()}, f"بيع #{sale.id}")
+        catalog.touch(names)
+        alerts.refresh(names)
+        if key:
+            idempotency.remember({key: sale.id})
+        return sale.id
+
+    try:
+        sale_id = run_transaction(record_sale)
+    except InsufficientStock as e:
+        return jsonify({"error": "الكمية المطلوبة غير متوفرة في المخزون", "product_ids": e.product_ids}), 409
+    except IntegrityError:
+        # طلب متزامن بنفس المفتاح سبقنا للحفظ
+        sale_id = idempotency.find([key]).get(key)
+        if sale_id is None:
+            raise
+        return _sale_saved(sale_id, replayed=True)
+    product_index.invalidate(deltas)
+    idempotency.maybe_purge()
+
+    return _sale_saved(sale_id)
+
+
+@main_bp.route("/api/catalog")
+@login_required
+def api_catalog():
+    """Catalog snapshot for offline tills; ``?since=<version>`` returns only changes."""
+    return jsonify(catalog.snapshot(request.args.get("since", 0, type=int)))
+
+
+def _client_time(value):
+    """Parse a till's ISO timestamp to naive UTC; reject garbage and future times."""
+    try:
+        stamp = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if stamp.tzinfo is not None:
+        stamp = stamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return stamp if stamp <= datetime.utcnow() + timedelta(minutes=5) else None
+
+
+@main_bp.route("/api/sales/batch", methods=["POST"])
+@login_required
+def api_sales_batch():
+    """Ingest sales queued by an offline till in one transaction.
+
+    Every sale carries a till-generated ``client_id``; ids seen before are
+    answered with their original sale id, so resending a batch is safe. The
+    sales already happened at the counter, so stock is never refused: it is
+    clamped at zero and each product that ran short is listed in
+    ``conflicts``.
+    """
+    data = request.get_json(force=True) or {}
+    queued = data.get("sales")
+    if not isinstance(queued, list) or not queued or len(queued) > MAX_SYNC_BATCH:
+        return jsonify({"error": f"أرسل من 1 إلى {MAX_SYNC_BATCH} عملية بيع"}), 400
+    client_ids = [str(s.get("client_id") or "") if isinstance(s, dict) else "" for s in queued]
+    if not all(0 < len(cid) <= 64 for cid in client_ids):
+        return jsonify({"error": "كل عملية بيع تحتاج client_id"}), 400
+    try:
+        all_deltas = collect_deltas(it for s in queued for it in s.get("items", []))
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({"error": "بيانات البيع غير صالحة"}), 400
+    cashier = current_user.username
+
+    def ingest():
+        known = idempotency.find(client_ids)
+        fresh = {}
+        for cid, payload in zip(client_ids, queued):
+            if cid not in known:
+                fresh.setdefault(cid, payload)
+
+        deltas = collect_deltas(it for s in fresh.values() for it in s.get("items", []))
+        names = _product_names(deltas)
+        deltas = {pid: qty for pid, qty in deltas.items() if pid in names}
+
+        stamps = {cid: _client_time(payload.get("created_at")) for cid, payload in fresh.items()}
+        shift_for = _shift_finder(cashier, stamps.values())
+        created = {}
+        for cid, payload in fresh.items():
+            sale = _stage_sale(payload, cashier, names, stamps[cid], shift_for(stamps[cid]))
+            created[cid] = sale.id
+        idempotency.remember(created)
+        taken = decrement_stock(deltas, mode="clamp")
+        ledger.record({pid: -qty for pid, qty in taken.items()}, "مبيعات أوفلاين")
+        catalog.touch(deltas)
+        alerts.refresh(deltas)
+
+        # المنتج الذي نقص مخزونه خُصم منه ما كان متاحًا فقط
+        conflicts = [
+            {
+                "product_id": pid,
+                "product_name": names[pid],
+                "requested": qty,
+                "available": taken.get(pid, 0),
+                "shortfall": qty - max(taken.get(pid, 0), 0),
+            }
+            for pid, qty in deltas.items()
+            if qty > taken.get(pid, 0)
+        ]
+        return known, created, conflicts
+
+    try:
+        try:
+            known, created, conflicts = run_transaction(ingest)
+        except IntegrityError:
+            # نفس الدفعة وصلت مرتين في نفس اللحظة: نعيد المحاولة فنجد مفاتيحها محفوظة
+            known, created, conflicts = run_transaction(ingest)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "بيانات البيع غير صالحة"}), 400
+    product_index.invalidate(all_deltas)
+    if conflicts:
+        current_app.logger.warning("offline sync by %s left stock short: %s", cashier, conflicts)
+
+    results, seen = [], set()
+    for cid in client_ids:
+        results.append({
+            "client_id": cid,
+            "sale_id": created.get(cid) or known.get(cid),
+            "status": "duplicate" if cid in known or cid in seen else "created",
+        })
+        seen.add(cid)
+    return jsonify({"results": results, "conflicts": conflicts, "version": catalog.current_version()})
+
+
+def _load_sale(sale_id):
+    """Sale with its customer (joined) and lines (one IN query), or 404."""
+    return (
+        Sale.query.options(joinedload(Sale.customer), selectinload(Sale.items))
+        .filter_by(id=sale_id)
+        .first_or_404()
+    )
 
 
 @main_bp.route("/invoice/<int:sale_id>")
 @login_required
 def invoice_view(sale_id):
-    sale = Sale.query.get_or_404(sale_id)
-    items = SaleItem.query.filter_by(sale_id=sale_id).all()
-    logo = Setting.query.get("logo_path")
-    return render_template(
-        "invoice.html",
-        sale=sale,
-        items=items,
-        logo_path=logo.value if logo else "",
-    )
+    sale = _load_sale(sale_id)
+    return render_template("invoice.html", sale=sale, items=sale.items)
 
 
 @main_bp.route("/sales")
 @login_required
 def sales():
-    sales_list = Sale.query.order_by(Sale.id.desc()).limit(50).all()
+    sales_list = Sale.query.options(joinedload(Sale.customer)).order_by(Sale.id.desc()).limit(50).all()
     return render_template("sales.html", sales=sales_list)
 
 
-@main_bp.route("/api/sale/<int:sale_id>")
-@login_required
-def api_sale_details(sale_id):
-    sale = Sale.query.get_or_404(sale_id)
-    items = SaleItem.query.filter_by(sale_id=sale_id).all()
-    customer_name = ""
-    if sale.customer_id:
-        cust = Customer.query.get(sale.customer_id)
-        customer_name = cust.name if cust else ""
+def sale_etag(sale_id, customer_id):
+    return f"sale-{sale_id}-{customer_id or 0}"
 
-    return jsonify({
+
+def sale_payload(sale, customer_name, items):
+    """JSON body of ``/api/sale/<id>`` from a sale and its lines (ORM objects or rows)."""
+    return {
         "id": sale.id,
-        "customer": customer_name,
+        "customer": customer_name or "",
         "total": float(sale.net_total or sale.total or 0),
         "discount": float(sale.discount or 0),
         "tax": float(sale.tax or 0),
@@ -230,7 +603,25 @@ def api_sale_details(sale_id):
             }
             for it in items
         ],
-    })
+    }
+
+
+@main_bp.route("/api/sale/<int:sale_id>")
+@login_required
+def api_sale_details(sale_id):
+    # الفاتورة لا تتغير بعد حفظها؛ فقط عميلها قد يتغير بدمج العملاء
+    if request.if_none_match or request.if_modified_since:
+        version = db.session.execute(
+            db.select(Sale.customer_id, Sale.created_at).where(Sale.id == sale_id)
+        ).first()
+        if version is None:
+            abort(404)
+        cached = not_modified(sale_etag(sale_id, version.customer_id), version.created_at)
+        if cached:
+            return cached
+    sale = _load_sale(sale_id)
+    payload = sale_payload(sale, sale.customer.name if sale.customer else "", sale.items)
+    return stamp(jsonify(payload), sale_etag(sale.id, sale.customer_id), sale.created_at)
 
 
 @main_bp.route("/customers", methods=["GET", "POST"])
@@ -245,31 +636,104 @@ def customers():
             db.session.commit()
             flash("تم إضافة العميل", "success")
         return redirect(url_for("main.customers"))
-    customers = Customer.query.order_by(Customer.total_purchases.desc()).all()
-    return render_template("customers.html", customers=customers)
+    query = Customer.query
+    q = request.args.get("q", "").strip()
+    if q:
+        match = Customer.name_key.contains(name_key(q) or q, autoescape=True)
+        digits = phone_key(q)
+        if digits:
+            match |= Customer.phone_key.contains(digits, autoescape=True)
+        query = query.filter(match)
+    page = paginate(query, CUSTOMER_SORTS, "total", default_desc=True)
+    return render_template("customers.html", customers=page)
 
 
 @main_bp.route("/customers/export")
 @login_required
 def customers_export():
-    customers = Customer.query.order_by(Customer.name.asc()).all()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["id", "name", "phone", "total_purchases"])
-    for c in customers:
-        writer.writerow([
-            c.id,
-            c.name or "",
-            c.phone or "",
-            f"{(c.total_purchases or 0):.2f}",
-        ])
-    content = "\ufeff" + output.getvalue()  # BOM لضمان العربية في Excel
-    resp = make_response(content)
-    resp.headers["Content-Type"] = "application/vnd.ms-excel; charset=utf-8"
-    resp.headers["Content-Disposition"] = "attachment; filename=customers.csv"
+    from .utils.export import stream_response
+
+    header, rows = export_rows("customers")
+    return stream_response("csv", "customers", header, rows)
+
+
+@main_bp.route("/export/<dataset>")
+@login_required
+def export_dataset(dataset):
+    """Stream a dataset as CSV or XLSX (``?format=xlsx``), optionally by date range.
+
+    With ``?background=1`` the file is written by a background job instead;
+    the response points at its status, and the file is then downloaded from
+    ``/jobs/<id>/download``.
+    """
+    if dataset not in DATASETS:
+        abort(404)
+    if request.args.get("background") == "1":
+        fmt = "xlsx" if request.args.get("format") == "xlsx" else "csv"
+        job_id = jobs.enqueue(
+            "export",
+            dataset=dataset,
+            filename=f"{dataset}-{uuid.uuid4().hex}.{fmt}",
+            fmt=fmt,
+            start=request.args.get("from"),
+            end=request.args.get("to"),
+        )
+        return _job_accepted(job_id)
+    from .utils.export import stream_response
+
+    header, rows = export_rows(
+        dataset,
+        start=parse_day(request.args.get("from")),
+        end=parse_day(request.args.get("to")),
+    )
+    return stream_response(request.args.get("format", "csv"), dataset, header, rows)
+
+
+def _job_accepted(job_id):
+    resp = jsonify({
+        "job_id": job_id,
+        "status_url": url_for("main.api_job", job_id=job_id),
+    })
+    resp.status_code = 202
     return resp
 
 
+@main_bp.route("/api/jobs")
+@login_required
+def api_jobs():
+    return jsonify(jobs.recent(status=request.args.get("status") or None))
+
+
+@main_bp.route("/api/jobs/<job_id>")
+@login_required
+def api_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "المهمة غير موجودة"}), 404
+    if job["kind"] == "export" and job["status"] == "done":
+        job["download_url"] = url_for("main.job_download", job_id=job_id)
+    return jsonify(job)
+
+
+@main_bp.route("/jobs/<job_id>/download")
+@login_required
+def job_download(job_id):
+    job = jobs.get(job_id)
+    if job is None or job["kind"] != "export" or job["status"] != "done":
+        abort(404)
+    result = job["result"]
+    return send_from_directory(
+        export_dir(), os.path.basename(result["file"]), as_attachment=True, download_name=result["download_name"]
+    )
+
+
+@main_bp.route("/api/rollups/rebuild", methods=["POST"])
+@login_required
+def api_rollups_rebuild():
+    """Rebuild the report rollups from the full history on a background job."""
+    return _job_accepted(jobs.enqueue("rollups.backfill", max_attempts=1))
+
+
 @main_bp.route("/shifts", methods=["GET", "POST"])
 @login_required
 def shifts():
@@ -281,23 +745,36 @@ def shifts():
                 opening_cash=float(request.form.get("opening_cash", 0)),
             )
             db.session.add(shift)
+            db.session.flush()
+            db.session.add(ShiftTotals(shift_id=shift.id))
             db.session.commit()
             flash("تم فتح الشيفت", "success")
         elif action == "close":
             shift_id = request.form.get("shift_id")
-            shift = Shift.query.get(int(shift_id))
+            shift = Shift.query.options(joinedload(Shift.totals)).filter_by(id=int(shift_id)).first()
             if shift:
+                # المبيعات من إجماليات الشيفت الجارية (صافي الفواتير ناقص المرتجعات)
+                totals = shift.totals
+                cash_sales = (totals.net_total - totals.refund_total) if totals else 0.0
                 shift.closing_cash = float(request.form.get("closing_cash", 0))
-                shift.sales_total = float(request.form.get("sales_total", 0))
-                shift.net_cash = shift.sales_total
-                shift.diff_cash = shift.closing_cash - shift.opening_cash - shift.sales_total
+                shift.sales_total = cash_sales
+                shift.net_cash = cash_sales
+                shift.diff_cash = shift.closing_cash - shift.opening_cash - cash_sales
                 shift.end_time = datetime.utcnow()
                 db.session.commit()
                 flash("تم إغلاق الشيفت", "success")
         return redirect(url_for("main.shifts"))
 
-    last_shifts = Shift.query.order_by(Shift.start_time.desc()).all()
-    return render_template("shifts.html", shifts=last_shifts)
+    page = paginate(
+        Shift.query.options(joinedload(Shift.totals)), {"id": (Shift.id,)}, "id", default_desc=True
+    )
+    open_shifts = (
+        Shift.query.options(joinedload(Shift.totals))
+        .filter(Shift.end_time.is_(None))
+        .order_by(Shift.id.desc())
+        .all()
+    )
+    return render_template("shifts.html", shifts=page, open_shifts=open_shifts)
 
 
 @main_bp.route("/reports")
@@ -307,29 +784,13 @@ def reports():
     week_ago = today - timedelta(days=7)
     month_ago = today - timedelta(days=30)
 
-    def sum_period(start_date):
-        return (
-            db.session.query(db.func.sum(Sale.net_total))
-            .filter(db.func.date(Sale.created_at) >= start_date)
-            .scalar()
-            or 0
-        )
-
     data = {
-        "daily": sum_period(today),
-        "weekly": sum_period(week_ago),
-        "monthly": sum_period(month_ago),
-        "best": db.session.query(
-            SaleItem.product_name, db.func.sum(SaleItem.qty).label("q")
-        )
-        .group_by(SaleItem.product_name)
-        .order_by(db.desc("q"))
-        .limit(5)
-        .all(),
-        "low_stock": Product.query.filter(
-            Product.stock_qty <= Product.min_stock_alert
-        ).all(),
-        "shifts": Shift.query.order_by(Shift.start_time.desc()).limit(5).all(),
+        "daily": rollups.sales_since(today),
+        "weekly": rollups.sales_since(week_ago),
+        "monthly": rollups.sales_since(month_ago),
+        "best": rollups.best_sellers(5),
+        "low_stock": alerts.flagged_products(),
+        "shifts": Shift.query.options(joinedload(Shift.totals)).order_by(Shift.start_time.desc()).limit(5).all(),
     }
     return render_template("reports.html", data=data)
 
@@ -378,13 +839,11 @@ def supplier_delete(sid):
 @main_bp.route("/supplier-invoices", methods=["GET", "POST"])
 @login_required
 def supplier_invoices():
-    products = Product.query.order_by(Product.name.asc()).all()
     suppliers_list = Supplier.query.order_by(Supplier.name.asc()).all()
     if request.method == "POST":
         supplier_id = int(request.form.get("supplier_id"))
         paid = float(request.form.get("paid", 0))
         items_json = request.form.get("items_json", "[]")
-        import json
 
         try:
             items = json.loads(items_json)
@@ -395,80 +854,100 @@ def supplier_invoices():
             flash("أضف أصنافًا للفاتورة", "danger")
             return redirect(url_for("main.supplier_invoices"))
 
-        total = 0
-        invoice = SupplierInvoice(
-            supplier_id=supplier_id,
-            total=0,
-            paid=paid,
-            remaining=0,
-        )
-        db.session.add(invoice)
-        db.session.flush()
+        deltas = collect_deltas(items)
 
-        for it in items:
-            pid = int(it.get("id")) if it.get("id") else None
-            qty = int(it.get("qty", 0))
-            cost = float(it.get("cost", 0))
-            total_line = qty * cost
-            total += total_line
-            product = Product.query.get(pid) if pid else None
-            name = product.name if product else it.get("name", "منتج")
-            inv_item = SupplierInvoiceItem(
-                invoice_id=invoice.id,
-                product_id=pid,
-                product_name=name,
-                qty=qty,
-                cost=cost,
-                total=total_line,
+        def record_invoice():
+            total = 0
+            invoice = SupplierInvoice(
+                supplier_id=supplier_id,
+                total=0,
+                paid=paid,
+                remaining=0,
+            )
+            db.session.add(invoice)
+            db.session.flush()
+
+            names = {}
+            if deltas:
+                names = dict(
+                    db.session.query(Product.id, Product.name)
+                    .filter(Product.id.in_(deltas))
+                    .all()
+                )
+            for it in items:
+                pid = int(it.get("id")) if it.get("id") else None
+                qty = int(it.get("qty", 0))
+                cost = float(it.get("cost", 0))
+                total_line = qty * cost
+                total += total_line
+                inv_item = SupplierInvoiceItem(
+                    invoice_id=invoice.id,
+                    product_id=pid,
+                    product_name=names.get(pid) or it.get("name", "منتج"),
+                    qty=qty,
+                    cost=cost,
+                    total=total_line,
+                )
+                db.session.add(inv_item)
+            received = {pid: qty for pid, qty in deltas.items() if pid in names}
+            increment_stock(received)
+            ledger.record(received, f"فاتورة مورد #{invoice.id}")
+            catalog.touch(names)
+            alerts.refresh(names)
+
+            invoice.total = total
+            invoice.remaining = max(0, total - paid)
+
+            db.session.execute(
+                db.update(Supplier)
+                .where(Supplier.id == supplier_id)
+                .values(balance=db.func.coalesce(Supplier.balance, 0) + invoice.remaining)
+                .execution_options(synchronize_session=False)
             )
-            db.session.add(inv_item)
-            if product:
-                product.stock_qty += qty
-
-        invoice.total = total
-        invoice.remaining = max(0, total - paid)
-
-        supplier = Supplier.query.get(supplier_id)
-        if supplier:
-            supplier.balance += invoice.remaining
 
-        db.session.commit()
+        run_transaction(record_invoice)
+        product_index.invalidate(deltas)
         flash("تم تسجيل فاتورة المورد", "success")
         return redirect(url_for("main.supplier_invoices"))
 
-    invoices = SupplierInvoice.query.order_by(SupplierInvoice.id.desc()).limit(20).all()
-    supplier_map = {s.id: s.name for s in suppliers_list}
+    invoices = paginate(
+        SupplierInvoice.query.options(joinedload(SupplierInvoice.supplier)),
+        {"id": (SupplierInvoice.id,)},
+        "id",
+        default_desc=True,
+        per_page=20,
+    )
     return render_template(
         "supplier_invoices.html",
-        products=products,
         suppliers=suppliers_list,
         invoices=invoices,
-        supplier_map=supplier_map,
     )
 
 
 @main_bp.route("/supplier-invoice/<int:invoice_id>")
 @login_required
 def supplier_invoice_view(invoice_id):
-    invoice = SupplierInvoice.query.get_or_404(invoice_id)
-    supplier = Supplier.query.get(invoice.supplier_id)
-    items = SupplierInvoiceItem.query.filter_by(invoice_id=invoice_id).all()
+    invoice = (
+        SupplierInvoice.query.options(
+            joinedload(SupplierInvoice.supplier), selectinload(SupplierInvoice.items)
+        )
+        .filter_by(id=invoice_id)
+        .first_or_404()
+    )
     return render_template(
         "supplier_invoice_view.html",
         invoice=invoice,
-        supplier=supplier,
-        items=items,
+        supplier=invoice.supplier,
+        items=invoice.items,
     )
 
 
 @main_bp.route("/returns", methods=["GET", "POST"])
 @login_required
 def returns():
-    products = Product.query.order_by(Product.name.asc()).all()
     if request.method == "POST":
         items_json = request.form.get("items_json", "[]")
         note = request.form.get("note")
-        import json
         try:
             items = json.loads(items_json)
         except Exception:
@@ -478,61 +957,121 @@ def returns():
             flash("أضف أصنافًا للمرتجع", "danger")
             return redirect(url_for("main.returns"))
 
-        refund_total = 0
-        ret = Return(refund_total=0, note=note)
-        db.session.add(ret)
-        db.session.flush()
-
-        for it in items:
-            pid = int(it.get("id")) if it.get("id") else None
-            qty = int(it.get("qty", 0))
-            refund_amount = float(it.get("refund", 0))
-            refund_total += refund_amount
-            product = Product.query.get(pid) if pid else None
-            name = product.name if product else it.get("name", "منتج")
-            ritem = ReturnItem(
-                return_id=ret.id,
-                product_id=pid,
-                product_name=name,
-                qty=qty,
-                refund_amount=refund_amount,
-            )
-            db.session.add(ritem)
-            if product:
-                product.stock_qty += qty
-
-        ret.refund_total = refund_total
-        db.session.commit()
+        deltas = collect_deltas(items)
+        cashier = current_user.username
+
+        def record_return():
+            refund_total = 0
+            ret = Return(refund_total=0, note=note, shift_id=_open_shift_id(cashier))
+            db.session.add(ret)
+            db.session.flush()
+
+            names = {}
+            if deltas:
+                names = dict(
+                    db.session.query(Product.id, Product.name)
+                    .filter(Product.id.in_(deltas))
+                    .all()
+                )
+            lines = []
+            for it in items:
+                pid = int(it.get("id")) if it.get("id") else None
+                qty = int(it.get("qty", 0))
+                refund_amount = float(it.get("refund", 0))
+                refund_total += refund_amount
+                lines.append({
+                    "return_id": ret.id,
+                    "product_id": pid,
+                    "product_name": names.get(pid) or it.get("name", "منتج"),
+                    "qty": qty,
+                    "refund_amount": refund_amount,
+                })
+            db.session.execute(db.insert(ReturnItem), lines)
+            returned = {pid: qty for pid, qty in deltas.items() if pid in names}
+            increment_stock(returned)
+            ledger.record(returned, f"مرتجع #{ret.id}")
+            catalog.touch(names)
+            alerts.refresh(names)
+
+            ret.refund_total = refund_total
+            rollups.record_return(ret, lines)
+
+        run_transaction(record_return)
+        product_index.invalidate(deltas)
         flash("تم تسجيل المرتجع", "success")
         return redirect(url_for("main.returns"))
 
-    recent_returns = Return.query.order_by(Return.id.desc()).limit(20).all()
-    return render_template("returns.html", products=products, returns=recent_returns)
+    recent_returns = paginate(Return.query, {"id": (Return.id,)}, "id", default_desc=True, per_page=20)
+    return render_template("returns.html", returns=recent_returns)
+
+
+def barcode_etag(code):
+    return f"barcode-{BARCODE_RENDER_VERSION}-{code}"
+
+
+@main_bp.route("/barcode/<code>.svg")
+@login_required
+def barcode_svg(code):
+    """Barcode as raw SVG; the image for a code never changes, so it is cached for good."""
+    etag = barcode_etag(code)
+    cached = not_modified(etag, cache_control=IMMUTABLE)
+    if cached:
+        return cached
+    svg = barcode_cache.get(code)
+    if not svg:
+        abort(404)
+    return stamp(Response(svg, mimetype="image/svg+xml"), etag, cache_control=IMMUTABLE)
 
 
 @main_bp.route("/api/barcode-image/<code>")
 @login_required
 def barcode_image(code):
-    """Generate and return barcode as SVG (base64 encoded for inline display)"""
+    """Generate and return barcode as SVG (base64 encoded for inline display).
+
+    ``/barcode/<code>.svg`` serves the same image without the base64 overhead.
+    """
+    etag = barcode_etag(code)
+    cached = not_modified(etag, cache_control=IMMUTABLE)
+    if cached:
+        return cached
     try:
-        img = barcode_svg_base64(code)
-        return jsonify({"success": bool(img), "image": img})
+        img = svg_data_uri(barcode_cache.get(code))
     except Exception as e:
         return jsonify({"success": False, "image": "", "error": str(e)})
+    resp = jsonify({"success": bool(img), "image": img, "url": url_for("main.barcode_svg", code=code)})
+    return stamp(resp, etag, cache_control=IMMUTABLE) if img else resp
+
+
+@main_bp.route("/api/barcode-images", methods=["POST"])
+@login_required
+def barcode_images():
+    """Render many barcodes in one streamed JSON object ``{code: data_uri}``."""
+    data = request.get_json(force=True, silent=True) or {}
+    codes = list(dict.fromkeys(str(c) for c in data.get("codes", []) if c))
+    if len(codes) > MAX_BARCODE_BATCH:
+        return jsonify({"error": f"الحد الأقصى {MAX_BARCODE_BATCH} باركود في الطلب"}), 400
+
+    def generate():
+        yield "{"
+        for i, code in enumerate(codes):
+            sep = "," if i else ""
+            yield f"{sep}{json.dumps(code)}:{json.dumps(svg_data_uri(barcode_cache.get(code)))}"
+        yield "}"
+
+    return Response(stream_with_context(generate()), content_type="application/json")
+
+
+@main_bp.route("/api/barcode-cache/stats")
+@login_required
+def barcode_cache_stats():
+    return jsonify(barcode_cache.stats())
 
 
 @main_bp.route("/settings", methods=["GET", "POST"])
 @login_required
 def settings():
-    logo_setting = Setting.query.get("logo_path")
     if request.method == "POST":
-        logo_path = request.form.get("logo_path")
-        if logo_setting:
-            logo_setting.value = logo_path
-        else:
-            logo_setting = Setting(key="logo_path", value=logo_path)
-            db.session.add(logo_setting)
-        db.session.commit()
+        site_settings.update(logo_path=request.form.get("logo_path"))
         flash("تم حفظ الإعدادات", "success")
         return redirect(url_for("main.settings"))
-    return render_template("settings.html", logo_path=logo_setting.value if logo_setting else "")
+    return render_template("settings.html")
@@ -0,0 +1,37 @@
+// اقتراح العملاء أثناء كتابة الاسم أو الهاتف في نقطة البيع
+// اختيار عميل من القائمة يملأ الاسم والهاتف معًا حتى تُربط الفاتورة بنفس العميل
+function attachCustomerTypeahead(nameInput, phoneInput) {
+  const list = document.getElementById(nameInput.getAttribute("list"));
+  let results = [];
+  let timer = null;
+
+  const label = (c) => (c.phone ? `${c.name} — ${c.phone}` : c.name);
+
+  const lookup = (input) => {
+    const match = results.find((c) => label(c) === input.value);
+    if (match) {
+      nameInput.value = match.name;
+      phoneInput.value = match.phone;
+      return;
+    }
+    clearTimeout(timer);
+    const q = input.value.trim();
+    if (q.length < 2) return;
+    timer = setTimeout(() => {
+      fetch(`/api/customers/search?q=${encodeURIComponent(q)}`)
+        .then((resp) => resp.json())
+        .then((res) => {
+          results = res;
+          list.innerHTML = "";
+          res.forEach((c) => {
+            const opt = document.createElement("option");
+            opt.value = label(c);
+            list.appendChild(opt);
+          });
+        });
+    }, 200);
+  };
+
+  nameInput.addEventListener("input", () => lookup(nameInput));
+  phoneInput.addEventListener("input", () => lookup(phoneInput));
+}
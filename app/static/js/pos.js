@@ -1,9 +1,23 @@
 let cart = [];
 let allProducts = [];
 
+// الكتالوج المحلي: يسمح بالبيع ومسح الباركود بدون انتظار السيرفر
+const CATALOG_KEY = "verdi.catalog";
+const QUEUE_KEY = "verdi.saleQueue";
+const SYNC_BATCH = 200;
+const MAX_CARDS = 60;
+const SALE_TIMEOUT = 5000;
+const SALE_RETRIES = 2;
+let catalog = { version: 0, byId: new Map(), byBarcode: new Map() };
+let syncing = false;
+
 // تحميل المنتجات عند التحميل
 $(function() {
   loadAllProducts();
+  flushSaleQueue();
+  setInterval(syncCatalog, 30000);
+  setInterval(flushSaleQueue, 15000);
+  $(window).on("online", flushSaleQueue);
   $(document).keydown(function(e) {
     if (e.ctrlKey && e.key === 'p') {
       e.preventDefault();
@@ -17,16 +31,70 @@ $(function() {
 });
 
 function loadAllProducts() {
-  $.get("/api/products/search?q=", function(res) {
-    allProducts = res;
-    renderProductsList(res);
+  try {
+    const saved = JSON.parse(localStorage.getItem(CATALOG_KEY) || "null");
+    if (saved) applyCatalog(saved);
+  } catch (e) {
+    localStorage.removeItem(CATALOG_KEY);
+  }
+  refreshProductsList();
+  syncCatalog();
+}
+
+function applyCatalog(res) {
+  if (res.full) {
+    catalog.byId = new Map();
+    catalog.byBarcode = new Map();
+  }
+  res.products.forEach((row) => {
+    const p = {};
+    res.fields.forEach((f, i) => (p[f] = row[i]));
+    const old = catalog.byId.get(p.id);
+    if (old) catalog.byBarcode.delete(old.barcode);
+    catalog.byId.set(p.id, p);
+    catalog.byBarcode.set(p.barcode, p);
+  });
+  res.deleted.forEach((id) => {
+    const old = catalog.byId.get(id);
+    if (old) catalog.byBarcode.delete(old.barcode);
+    catalog.byId.delete(id);
+  });
+  catalog.version = res.version;
+  allProducts = Array.from(catalog.byId.values());
+}
+
+function saveCatalog() {
+  const fields = ["id", "barcode", "name", "price", "stock_qty", "min_stock_alert"];
+  try {
+    localStorage.setItem(CATALOG_KEY, JSON.stringify({
+      version: catalog.version,
+      full: true,
+      fields: fields,
+      products: allProducts.map((p) => fields.map((f) => p[f])),
+      deleted: [],
+    }));
+  } catch (e) {
+    // المساحة غير كافية: يبقى الكتالوج في الذاكرة فقط
+  }
+}
+
+function syncCatalog() {
+  $.get("/api/catalog", { since: catalog.version }, function(res) {
+    if (!res.full && res.products.length === 0 && res.deleted.length === 0) return;
+    applyCatalog(res);
+    saveCatalog();
+    refreshProductsList();
   });
 }
 
+function refreshProductsList() {
+  $("#search-input").trigger("input");
+}
+
 function renderProductsList(products) {
   const list = $("#products-list");
   list.empty();
-  products.forEach((p) => {
+  products.slice(0, MAX_CARDS).forEach((p) => {
     const isOutOfStock = p.stock_qty <= 0;
     const isLowStock = p.stock_qty > 0 && p.stock_qty <= (p.min_stock_alert || 5);
     const cardClass = isOutOfStock ? "out-of-stock" : isLowStock ? "low-stock" : "";
@@ -118,6 +186,11 @@ $("#search-input").on("input", function() {
 
 function searchProduct(q) {
   if (!q) return;
+  const local = catalog.byBarcode.get(q);
+  if (local) {
+    addToCart(null, local);
+    return;
+  }
   $.get(`/api/products/search?q=${encodeURIComponent(q)}`, function(res) {
     if (res.length === 0) {
       alert("المنتج غير موجود");
@@ -134,33 +207,121 @@ $("#pay-btn").on("click", function() {
     return;
   }
   const payload = {
+    client_id: newClientId(),
+    created_at: new Date().toISOString(),
     items: cart,
     discount: parseFloat($("#discount").val()) || 0,
     tax: parseFloat($("#tax").val()) || 0,
     customer_name: $("#customer-name").val(),
     customer_phone: $("#customer-phone").val(),
   };
+  if (!navigator.onLine) {
+    queueSale(payload);
+    return;
+  }
+  $("#pay-btn").prop("disabled", true);
+  submitSale(payload, SALE_RETRIES);
+});
+
+function submitSale(payload, retries) {
   $.ajax({
     url: "/api/sale",
     method: "POST",
     contentType: "application/json",
+    // نفس المفتاح في كل محاولة: السيرفر يرجع نفس الفاتورة بدل تكرارها
+    headers: { "Idempotency-Key": payload.client_id },
     data: JSON.stringify(payload),
+    timeout: SALE_TIMEOUT,
     success: function(res) {
       window.location.href = `/invoice/${res.sale_id}`;
     },
     error: function(err) {
+      if (err.status === 0 && retries > 0) {
+        submitSale(payload, retries - 1);
+        return;
+      }
+      $("#pay-btn").prop("disabled", false);
+      if (err.status === 0) {
+        // لا يوجد اتصال: نحفظ الفاتورة محليًا ونرسلها لاحقًا
+        queueSale(payload);
+        return;
+      }
       alert("خطأ: " + (err.responseJSON?.error || "حدث خطأ في حفظ الفاتورة"));
     },
   });
-});
+}
+
+function newClientId() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2, 12);
+}
+
+function loadQueue() {
+  try {
+    return JSON.parse(localStorage.getItem(QUEUE_KEY) || "[]");
+  } catch (e) {
+    return [];
+  }
+}
+
+function saveQueue(queue) {
+  localStorage.setItem(QUEUE_KEY, JSON.stringify(queue));
+  const badge = $("#sync-status");
+  badge.text(queue.length ? `فواتير بانتظار الإرسال: ${queue.length}` : "");
+  badge.toggle(queue.length > 0);
+}
+
+function queueSale(payload) {
+  const queue = loadQueue();
+  queue.push(payload);
+  saveQueue(queue);
+  payload.items.forEach((it) => {
+    const p = catalog.byId.get(it.id);
+    if (p) p.stock_qty = Math.max(0, p.stock_qty - it.qty);
+  });
+  resetCart();
+  refreshProductsList();
+  alert("تم حفظ الفاتورة على الجهاز وسيتم إرسالها عند عودة الاتصال");
+}
+
+function flushSaleQueue() {
+  const queue = loadQueue();
+  saveQueue(queue);
+  if (syncing || queue.length === 0 || !navigator.onLine) return;
+  syncing = true;
+  const batch = queue.slice(0, SYNC_BATCH);
+  $.ajax({
+    url: "/api/sales/batch",
+    method: "POST",
+    contentType: "application/json",
+    data: JSON.stringify({ sales: batch }),
+    timeout: 30000,
+    success: function(res) {
+      const done = new Set(res.results.map((r) => r.client_id));
+      saveQueue(loadQueue().filter((s) => !done.has(s.client_id)));
+      if (res.conflicts.length) {
+        alert("تنبيه: مخزون غير كافٍ لبعض الأصناف المباعة أوفلاين:\n" +
+          res.conflicts.map((c) => `${c.product_name}: ناقص ${c.shortfall}`).join("\n"));
+      }
+      syncCatalog();
+    },
+    complete: function() {
+      syncing = false;
+    },
+  });
+}
 
 $("#clear-btn").on("click", function() {
   if (confirm("هل تريد مسح السلة فعلاً؟")) {
-    cart = [];
-    $("#customer-name").val("");
-    $("#customer-phone").val("");
-    $("#discount").val(0);
-    $("#tax").val(0);
-    renderCart();
+    resetCart();
   }
 });
+
+function resetCart() {
+  cart = [];
+  $("#customer-name").val("");
+  $("#customer-phone").val("");
+  $("#discount").val(0);
+  $("#tax").val(0);
+  renderCart();
+}
@@ -0,0 +1,34 @@
+// بحث منتجات أثناء الكتابة بدل تحميل الكتالوج كاملًا في قائمة منسدلة
+// الاستخدام: <input id="product-select" list="product-options"> + <datalist id="product-options">
+// المنتج المختار يُحفظ في input.dataset.productId / input.dataset.productName
+function attachProductTypeahead(input) {
+  const list = document.getElementById(input.getAttribute("list"));
+  let results = [];
+  let timer = null;
+
+  const label = (p) => `${p.name} — ${p.barcode}`;
+
+  input.addEventListener("input", () => {
+    const match = results.find((p) => label(p) === input.value);
+    input.dataset.productId = match ? match.id : "";
+    input.dataset.productName = match ? match.name : "";
+    if (match) return;
+
+    clearTimeout(timer);
+    const q = input.value.trim();
+    if (!q) return;
+    timer = setTimeout(() => {
+      fetch(`/api/products/search?q=${encodeURIComponent(q)}`)
+        .then((resp) => resp.json())
+        .then((res) => {
+          results = res;
+          list.innerHTML = "";
+          res.forEach((p) => {
+            const opt = document.createElement("option");
+            opt.value = label(p);
+            list.appendChild(opt);
+          });
+        });
+    }, 200);
+  });
+}
@@ -0,0 +1,148 @@
+"""Background job handlers and the ``flask jobs`` commands.
+
+Work that does not have to finish before the response goes through
+``jobs.enqueue``: product file imports, barcode SVG files for new
+products, rollup rebuilds and large exports. Export files are written to ``<instance>/exports`` and
+downloaded from ``/jobs/<id>/download``; ``flask jobs purge`` removes old
+jobs together with their files.
+"""
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import barcode_cache, jobs, rollups
+from .models import db, DailySales, JobUpload
+
+
+def export_dir():
+    return os.path.join(current_app.instance_path, "exports")
+
+
+@jobs.task("products.import")
+def import_file(upload_id, filename):
+    """Import an uploaded product file, reporting progress after every chunk.
+
+    The file comes from ``job_uploads``, so any worker host can run the job;
+    it is copied to a local temporary file for the readers and then deleted.
+    """
+    from .imports import ImportFileError, ImportJob, import_products
+
+    upload = db.session.get(JobUpload, upload_id)
+    if upload is None:
+        raise ImportFileError("الملف المرفوع لم يعد موجودًا")
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(filename)[1].lower())
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(upload.data)
+        db.session.expunge(upload)
+        del upload
+        job = import_products(path, ImportJob(filename), progress=jobs.report)
+    finally:
+        os.remove(path)
+        db.session.execute(db.delete(JobUpload).where(JobUpload.id == upload_id))
+        db.session.commit()
+    if job.status == "failed":
+        jobs.report(job.to_dict())
+        raise ImportFileError(job.message)
+    return job.to_dict()
+
+
+@jobs.task("barcodes.render")
+def render_barcodes(codes):
+    return {"codes": len(codes), "written": barcode_cache.prerender(codes)}
+
+
+@jobs.task("rollups.backfill")
+def backfill_rollups():
+    rollups.backfill(db.session)
+    db.session.commit()
+    return {"days": DailySales.query.count()}
+
+
+@jobs.task("export")
+def export_file(dataset, filename, fmt="csv", start=None, end=None):
+    """Write ``dataset`` to ``<instance>/exports/<filename>``."""
+    from .exports import export_rows, parse_day
+    from .utils.export import csv_stream, xlsx_stream
+
+    header, rows = export_rows(dataset, start=parse_day(start), end=parse_day(end))
+    counted = {"rows": 0}
+
+    def tally(rows):
+        for row in rows:
+            counted["rows"] += 1
+            yield row
+
+    body = xlsx_stream(header, tally(rows), sheet_name=dataset) if fmt == "xlsx" else csv_stream(header, tally(rows))
+    os.makedirs(export_dir(), exist_ok=True)
+    path = os.path.join(export_dir(), filename)
+    # ملف مؤقت لكل تشغيل: محاولتان لنفس المهمة لا تكتبان في نفس الملف
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in body:
+                f.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return {
+        "file": filename,
+        "download_name": f"{dataset}.{fmt}",
+        "rows": counted["rows"],
+        "bytes": os.path.getsize(path),
+    }
+
+
+@click.group("jobs")
+def jobs_cli():
+    """Background job queue."""
+
+
+@jobs_cli.command("work")
+@click.option("--once", is_flag=True, help="Exit when the queue is empty.")
+@with_appcontext
+def work_command(once):
+    """Run queued jobs in this process (for JOB_WORKERS=0 deployments)."""
+    while True:
+        ran = jobs.run_pending()
+        if ran:
+            click.echo(f"jobs run: {ran}")
+        if once:
+            return
+        time.sleep(jobs.poll_interval)
+
+
+@jobs_cli.command("list")
+@click.option("--status", default=None, help="queued / running / done / failed")
+@with_appcontext
+def list_command(status):
+    """Show the most recent jobs."""
+    for job in jobs.recent(status=status):
+        click.echo(f"{job['id']} {job['kind']:<18} {job['status']:<8} "
+                   f"attempts={job['attempts']} created={job['created_at']} {job['error'] or ''}")
+
+
+@jobs_cli.command("purge")
+@click.option("--days", type=int, default=None, help="Keep jobs finished within this many days.")
+@with_appcontext
+def purge_command(days):
+    """Delete finished jobs older than JOB_RETENTION_DAYS, their export files and stale uploads."""
+    days = days if days is not None else current_app.config["JOB_RETENTION_DAYS"]
+    results = jobs.purge(days)
+    for result in results:
+        if isinstance(result, dict) and result.get("file"):
+            path = os.path.join(export_dir(), os.path.basename(result["file"]))
+            if os.path.exists(path):
+                os.remove(path)
+    # ملفات رفع لم تُنفذ مهمتها (مثلًا فشل الإدراج في الطابور)
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    db.session.execute(db.delete(JobUpload).where(JobUpload.created_at < cutoff))
+    db.session.commit()
+    click.echo(f"purged jobs: {len(results)}")
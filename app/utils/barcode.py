@@ -1,42 +1,220 @@
 import os
-import random
-import time
+import re
+import threading
 import base64
+from collections import OrderedDict
 from io import BytesIO
-from barcode import Code128
-from barcode.writer import SVGWriter
 
 
-def generate_unique_code(existing_set=None):
-    existing_set = existing_set or set()
-    while True:
-        code = str(int(time.time())) + str(random.randint(1000, 9999))
-        if code not in existing_set:
-            return code[:12]
+def ean13_check_digit(digits):
+    """Return the EAN-13 check digit for a 12-digit string."""
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return str((10 - total % 10) % 10)
 
 
-def generate_barcode_image(code, output_dir):
-    """Generate barcode SVG (without PIL dependency)"""
-    os.makedirs(output_dir, exist_ok=True)
-    file_path = os.path.join(output_dir, f"{code}.svg")
-    try:
-        with open(file_path, "wb") as f:
-            Code128(code, writer=SVGWriter()).write(f)
-    except Exception:
-        # Fallback: create simple text representation
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(f'<svg><text>{code}</text></svg>')
-    return file_path
+class BarcodeAllocator:
+    """Hands out unique EAN-13 codes from a database sequence.
+
+    Codes are ``BARCODE_PREFIX`` + a zero-padded sequence number + check
+    digit; the default prefix ``20`` is the GS1 range reserved for in-store
+    numbering. Each worker reserves ``BARCODE_BLOCK_SIZE`` numbers at a time
+    with one atomic ``UPDATE`` committed on its own connection, so workers
+    never hand out the same number and creating a product never scans the
+    products table. Numbers left in a block when a worker exits are skipped.
+    """
+
+    SEQUENCE = "product_barcode"
+
+    def __init__(self, app=None):
+        self.prefix = "20"
+        self.block_size = 50
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.prefix = app.config.get("BARCODE_PREFIX", self.prefix)
+        self.block_size = app.config.get("BARCODE_BLOCK_SIZE", self.block_size)
+
+    @property
+    def _width(self):
+        return 12 - len(self.prefix)
+
+    def format(self, number):
+        body = f"{self.prefix}{number:0{self._width}d}"
+        return body + ean13_check_digit(body)
+
+    def _seed(self, conn):
+        """Start the sequence after the highest code already using the prefix."""
+        from ..models import db, BarcodeSequence, Product
+
+        highest = conn.execute(
+            db.select(db.func.max(Product.barcode)).where(
+                Product.barcode.like(f"{self.prefix}%"),
+                db.func.length(Product.barcode) == 13,
+            )
+        ).scalar()
+        start = int(highest[len(self.prefix):12]) + 1 if highest and highest[:12].isdigit() else 1
+        conn.execute(db.insert(BarcodeSequence).values(name=self.SEQUENCE, next_value=start))
+
+    def _reserve(self, count):
+        """Atomically claim ``count`` numbers; return the first one."""
+        from sqlalchemy.exc import IntegrityError
+        from ..models import db, BarcodeSequence
+
+        for _ in range(3):
+            try:
+                with db.engine.begin() as conn:
+                    updated = conn.execute(
+                        db.update(BarcodeSequence)
+                        .where(BarcodeSequence.name == self.SEQUENCE)
+                        .values(next_value=BarcodeSequence.next_value + count)
+                    ).rowcount
+                    if not updated:
+                        self._seed(conn)
+                        continue
+                    end = conn.execute(
+                        db.select(BarcodeSequence.next_value).where(
+                            BarcodeSequence.name == self.SEQUENCE
+                        )
+                    ).scalar()
+                    return end - count
+            except IntegrityError:
+                # عامل آخر أنشأ التسلسل في نفس اللحظة
+                continue
+        raise RuntimeError("could not reserve barcode numbers")
+
+    def allocate(self, count=1):
+        """Return ``count`` new unique barcodes."""
+        with self._lock:
+            codes = []
+            while len(codes) < count:
+                if self._next >= self._end:
+                    need = max(self.block_size, count - len(codes))
+                    self._next = self._reserve(need)
+                    self._end = self._next + need
+                take = min(count - len(codes), self._end - self._next)
+                codes.extend(self.format(n) for n in range(self._next, self._next + take))
+                self._next += take
+            return codes
+
+    def next(self):
+        return self.allocate(1)[0]
+
+
+# أكواد آمنة كأسماء ملفات في مجلد BarcodeCache على القرص
+_SAFE_CODE = re.compile(r"[0-9A-Za-z_-]{1,64}")
 
 
-def barcode_svg_base64(code):
-    """Generate barcode as base64-encoded SVG data URI (no PIL needed)."""
+def render_barcode_svg(code):
+    """Render ``code`` as Code128 SVG bytes, or ``b""`` if it cannot be encoded."""
+    # python-barcode يُحمّل عند أول رسم فقط حتى لا يبطئ بدء التشغيل
+    from barcode import Code128
+    from barcode.writer import SVGWriter
+
     try:
         buffer = BytesIO()
         Code128(code, writer=SVGWriter()).write(buffer)
-        buffer.seek(0)
-        svg_content = buffer.getvalue().decode("utf-8")
-        svg_base64 = base64.b64encode(svg_content.encode()).decode()
-        return f"data:image/svg+xml;base64,{svg_base64}"
+        return buffer.getvalue()
     except Exception:
-        return ""
+        return b""
+
+
+def svg_data_uri(svg):
+    return "data:image/svg+xml;base64," + base64.b64encode(svg).decode() if svg else ""
+
+
+class BarcodeCache:
+    """Bounded in-memory LRU of rendered barcode SVGs backed by a disk cache.
+
+    Rendering is deterministic, so the code itself addresses the content:
+    ``<output_dir>/<code>.svg`` is reused across workers and restarts, and
+    the memory tier keeps the hottest ``BARCODE_CACHE_SIZE`` codes.
+    """
+
+    def __init__(self, app=None):
+        self.max_size = 512
+        self.output_dir = None
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self.hits = self.disk_hits = self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_size = app.config.get("BARCODE_CACHE_SIZE", self.max_size)
+        self.output_dir = os.path.join(app.root_path, "static", "barcodes")
+
+    def _disk_path(self, code):
+        if self.output_dir and _SAFE_CODE.fullmatch(code):
+            return os.path.join(self.output_dir, f"{code}.svg")
+        return None
+
+    def _remember(self, code, svg):
+        with self._lock:
+            self._items[code] = svg
+            self._items.move_to_end(code)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def get(self, code):
+        """Return the SVG bytes for ``code`` (``b""`` when it cannot be rendered)."""
+        with self._lock:
+            svg = self._items.get(code)
+            if svg is not None:
+                self._items.move_to_end(code)
+                self.hits += 1
+                return svg
+
+        path = self._disk_path(code)
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                svg = f.read()
+            if svg.startswith(b"<?xml"):
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(code, svg)
+                return svg
+
+        with self._lock:
+            self.misses += 1
+        svg = render_barcode_svg(code)
+        if not svg:
+            return svg
+        if path:
+            self._write(path, svg)
+        self._remember(code, svg)
+        return svg
+
+    def _write(self, path, svg):
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(svg)
+        os.replace(tmp, path)
+
+    def prerender(self, codes):
+        """Write disk-cache files for ``codes`` without touching the memory tier."""
+        written = 0
+        for code in codes:
+            path = self._disk_path(code)
+            if not path or os.path.exists(path):
+                continue
+            svg = render_barcode_svg(code)
+            if svg:
+                self._write(path, svg)
+                written += 1
+        return written
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._items),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
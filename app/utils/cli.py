@@ -0,0 +1,30 @@
+import importlib
+
+import click
+
+
+class LazyGroup(click.Group):
+    """CLI group whose module is imported only when the command line needs it.
+
+    ``create_app`` runs for every web cold start, while maintenance commands
+    are only used from ``flask``; the group's module (``"pkg.module:attr"``)
+    is loaded when its commands are listed or invoked.
+    """
+
+    def __init__(self, name, import_name, help=None):
+        super().__init__(name, help=help)
+        self.import_name = import_name
+        self._group = None
+
+    @property
+    def group(self):
+        if self._group is None:
+            module, attr = self.import_name.split(":")
+            self._group = getattr(importlib.import_module(module), attr)
+        return self._group
+
+    def list_commands(self, ctx):
+        return self.group.list_commands(ctx)
+
+    def get_command(self, ctx, cmd_name):
+        return self.group.get_command(ctx, cmd_name)
@@ -0,0 +1,165 @@
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+from flask import Response, stream_with_context
+
+CHUNK_ROWS = 1000
+
+CONTENT_TYPES = {
+    # نفس نوع المحتوى القديم لتصدير العملاء حتى يفتحه Excel مباشرة
+    "csv": "application/vnd.ms-excel; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+class _LineBuffer:
+    def __init__(self):
+        self.parts = []
+
+    def write(self, value):
+        self.parts.append(value)
+
+    def pop(self):
+        data = "".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def csv_stream(header, rows, bom=True):
+    """Yield CSV text in chunks of ``CHUNK_ROWS`` rows."""
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer)
+    if bom:
+        buffer.write("\ufeff")  # BOM لضمان العربية في Excel
+    writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow([_cell_text(v) for v in row])
+        if i % CHUNK_ROWS == 0:
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, non-seekable sink; zipfile then emits data descriptors."""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        "</Relationships>"
+    ),
+}
+
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f"<c><v>{value}</v></c>")
+        else:
+            text = escape(_XML_INVALID.sub("", _cell_text(value)))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f"<row>{''.join(cells)}</row>".encode("utf-8")
+
+
+def xlsx_stream(header, rows, sheet_name="Sheet1"):
+    """Yield a single-sheet XLSX workbook without holding it in memory.
+
+    The sheet uses inline strings (no shared-string table), so each row is
+    written once and can be flushed immediately.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _XLSX_PARTS.items():
+            zf.writestr(name, content)
+        zf.writestr(
+            "xl/workbook.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+            "</workbook>",
+        )
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b"<sheetData>"
+            )
+            sheet.write(_xlsx_row(header))
+            for i, row in enumerate(rows, 1):
+                sheet.write(_xlsx_row(row))
+                if i % CHUNK_ROWS == 0:
+                    yield sink.pop()
+            sheet.write(b"</sheetData></worksheet>")
+        yield sink.pop()
+    yield sink.pop()
+
+
+def stream_response(fmt, filename, header, rows):
+    """Build a streaming download response for ``rows`` in ``fmt`` (csv/xlsx)."""
+    if fmt == "xlsx":
+        body = xlsx_stream(header, rows, sheet_name=filename)
+    else:
+        fmt = "csv"
+        body = csv_stream(header, rows)
+    resp = Response(stream_with_context(body), content_type=CONTENT_TYPES[fmt])
+    resp.headers["Content-Disposition"] = f"attachment; filename={filename}.{fmt}"
+    return resp
@@ -0,0 +1,129 @@
+import gzip
+import hashlib
+import json
+from datetime import timezone
+
+from flask import Response, request
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
+
+IMMUTABLE = "private, max-age=31536000, immutable"
+REVALIDATE = "private, no-cache"
+
+COMPRESSIBLE = {
+    "application/json",
+    "application/javascript",
+    "image/svg+xml",
+    "text/css",
+    "text/html",
+    "text/plain",
+    "text/csv",
+}
+
+
+def content_etag(payload):
+    """ETag for a JSON-serializable payload (stable across workers)."""
+    data = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:20]
+
+
+def _utc(value):
+    if value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def stamp(response, etag, last_modified=None, cache_control=REVALIDATE):
+    """Set validators and ``Cache-Control`` on ``response``."""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _utc(last_modified)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def _fresh(if_none_match, if_modified_since, etag, last_modified):
+    if if_none_match:
+        return if_none_match.contains_weak(etag)
+    if last_modified is not None and if_modified_since:
+        return _utc(last_modified).replace(microsecond=0) <= if_modified_since
+    return False
+
+
+def is_fresh(headers, etag, last_modified=None):
+    """Whether the validators in ``headers`` (lower-case names) match this version."""
+    return _fresh(
+        parse_etags(headers.get("if-none-match")),
+        parse_date(headers.get("if-modified-since")),
+        etag,
+        last_modified,
+    )
+
+
+def validator_headers(etag, last_modified=None, cache_control=REVALIDATE):
+    """The headers ``stamp`` sets, as ``(name, value)`` pairs for an ASGI response."""
+    headers = [("ETag", quote_etag(etag)), ("Cache-Control", cache_control)]
+    if last_modified is not None:
+        headers.append(("Last-Modified", http_date(_utc(last_modified))))
+    return headers
+
+
+def not_modified(etag, last_modified=None, cache_control=REVALIDATE):
+    """Return a ``304`` when the client already holds this version, else ``None``.
+
+    ``If-None-Match`` wins over ``If-Modified-Since`` as in RFC 9110; the
+    weak comparison also matches the ``W/`` tag a compressed copy carries.
+    """
+    if not _fresh(request.if_none_match, request.if_modified_since, etag, last_modified):
+        return None
+    return stamp(Response(status=304), etag, last_modified, cache_control)
+
+
+class Compression:
+    """Gzip responses for clients that send ``Accept-Encoding: gzip``.
+
+    Only buffered bodies of a compressible type and at least
+    ``COMPRESS_MIN_SIZE`` bytes are compressed; streamed exports and static
+    files pass through. A strong ETag becomes weak on the compressed copy.
+    ``COMPRESS_MIN_SIZE=0`` turns compression off (e.g. when a proxy does it).
+    """
+
+    def __init__(self, app=None):
+        self.min_size = 500
+        self.level = 6
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_size = app.config.get("COMPRESS_MIN_SIZE", self.min_size)
+        self.level = app.config.get("COMPRESS_LEVEL", self.level)
+        if self.min_size:
+            app.after_request(self._compress)
+
+    def compress_body(self, data):
+        """``data`` gzipped, or ``None`` when compression is off or it is too small."""
+        if not self.min_size or len(data) < self.min_size:
+            return None
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def _compress(self, response):
+        if (
+            response.status_code < 200
+            or response.status_code >= 300
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        if not request.accept_encodings["gzip"]:
+            return response
+        data = self.compress_body(response.get_data())
+        if data is None:
+            return response
+        response.set_data(data)
+        response.headers["Content-Encoding"] = "gzip"
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,305 @@
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def _iso(value):
+    return value.isoformat(timespec="seconds") if value else None
+
+
+class JobRunner:
+    """Background jobs in the ``jobs`` table, run by threads of the web workers.
+
+    ``enqueue`` inserts a row on its own connection (call it after the
+    caller's commit) and wakes the local threads; the row survives restarts,
+    so a job queued before a crash runs on the next start. Each thread
+    claims the oldest due job with a conditional ``UPDATE`` (safe across
+    processes), runs its handler inside an app context and stores the
+    returned JSON. A failing job is retried ``JOB_MAX_ATTEMPTS`` times with
+    a doubling ``JOB_RETRY_DELAY``. While a handler runs, a heartbeat
+    thread (and every ``report``) refreshes ``started_at``; a job whose
+    heartbeat is older than ``JOB_TIMEOUT`` belonged to a worker that died
+    and is queued again, or failed once it has used its attempts. Only the
+    worker holding the claim can finish a job. Threads start on
+    the first request; ``JOB_WORKERS=0`` leaves the queue to ``flask jobs
+    work`` in a separate process.
+    """
+
+    def __init__(self, app=None):
+        self.workers = 2
+        self.max_attempts = 3
+        self.retry_delay = 10
+        self.poll_interval = 2.0
+        self.timeout = 600
+        self.handlers = {}
+        self._app = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._reaped_at = 0.0
+        self._current = threading.local()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.stop()
+        self._app = app
+        self.workers = app.config.get("JOB_WORKERS", self.workers)
+        self.max_attempts = app.config.get("JOB_MAX_ATTEMPTS", self.max_attempts)
+        self.retry_delay = app.config.get("JOB_RETRY_DELAY", self.retry_delay)
+        self.poll_interval = app.config.get("JOB_POLL_INTERVAL", self.poll_interval)
+        self.timeout = app.config.get("JOB_TIMEOUT", self.timeout)
+        if self.workers:
+            app.before_request(self.start)
+
+    def task(self, kind):
+        """Register the decorated function as the handler for ``kind``."""
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    # --- threads ---------------------------------------------------------
+
+    def start(self):
+        """Start the worker threads of this process (idempotent)."""
+        if self._threads or not self.workers:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            stop = self._stop = threading.Event()
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._loop, args=(self._app, stop), name=f"jobs-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        with self._lock:
+            self._stop.set()
+            self._wake.set()
+            self._threads = []
+
+    def _loop(self, app, stop):
+        from ..models import db
+
+        with app.app_context():
+            while not stop.is_set():
+                try:
+                    ran = self.run_next()
+                except Exception:
+                    app.logger.exception("job queue poll failed")
+                    ran = False
+                finally:
+                    db.session.remove()
+                if not ran:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+
+    # --- queue -----------------------------------------------------------
+
+    def enqueue(self, kind, max_attempts=None, **payload):
+        """Queue a ``kind`` job with JSON-serializable ``payload``; return its id."""
+        from ..models import db, Job
+
+        if kind not in self.handlers:
+            raise KeyError(f"unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        with db.engine.begin() as conn:
+            conn.execute(db.insert(Job).values(
+                id=job_id,
+                kind=kind,
+                payload=json.dumps(payload),
+                max_attempts=max_attempts or self.max_attempts,
+                run_after=datetime.utcnow(),
+            ))
+        self._wake.set()
+        return job_id
+
+    def _requeue_abandoned(self, now):
+        from ..models import db, Job
+
+        # مرة كل دقيقة على الأكثر حتى لا يكتب الفحص الدوري في القاعدة
+        if time.monotonic() - self._reaped_at < min(self.timeout, 60):
+            return
+        self._reaped_at = time.monotonic()
+        # لا نبض منذ JOB_TIMEOUT: العامل توقف (المهمة الحية تحدّث started_at باستمرار)
+        stale = (Job.status == RUNNING) & (Job.started_at < now - timedelta(seconds=self.timeout))
+        with db.engine.begin() as conn:
+            conn.execute(
+                db.update(Job)
+                .where(stale, Job.attempts >= Job.max_attempts)
+                .values(
+                    status=FAILED,
+                    error=f"JobAbandoned: no heartbeat for {self.timeout}s",
+                    finished_at=now,
+                )
+            )
+            conn.execute(db.update(Job).where(stale).values(status=QUEUED, run_after=now))
+
+    def _claim(self):
+        from ..models import db, Job
+
+        now = datetime.utcnow()
+        worker = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        self._requeue_abandoned(now)
+        with db.engine.connect() as conn:
+            due = conn.execute(
+                db.select(Job.id)
+                .where(Job.status == QUEUED, Job.run_after <= now)
+                .order_by(Job.run_after)
+                .limit(5)
+            ).scalars().all()
+        for job_id in due:
+            with db.engine.begin() as conn:
+                claimed = conn.execute(
+                    db.update(Job)
+                    .where(Job.id == job_id, Job.status == QUEUED)
+                    .values(status=RUNNING, attempts=Job.attempts + 1, started_at=now, worker=worker)
+                ).rowcount
+            if claimed:
+                return job_id, worker
+        return None
+
+    @staticmethod
+    def _owned(job_id, worker):
+        from ..models import Job
+
+        return (Job.id == job_id) & (Job.worker == worker) & (Job.status == RUNNING)
+
+    def _heartbeat(self, job_id, worker):
+        """Refresh ``started_at`` every third of ``JOB_TIMEOUT`` until the returned event is set."""
+        from ..models import db, Job
+
+        engine, stop, app = db.engine, threading.Event(), self._app
+
+        def beat():
+            while not stop.wait(self.timeout / 3):
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(
+                            db.update(Job).where(self._owned(job_id, worker)).values(started_at=datetime.utcnow())
+                        )
+                except Exception:
+                    app.logger.warning("heartbeat of job %s failed", job_id, exc_info=True)
+
+        threading.Thread(target=beat, name=f"{threading.current_thread().name}-heartbeat", daemon=True).start()
+        return stop
+
+    def run_next(self):
+        """Claim and run one due job in the current app context; return whether one ran."""
+        from ..models import db, Job
+
+        claimed = self._claim()
+        if claimed is None:
+            return False
+        job_id, worker = claimed
+        job = db.session.get(Job, job_id)
+        kind, payload, attempts, max_attempts = job.kind, json.loads(job.payload), job.attempts, job.max_attempts
+        db.session.rollback()
+        values = {"finished_at": None}
+        self._current.job_id, self._current.worker = job_id, worker
+        beating = self._heartbeat(job_id, worker)
+        try:
+            handler = self.handlers[kind]
+            result = handler(**payload)
+        except Exception:
+            db.session.rollback()
+            error = traceback.format_exc(limit=5)
+            self._app.logger.warning("job %s (%s) attempt %d failed", job_id, kind, attempts, exc_info=True)
+            if attempts < max_attempts:
+                delay = self.retry_delay * 2 ** (attempts - 1)
+                values.update(status=QUEUED, error=error, run_after=datetime.utcnow() + timedelta(seconds=delay))
+            else:
+                values.update(status=FAILED, error=error, finished_at=datetime.utcnow())
+        else:
+            values.update(status=DONE, error=None, result=json.dumps(result), finished_at=datetime.utcnow())
+        finally:
+            beating.set()
+            self._current.job_id = None
+        with db.engine.begin() as conn:
+            finished = conn.execute(db.update(Job).where(self._owned(job_id, worker)).values(**values)).rowcount
+        if not finished:
+            # فُقد النبض فأُعيدت المهمة لعامل آخر؛ حالته هي التي تبقى
+            self._app.logger.warning("job %s (%s) was reclaimed while running; outcome dropped", job_id, kind)
+        return True
+
+    def report(self, result):
+        """Store a partial ``result`` for the job this thread is running (no-op outside a job).
+
+        Lets long handlers publish progress that ``/api/jobs/<id>`` shows while
+        the job is still running; a failed attempt keeps the last report.
+        Doubles as a heartbeat.
+        """
+        from ..models import db, Job
+
+        job_id = getattr(self._current, "job_id", None)
+        if job_id is None:
+            return
+        with db.engine.begin() as conn:
+            conn.execute(
+                db.update(Job)
+                .where(self._owned(job_id, self._current.worker))
+                .values(result=json.dumps(result), started_at=datetime.utcnow())
+            )
+
+    def run_pending(self):
+        """Run due jobs until none is left; return how many ran."""
+        count = 0
+        while self.run_next():
+            count += 1
+        return count
+
+    # --- status ----------------------------------------------------------
+
+    @staticmethod
+    def to_dict(job):
+        return {
+            "id": job.id,
+            "kind": job.kind,
+            "status": job.status,
+            "attempts": job.attempts,
+            "max_attempts": job.max_attempts,
+            "result": json.loads(job.result) if job.result else None,
+            "error": job.error.strip().splitlines()[-1] if job.error else None,
+            "created_at": _iso(job.created_at),
+            "started_at": _iso(job.started_at),
+            "finished_at": _iso(job.finished_at),
+        }
+
+    def get(self, job_id):
+        from ..models import db, Job
+
+        job = db.session.get(Job, job_id)
+        return self.to_dict(job) if job else None
+
+    def recent(self, status=None, limit=50):
+        from ..models import Job
+
+        query = Job.query
+        if status:
+            query = query.filter(Job.status == status)
+        return [self.to_dict(j) for j in query.order_by(Job.created_at.desc()).limit(limit)]
+
+    def purge(self, days):
+        """Delete finished jobs older than ``days``; return their results."""
+        from ..models import db, Job
+
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        old = (Job.status.in_([DONE, FAILED])) & (Job.finished_at < cutoff)
+        results = [
+            json.loads(r) if r else None for r in db.session.execute(db.select(Job.result).where(old)).scalars()
+        ]
+        db.session.execute(db.delete(Job).where(old))
+        db.session.commit()
+        return results
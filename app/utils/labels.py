@@ -0,0 +1,151 @@
+from xml.sax.saxutils import escape
+
+
+class LabelStock:
+    """Geometry of a label sheet, all in millimetres."""
+
+    def __init__(self, title, page_w, page_h, cols, rows, label_w, label_h,
+                 margin_x=0.0, margin_y=0.0, gap_x=0.0, gap_y=0.0):
+        self.title = title
+        self.page_w, self.page_h = page_w, page_h
+        self.cols, self.rows = cols, rows
+        self.label_w, self.label_h = label_w, label_h
+        self.margin_x, self.margin_y = margin_x, margin_y
+        self.gap_x, self.gap_y = gap_x, gap_y
+
+    @property
+    def per_page(self):
+        return self.cols * self.rows
+
+    def origin(self, slot):
+        """Top-left corner of label ``slot`` (0-based, filled right to left)."""
+        row, col = divmod(slot, self.cols)
+        col = self.cols - 1 - col  # ترتيب عربي: من اليمين لليسار
+        return (
+            self.margin_x + col * (self.label_w + self.gap_x),
+            self.margin_y + row * (self.label_h + self.gap_y),
+        )
+
+
+LABEL_STOCKS = {
+    "a4-3x8": LabelStock("A4 - 24 ملصق (70×37)", 210, 297, 3, 8, 70, 37, 0, 0.5),
+    "a4-4x10": LabelStock("A4 - 40 ملصق (52.5×29.7)", 210, 297, 4, 10, 52.5, 29.7),
+    "a4-5x13": LabelStock("A4 - 65 ملصق (38.1×21.2)", 210, 297, 5, 13, 38.1, 21.2, 4.7, 10.7, 2.5, 0),
+    "roll-50x25": LabelStock("رول حراري 50×25", 50, 25, 1, 1, 50, 25),
+    "roll-40x30": LabelStock("رول حراري 40×30", 40, 30, 1, 1, 40, 30),
+}
+DEFAULT_STOCK = "a4-3x8"
+
+
+def barcode_path(code):
+    """Return ``(modules, path_d)`` drawing Code128 bars in module units.
+
+    One ``<path>`` per barcode keeps the symbol a fraction of the size of the
+    rect-per-bar SVG that python-barcode writes.
+    """
+    from barcode import Code128
+
+    modules = Code128(code).build()[0]
+    parts = []
+    x = 0
+    while x < len(modules):
+        if modules[x] == "1":
+            start = x
+            while x < len(modules) and modules[x] == "1":
+                x += 1
+            parts.append(f"M{start} 0h{x - start}v1h-{x - start}z")
+        else:
+            x += 1
+    return len(modules), "".join(parts)
+
+
+def _label(stock, x, y, product, symbol_id):
+    w, h = stock.label_w, stock.label_h
+    pad = min(w, h) * 0.06
+    name_size = h * 0.11
+    small_size = h * 0.08
+    cx = x + w / 2
+    name = product["name"]
+    max_chars = int(w / (name_size * 0.6))
+    if len(name) > max_chars:
+        name = name[:max_chars - 1] + "…"
+    bars_y = y + pad + name_size * 1.3
+    bars_h = h * 0.38
+    parts = [
+        f'<text x="{cx:.2f}" y="{y + pad + name_size:.2f}" font-size="{name_size:.2f}" '
+        f'font-weight="bold" text-anchor="middle">{escape(name)}</text>',
+    ]
+    if symbol_id:
+        parts.append(
+            f'<use href="#{symbol_id}" x="{x + pad * 2:.2f}" y="{bars_y:.2f}" '
+            f'width="{w - pad * 4:.2f}" height="{bars_h:.2f}"/>'
+        )
+    parts.append(
+        f'<text x="{cx:.2f}" y="{bars_y + bars_h + small_size * 1.1:.2f}" font-size="{small_size:.2f}" '
+        f'text-anchor="middle" font-family="monospace">{escape(product["barcode"])}</text>'
+    )
+    parts.append(
+        f'<text x="{cx:.2f}" y="{y + h - pad:.2f}" font-size="{name_size:.2f}" font-weight="bold" '
+        f'fill="#d32f2f" text-anchor="middle">{product["price"]:.2f} ج.م</text>'
+    )
+    return "".join(parts)
+
+
+def label_sheet(products, quantities, stock):
+    """Yield an HTML document of SVG pages laying out the requested labels.
+
+    ``products`` maps product id to a dict with name/price/barcode and
+    ``quantities`` is an ordered list of ``(product_id, copies)``. Each
+    distinct barcode is drawn once as a ``<symbol>``; every label on every
+    page references it with ``<use>``, so the document grows by a few hundred
+    bytes per label rather than a full barcode.
+    """
+    yield (
+        '<!DOCTYPE html><html lang="ar" dir="rtl"><head><meta charset="UTF-8">'
+        "<title>طباعة باركود</title><style>"
+        f"@page {{ size: {stock.page_w}mm {stock.page_h}mm; margin: 0; }}"
+        "body { margin: 0; font-family: 'Segoe UI', Tahoma, sans-serif; }"
+        "svg.page { display: block; page-break-after: always; break-after: page; }"
+        "</style></head><body>"
+    )
+
+    symbols = {}
+    defs = []
+    for pid, _ in quantities:
+        code = products[pid]["barcode"]
+        if code in symbols:
+            continue
+        try:
+            modules, d = barcode_path(code)
+        except Exception:
+            symbols[code] = None
+            continue
+        symbols[code] = f"bc{len(symbols)}"
+        defs.append(
+            f'<symbol id="{symbols[code]}" viewBox="0 0 {modules} 1" '
+            f'preserveAspectRatio="none"><path d="{d}"/></symbol>'
+        )
+    yield (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="0" height="0" style="position:absolute">'
+        f"<defs>{''.join(defs)}</defs></svg>"
+    )
+
+    page_open = (
+        f'<svg class="page" xmlns="http://www.w3.org/2000/svg" width="{stock.page_w}mm" '
+        f'height="{stock.page_h}mm" viewBox="0 0 {stock.page_w} {stock.page_h}">'
+    )
+    slot = 0
+    labels = []
+    for pid, copies in quantities:
+        product = products[pid]
+        for _ in range(copies):
+            x, y = stock.origin(slot)
+            labels.append(_label(stock, x, y, product, symbols[product["barcode"]]))
+            slot += 1
+            if slot == stock.per_page:
+                yield page_open + "".join(labels) + "</svg>"
+                slot, labels = 0, []
+    if labels:
+        yield page_open + "".join(labels) + "</svg>"
+    yield "</body></html>"
+
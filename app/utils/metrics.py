@@ -0,0 +1,213 @@
+import hmac
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from flask import abort, g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _quantile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+class RouteStats:
+    """Counters plus a window of recent latencies for one endpoint."""
+
+    __slots__ = ("count", "errors", "seconds", "sql_count", "sql_seconds", "samples")
+
+    def __init__(self, window):
+        self.count = self.errors = self.sql_count = 0
+        self.seconds = self.sql_seconds = 0.0
+        self.samples = deque(maxlen=window)
+
+
+class Metrics:
+    """Opt-in request and SQL instrumentation (``METRICS_ENABLED``).
+
+    Request hooks time every request per endpoint (requests that raise are
+    recorded as 500 on teardown), and
+    cursor listeners on the engine count statements and database time for the
+    request that ran them. Each endpoint keeps totals plus its last
+    ``METRICS_WINDOW`` latencies, from which p50/p95/p99 are read at scrape
+    time. ``/metrics`` serves them as Prometheus text to admins, or to a
+    scraper sending ``METRICS_TOKEN`` as a bearer token. Statements slower
+    than ``SLOW_QUERY_MS`` are logged, a ``SLOW_QUERY_SAMPLE`` fraction of
+    them, with the endpoint that issued them.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.window = 1024
+        self.token = None
+        self.slow_query_ms = 200
+        self.slow_query_sample = 1.0
+        self._lock = threading.Lock()
+        self._routes = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("METRICS_ENABLED", False)
+        if not self.enabled:
+            return
+        self.window = app.config.get("METRICS_WINDOW", self.window)
+        self.token = app.config.get("METRICS_TOKEN") or None
+        self.slow_query_ms = app.config.get("SLOW_QUERY_MS", self.slow_query_ms)
+        self.slow_query_sample = app.config.get("SLOW_QUERY_SAMPLE", self.slow_query_sample)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule("/metrics", "metrics", self._metrics_view)
+
+    def watch(self, engine):
+        """Attach the statement counters to ``engine`` (no-op when disabled)."""
+        if self.enabled:
+            event.listen(engine, "before_cursor_execute", self._before_cursor)
+            event.listen(engine, "after_cursor_execute", self._after_cursor)
+            event.listen(engine, "handle_error", self._cursor_error)
+
+    # --- hooks -----------------------------------------------------------
+
+    def _start_request(self):
+        g._metrics = {"start": time.perf_counter(), "sql_count": 0, "sql_seconds": 0.0}
+
+    def _finish_request(self, response):
+        state = g.pop("_metrics", None)
+        if state is None:
+            return response
+        elapsed = time.perf_counter() - state["start"]
+        endpoint = request.endpoint or "unmatched"
+        self.observe(endpoint, elapsed, state["sql_count"], state["sql_seconds"], response.status_code)
+        response.headers["Server-Timing"] = (
+            f'app;dur={elapsed * 1000:.1f}, '
+            f'db;dur={state["sql_seconds"] * 1000:.1f};desc="{state["sql_count"]} queries"'
+        )
+        logger.debug(
+            "request endpoint=%s method=%s status=%s ms=%.1f sql=%d sql_ms=%.1f",
+            endpoint, request.method, response.status_code, elapsed * 1000,
+            state["sql_count"], state["sql_seconds"] * 1000,
+        )
+        return response
+
+    def _teardown_request(self, exc):
+        # الطلبات التي رفعت استثناءً لا تصل إلى after_request؛ تُسجَّل هنا كـ 500
+        state = g.pop("_metrics", None)
+        if state is None:
+            return
+        elapsed = time.perf_counter() - state["start"]
+        self.observe(request.endpoint or "unmatched", elapsed, state["sql_count"], state["sql_seconds"], 500)
+
+    def _before_cursor(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    def _after_cursor(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("metrics_started")
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        endpoint = None
+        if has_request_context():
+            endpoint = request.endpoint
+            state = g.get("_metrics")
+            if state is not None:
+                state["sql_count"] += 1
+                state["sql_seconds"] += elapsed
+        if (
+            self.slow_query_ms
+            and elapsed * 1000 >= self.slow_query_ms
+            and random.random() < self.slow_query_sample
+        ):
+            logger.warning(
+                "slow query ms=%.1f endpoint=%s executemany=%s sql=%s",
+                elapsed * 1000, endpoint or "-", executemany, " ".join(statement.split())[:500],
+            )
+
+    def _cursor_error(self, context):
+        # استعلام فشل لا يمر بـ after_cursor_execute؛ نزيل توقيته من الاتصال
+        started = context.connection.info.get("metrics_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+    # --- store -----------------------------------------------------------
+
+    def observe(self, endpoint, seconds, sql_count=0, sql_seconds=0.0, status=200):
+        with self._lock:
+            stats = self._routes.get(endpoint)
+            if stats is None:
+                stats = self._routes[endpoint] = RouteStats(self.window)
+            stats.count += 1
+            stats.errors += status >= 500
+            stats.seconds += seconds
+            stats.sql_count += sql_count
+            stats.sql_seconds += sql_seconds
+            stats.samples.append(seconds)
+
+    def snapshot(self):
+        """Per-endpoint totals and latency quantiles (seconds)."""
+        with self._lock:
+            routes = {
+                name: (s.count, s.errors, s.seconds, s.sql_count, s.sql_seconds, sorted(s.samples))
+                for name, s in self._routes.items()
+            }
+        return {
+            name: {
+                "count": count,
+                "errors": errors,
+                "seconds": seconds,
+                "sql_count": sql_count,
+                "sql_seconds": sql_seconds,
+                "quantiles": {q: _quantile(samples, q) for q in QUANTILES} if samples else {},
+            }
+            for name, (count, errors, seconds, sql_count, sql_seconds, samples) in routes.items()
+        }
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self):
+        """The snapshot in the Prometheus text exposition format."""
+        routes = sorted(self.snapshot().items())
+        lines = [
+            "# HELP verdi_request_seconds Request wall time per endpoint (recent window quantiles).",
+            "# TYPE verdi_request_seconds summary",
+        ]
+        for name, s in routes:
+            label = f'endpoint="{_escape(name)}"'
+            for q, value in s["quantiles"].items():
+                lines.append(f'verdi_request_seconds{{{label},quantile="{q}"}} {value:.6f}')
+            lines.append(f"verdi_request_seconds_sum{{{label}}} {s['seconds']:.6f}")
+            lines.append(f"verdi_request_seconds_count{{{label}}} {s['count']}")
+        for metric, key, kind, help_text in (
+            ("verdi_request_errors_total", "errors", "counter", "Responses with status 5xx."),
+            ("verdi_sql_statements_total", "sql_count", "counter", "SQL statements run by requests."),
+            ("verdi_sql_seconds_total", "sql_seconds", "counter", "Time spent in SQL by requests."),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, s in routes:
+                value = s[key]
+                value = f"{value:.6f}" if isinstance(value, float) else value
+                lines.append(f'{metric}{{endpoint="{_escape(name)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def _metrics_view(self):
+        from flask_login import current_user
+
+        header = request.headers.get("Authorization", "")
+        scraper = bool(self.token) and hmac.compare_digest(header.encode(), f"Bearer {self.token}".encode())
+        admin = current_user.is_authenticated and getattr(current_user, "role", None) == "admin"
+        if not (scraper or admin):
+            abort(403)
+        return self.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
@@ -0,0 +1,114 @@
+import base64
+import json
+
+from flask import request, url_for
+from sqlalchemy import literal, tuple_
+
+PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+
+class Page:
+    """One page of a keyset-paginated query."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.next_url = None
+        self.prev_url = None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """Return the cursor values, or ``None`` for a missing/garbled cursor."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def keyset_page(query, keys, after=None, before=None, descending=False, per_page=PER_PAGE):
+    """Seek-paginate ``query`` ordered by ``keys``.
+
+    ``keys`` is a tuple of column expressions whose last element is unique
+    (normally the primary key), so every row has a distinct position. Instead
+    of ``OFFSET`` the page starts right after (or before) the row encoded in
+    the cursor, which keeps deep pages as cheap as the first one.
+    """
+    cursor = decode_cursor(before) or decode_cursor(after)
+    if cursor is not None and len(cursor) != len(keys):
+        cursor = None
+    backwards = cursor is not None and decode_cursor(before) is not None
+    scan_desc = descending != backwards
+
+    if cursor is not None:
+        row, seek = tuple_(*keys), tuple_(*[literal(v) for v in cursor])
+        query = query.filter(row < seek if scan_desc else row > seek)
+    query = query.order_by(*[k.desc() if scan_desc else k.asc() for k in keys])
+
+    rows = query.add_columns(*keys).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    page = Page([r[0] for r in rows])
+    if rows:
+        first, last = encode_cursor(rows[0][1:]), encode_cursor(rows[-1][1:])
+        if backwards:
+            page.prev_cursor = first if has_more else None
+            page.next_cursor = last
+        else:
+            page.prev_cursor = first if cursor is not None else None
+            page.next_cursor = last if has_more else None
+    return page
+
+
+def paginate(query, sorts, default_sort, default_desc=False, per_page=PER_PAGE):
+    """Keyset-paginate ``query`` from the current request's arguments.
+
+    ``sorts`` maps a ``sort`` argument value to its key tuple. ``dir``
+    (asc/desc), ``after``/``before`` and ``per_page`` are read from the query
+    string; the returned page carries ready-made ``next_url``/``prev_url``
+    that keep every other argument (filters, sort) intact.
+    """
+    sort = request.args.get("sort", default_sort)
+    if sort not in sorts:
+        sort = default_sort
+    direction = request.args.get("dir")
+    descending = default_desc if direction not in ("asc", "desc") else direction == "desc"
+    try:
+        per_page = max(1, min(int(request.args.get("per_page", per_page)), MAX_PER_PAGE))
+    except ValueError:
+        pass
+
+    page = keyset_page(
+        query,
+        sorts[sort],
+        after=request.args.get("after"),
+        before=request.args.get("before"),
+        descending=descending,
+        per_page=per_page,
+    )
+    args = {k: v for k, v in request.args.items() if k not in ("after", "before")}
+    args.update(request.view_args or {})
+    if page.next_cursor:
+        page.next_url = url_for(request.endpoint, **args, after=page.next_cursor)
+    if page.prev_cursor:
+        page.prev_url = url_for(request.endpoint, **args, before=page.prev_cursor)
+    return page
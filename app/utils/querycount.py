@@ -0,0 +1,40 @@
+from sqlalchemy import event
+
+
+class TooManyQueries(AssertionError):
+    """Raised by ``QueryCounter`` when a block runs more statements than allowed."""
+
+
+class QueryCounter:
+    """Record the SQL statements sent to ``engine`` inside a ``with`` block.
+
+    With ``limit`` set, leaving the block raises ``TooManyQueries`` listing
+    every statement, which makes an N+1 regression obvious::
+
+        with QueryCounter(db.engine, limit=3):
+            client.get("/sales")
+    """
+
+    def __init__(self, engine, limit=None):
+        self.engine = engine
+        self.limit = limit
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(" ".join(statement.split()))
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+        if exc_type is None and self.limit is not None and self.count > self.limit:
+            listing = "\n".join(f"  {i}. {s}" for i, s in enumerate(self.statements, 1))
+            raise TooManyQueries(f"{self.count} statements, expected at most {self.limit}:\n{listing}")
+        return False
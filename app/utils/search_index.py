@@ -0,0 +1,241 @@
+import heapq
+import re
+import threading
+import time
+from collections import defaultdict
+from itertools import chain, islice
+
+# تشكيل + تطويل
+_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u0640]")
+_ARABIC_FOLD = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ة": "ه",
+    "ى": "ي",
+    "ئ": "ي",
+    "ؤ": "و",
+})
+_SPACES = re.compile(r"\s+")
+
+GRAM = 3
+
+
+def normalize(text):
+    """Fold case, Arabic letter variants and diacritics for matching."""
+    text = _DIACRITICS.sub("", (text or "").lower()).translate(_ARABIC_FOLD)
+    return _SPACES.sub(" ", text).strip()
+
+
+def _grams(text):
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+class ProductSearchIndex:
+    """Process-local search index over the product catalog.
+
+    Holds an exact barcode map for scanner hits, a word-prefix map for short
+    queries (ranked before their other substring matches, found by a scan)
+    and a trigram map for substring matches on normalized names and
+    barcodes. Writers call ``invalidate`` with the touched product ids after
+    commit; those rows are reloaded in one query on the next search. Changes
+    made by other workers are found through the catalog version every write
+    stamps (``catalog.touch``): at most every ``PRODUCT_INDEX_CHECK_SECONDS``
+    a search asks for products stamped after the version the index holds and
+    reloads just those. The whole index is still rebuilt after
+    ``PRODUCT_INDEX_TTL`` seconds.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 300
+        self.check_seconds = 1.0
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._checked_at = None
+        self._version = 0
+        self._dirty = set()
+        self._reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get("PRODUCT_INDEX_TTL", self.ttl)
+        self.check_seconds = app.config.get("PRODUCT_INDEX_CHECK_SECONDS", self.check_seconds)
+
+    def _reset(self):
+        self._rows = {}
+        self._haystack = {}
+        self._by_barcode = {}
+        self._prefixes = defaultdict(set)
+        self._grams = defaultdict(set)
+
+    def invalidate(self, product_ids=None):
+        """Mark products as stale; ``None`` drops the whole index."""
+        with self._lock:
+            if product_ids is None:
+                self._loaded_at = None
+                self._dirty.clear()
+            else:
+                self._dirty.update(int(pid) for pid in product_ids if pid)
+
+    def _rows_query(self, product_ids=None):
+        from ..models import db, Product
+
+        query = db.select(Product.id, Product.name, Product.price, Product.stock_qty, Product.barcode)
+        if product_ids is not None:
+            query = query.where(Product.id.in_(product_ids))
+        return query
+
+    def _load_rows(self, product_ids=None):
+        from ..models import db
+
+        return db.session.execute(self._rows_query(product_ids)).all()
+
+    def _add(self, row):
+        pid = row.id
+        name = normalize(row.name)
+        barcode = (row.barcode or "").lower()
+        self._rows[pid] = {
+            "id": pid,
+            "name": row.name,
+            "price": row.price,
+            "stock_qty": row.stock_qty,
+            "barcode": row.barcode,
+        }
+        self._haystack[pid] = (name, barcode)
+        self._by_barcode[barcode] = pid
+        for word in filter(None, name.split(" ") + [barcode]):
+            for n in range(1, GRAM):
+                self._prefixes[word[:n]].add(pid)
+        for gram in _grams(name) | _grams(barcode):
+            self._grams[gram].add(pid)
+
+    def _remove(self, pid):
+        if pid not in self._rows:
+            return
+        name, barcode = self._haystack.pop(pid)
+        del self._rows[pid]
+        if self._by_barcode.get(barcode) == pid:
+            del self._by_barcode[barcode]
+        for word in filter(None, name.split(" ") + [barcode]):
+            for n in range(1, GRAM):
+                self._prefixes[word[:n]].discard(pid)
+        for gram in _grams(name) | _grams(barcode):
+            self._grams[gram].discard(pid)
+
+    def _take_stale(self):
+        """What the next refresh reloads: ``(ids, query)``.
+
+        ``ids`` is ``None`` for the whole index, else the dirty ids; ``query``
+        (or ``None`` when no check is due) reads the shared catalog version,
+        and its rows go to ``_merge``.
+        """
+        from ..models import db, CatalogVersion
+
+        expired = self._loaded_at is None or (
+            self.ttl and time.monotonic() - self._loaded_at > self.ttl
+        )
+        ids = list(self._dirty)
+        self._dirty.clear()
+        if expired:
+            return None, db.select(db.func.max(CatalogVersion.version))
+        if self._checked_at is not None and time.monotonic() - self._checked_at < self.check_seconds:
+            return ids, None
+        return ids, db.select(CatalogVersion.product_id, CatalogVersion.version).where(
+            CatalogVersion.version > self._version
+        )
+
+    def _merge(self, ids, rows):
+        """``(ids, version)`` after the ``_take_stale`` query returned ``rows``."""
+        if ids is None:
+            return None, rows[0][0] or 0
+        # منتجات عدّلها عامل آخر (أو حذفها) بعد آخر نسخة محملة
+        ids = sorted(set(ids) | {pid for pid, _ in rows})
+        return ids, max([self._version] + [version for _, version in rows])
+
+    def _apply(self, ids, rows, version=None):
+        if ids is None:
+            self._reset()
+            self._loaded_at = time.monotonic()
+        for pid in ids or ():
+            self._remove(pid)
+        for row in rows:
+            self._add(row)
+        if version is not None:
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        from ..models import db
+
+        ids, check = self._take_stale()
+        version = None
+        if check is not None:
+            ids, version = self._merge(ids, db.session.execute(check).all())
+        rows = self._load_rows(ids) if ids is None or ids else []
+        self._apply(ids, rows, version)
+
+    async def refresh_async(self, conn):
+        """Bring the index up to date over an ``AsyncConnection``.
+
+        The queries run outside the lock so the event loop never waits on it;
+        call ``search(..., refresh=False)`` afterwards.
+        """
+        with self._lock:
+            ids, check = self._take_stale()
+        version = None
+        if check is not None:
+            rows = (await conn.execute(check)).all()
+            with self._lock:
+                ids, version = self._merge(ids, rows)
+        rows = (await conn.execute(self._rows_query(ids))).all() if ids is None or ids else []
+        with self._lock:
+            self._apply(ids, rows, version)
+
+    def _candidates(self, nq):
+        if len(nq) < GRAM:
+            # بدايات الكلمات أولًا، ثم أي موضع داخل الاسم أو الباركود (كـ ILIKE '%q%')؛
+            # المسح في الذاكرة ويتوقف عند امتلاء limit
+            prefixed = self._prefixes.get(nq, set())
+            inside = (
+                pid for pid, (name, barcode) in self._haystack.items()
+                if pid not in prefixed and (nq in name or nq in barcode)
+            )
+            return chain(prefixed, inside)
+        postings = sorted(
+            (self._grams.get(g, set()) for g in _grams(nq)), key=len
+        )
+        return set.intersection(*postings) if postings[0] else set()
+
+    def search(self, q, limit=10, refresh=True):
+        """Return up to ``limit`` product dicts matching ``q``.
+
+        An exact barcode hit always comes first; like the old ``ILIKE ... LIMIT``
+        query, the remaining matches come in no particular order.
+        """
+        with self._lock:
+            if refresh:
+                self._ensure_fresh()
+            q = (q or "").strip()
+            if not q:
+                return [self._rows[pid] for pid in heapq.nsmallest(limit, self._rows)]
+
+            results = []
+            exact = self._by_barcode.get(q.lower())
+            if exact is not None:
+                results.append(self._rows[exact])
+
+            nq = normalize(q)
+            candidates = self._candidates(nq)
+            if len(nq) >= GRAM:
+                # الـ trigrams تعطي مرشحين فقط؛ نتحقق من التطابق الفعلي
+                candidates = (
+                    pid for pid in candidates
+                    if nq in self._haystack[pid][0] or nq in self._haystack[pid][1]
+                )
+            candidates = (pid for pid in candidates if pid != exact)
+            results.extend(
+                self._rows[pid] for pid in islice(candidates, limit - len(results))
+            )
+            return results
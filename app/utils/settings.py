@@ -0,0 +1,95 @@
+import threading
+import time
+import uuid
+
+
+class SettingsStore:
+    """Process-local, typed cache of the ``settings`` table.
+
+    ``FIELDS`` declares every setting with its type and default; reads never
+    touch the database while the cache is fresh. Each write also stores a new
+    random stamp under ``VERSION_KEY``. Workers compare that stamp at most
+    every ``SETTINGS_CHECK_SECONDS`` and reload the table only when it has
+    changed, so an edit made on one worker reaches the others without a
+    restart.
+    """
+
+    FIELDS = {
+        "logo_path": (str, ""),
+    }
+    VERSION_KEY = "_version"
+
+    def __init__(self, app=None):
+        self.check_seconds = 2.0
+        self._lock = threading.Lock()
+        self._values = {}
+        self._version = None
+        self._checked_at = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.check_seconds = app.config.get("SETTINGS_CHECK_SECONDS", self.check_seconds)
+
+    def _parse(self, key, raw):
+        kind, default = self.FIELDS[key]
+        if raw is None:
+            return default
+        try:
+            return kind(raw)
+        except ValueError:
+            return default
+
+    def _load(self):
+        from ..models import Setting
+
+        raw = dict(Setting.query.with_entities(Setting.key, Setting.value).all())
+        self._version = raw.get(self.VERSION_KEY, "")
+        self._values = {key: self._parse(key, raw.get(key)) for key in self.FIELDS}
+
+    def _refresh(self):
+        from ..models import db, Setting
+
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_seconds:
+            return
+        if self._version is None:
+            self._load()
+        else:
+            stamp = db.session.execute(
+                db.select(Setting.value).where(Setting.key == self.VERSION_KEY)
+            ).scalar() or ""
+            if stamp != self._version:
+                self._load()
+        self._checked_at = now
+
+    def get(self, key):
+        with self._lock:
+            self._refresh()
+            return self._values[key]
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return dict(self._values)
+
+    def update(self, **values):
+        """Persist ``values`` and bump the version stamp in one commit."""
+        from ..models import db, Setting
+
+        unknown = set(values) - set(self.FIELDS)
+        if unknown:
+            raise KeyError(", ".join(sorted(unknown)))
+        stamp = uuid.uuid4().hex
+        rows = {key: "" if value is None else str(value) for key, value in values.items()}
+        rows[self.VERSION_KEY] = stamp
+        for key, value in rows.items():
+            setting = db.session.get(Setting, key)
+            if setting:
+                setting.value = value
+            else:
+                db.session.add(Setting(key=key, value=value))
+        db.session.commit()
+        with self._lock:
+            self._load()  # نفس العامل يرى التعديل فورًا
+            self._checked_at = time.monotonic()
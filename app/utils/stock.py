@@ -0,0 +1,122 @@
+import random
+import time
+
+from flask import current_app
+from sqlalchemy.exc import OperationalError
+
+
+class InsufficientStock(Exception):
+    """Raised in strict stock mode when a sale would drive stock below zero."""
+
+    def __init__(self, product_ids):
+        super().__init__(f"insufficient stock for products {sorted(product_ids)}")
+        self.product_ids = list(product_ids)
+
+
+def collect_deltas(items, key="qty"):
+    """Sum quantities per product id, skipping lines without a product."""
+    deltas = {}
+    for it in items:
+        if it.get("id"):
+            pid = int(it["id"])
+            deltas[pid] = deltas.get(pid, 0) + int(it.get(key, 0))
+    return deltas
+
+
+def increment_stock(deltas):
+    """Atomically add ``deltas`` ({product_id: qty}) to stock in one UPDATE."""
+    from ..models import db, Product
+
+    if not deltas:
+        return
+    delta = db.case(deltas, value=Product.id, else_=0)
+    db.session.execute(
+        db.update(Product)
+        .where(Product.id.in_(deltas))
+        .values(stock_qty=Product.stock_qty + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def decrement_stock(deltas, mode=None):
+    """Atomically subtract ``deltas`` from stock; return what was removed.
+
+    The arithmetic happens in the database, so concurrent sales of the same
+    product never lose updates. In ``strict`` mode the statement only touches
+    rows with enough stock and :class:`InsufficientStock` is raised if any
+    product was short. In ``clamp`` mode short products are locked and set to
+    zero instead. The result maps each product id to the quantity actually
+    taken off, which differs from ``deltas`` only for clamped products.
+    ``mode`` overrides the ``STOCK_MODE`` setting.
+    """
+    from ..models import db, Product
+
+    if not deltas:
+        return {}
+    delta = db.case(deltas, value=Product.id, else_=0)
+    take = (
+        db.update(Product)
+        .where(Product.id.in_(deltas), Product.stock_qty >= delta)
+        .values(stock_qty=Product.stock_qty - delta)
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.get_bind().dialect.update_returning:
+        updated = db.session.execute(take.returning(Product.id)).scalars().all()
+    else:
+        # MySQL: لا RETURNING؛ نقفل الصفوف أولًا فيبقى ما نقرؤه هو ما يخصمه الـ UPDATE
+        updated = [
+            pid for pid, qty in db.session.execute(
+                db.select(Product.id, Product.stock_qty).where(Product.id.in_(deltas)).with_for_update()
+            ).all()
+            if qty >= deltas[pid]
+        ]
+        if updated:
+            db.session.execute(take)
+    applied = {pid: deltas[pid] for pid in updated}
+    short = set(deltas) - set(updated)
+    if not short:
+        return applied
+    if (mode or current_app.config["STOCK_MODE"]) == "strict":
+        raise InsufficientStock(short)
+    # نادر: نقرأ الرصيد مع قفل الصف، فنعرف الكمية المخصومة فعلًا قبل الكتابة
+    held = dict(
+        db.session.execute(
+            db.select(Product.id, Product.stock_qty).where(Product.id.in_(short)).with_for_update()
+        ).all()
+    )
+    remaining = {pid: qty - deltas[pid] if qty > deltas[pid] else 0 for pid, qty in held.items()}
+    if remaining:
+        db.session.execute(
+            db.update(Product)
+            .where(Product.id.in_(remaining))
+            .values(stock_qty=db.case(remaining, value=Product.id))
+            .execution_options(synchronize_session=False)
+        )
+    applied.update({pid: held[pid] - qty for pid, qty in remaining.items()})
+    return applied
+
+
+def run_transaction(fn, attempts=None):
+    """Run ``fn`` and commit, retrying on lock/serialization conflicts.
+
+    ``fn`` must only stage changes on ``db.session``; on an
+    ``OperationalError`` (SQLite "database is locked", PostgreSQL
+    serialization failure or deadlock) the session is rolled back and ``fn``
+    runs again, up to ``DB_RETRY_ATTEMPTS`` times with jittered backoff.
+    """
+    from ..models import db
+
+    attempts = attempts or current_app.config["DB_RETRY_ATTEMPTS"]
+    for attempt in range(attempts):
+        try:
+            result = fn()
+            db.session.commit()
+            return result
+        except OperationalError:
+            db.session.rollback()
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.02 * (2 ** attempt) * (1 + random.random()))
+        except Exception:
+            db.session.rollback()
+            raise
@@ -0,0 +1,67 @@
+import threading
+import time
+
+from flask_login import UserMixin
+
+
+class CachedUser(UserMixin):
+    """Read-only identity of a logged-in user, as served by ``UserCache``."""
+
+    def __init__(self, id, username, role):
+        self.id = id
+        self.username = username
+        self.role = role
+
+
+class UserCache:
+    """Process-local cache behind ``load_user``.
+
+    Every ``login_required`` request loads the session's user; with the cache
+    the row is read at most once per ``USER_CACHE_TTL`` seconds per worker.
+    Entries hold only id, username and role. Updates and deletes of a
+    ``User`` drop its entry right away in this worker; other workers pick the
+    change up when the TTL runs out. ``USER_CACHE_TTL=0`` disables caching.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 30
+        self._lock = threading.Lock()
+        self._entries = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get("USER_CACHE_TTL", self.ttl)
+
+    def get(self, user_id, loader):
+        """Return the cached identity for ``user_id``, calling ``loader`` on a miss."""
+        cached = self.peek(user_id)
+        if cached is not None:
+            return cached
+        return self.remember(user_id, loader(user_id))
+
+    def peek(self, user_id):
+        """The cached identity for ``user_id`` if it has not expired, else ``None``."""
+        entry = self._entries.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    def remember(self, user_id, user):
+        """Cache and return the identity of a freshly loaded ``user`` row (``None`` if gone)."""
+        if user is None:
+            self.invalidate(user_id)
+            return None
+        cached = CachedUser(user.id, user.username, user.role)
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[user_id] = (time.monotonic(), cached)
+        return cached
+
+    def invalidate(self, user_id=None):
+        """Forget one user, or everyone when ``user_id`` is ``None``."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
@@ -0,0 +1,69 @@
+"""Shared helpers for the benchmark scripts (throwaway SQLite app + stats)."""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = ["أرز", "سكر", "زيت", "شاي", "قهوة", "مكرونة", "عدس", "فول", "جبنة", "لبن",
+         "rice", "sugar", "oil", "tea", "coffee", "pasta", "milk", "cheese"]
+
+
+def make_app(database_url=None, job_workers=0):
+    """Create the app on a fresh database (temporary SQLite by default).
+
+    Background job threads are off unless ``job_workers`` is set, so their
+    polling does not show up in statement counts.
+    """
+    if database_url is None:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    os.environ["DATABASE_URL"] = database_url
+    from app import create_app
+    from app.config import Config
+
+    Config.SQLALCHEMY_DATABASE_URI = database_url
+    Config.JOB_WORKERS = job_workers
+    return create_app()
+
+
+def seed_products(count, seed=42):
+    """Bulk insert ``count`` synthetic products and return the row dicts."""
+    from app import db
+    from app.models import Product
+
+    rng = random.Random(seed)
+    rows = [
+        {
+            "name": f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}",
+            "price": round(rng.uniform(1, 500), 2),
+            "stock_qty": rng.randint(0, 200),
+            "min_stock_alert": 5,
+            "barcode": f"{200000000000 + i}",
+        }
+        for i in range(count)
+    ]
+    db.session.execute(db.insert(Product), rows)
+    db.session.commit()
+    return rows
+
+
+def login(client, username="admin", password="admin123"):
+    client.post("/login", data={"username": username, "password": password})
+    return client
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def timed(fn, inputs):
+    """Call ``fn`` for each input and return per-call latency in ms."""
+    samples = []
+    for value in inputs:
+        start = time.perf_counter()
+        fn(value)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
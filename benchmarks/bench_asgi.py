@@ -0,0 +1,127 @@
+"""Concurrent throughput of the ASGI entry point: wrapped WSGI vs native async.
+
+Drives both apps in-process (no HTTP server in between) with the same mix
+of hot POS requests — product search, sale details and barcode SVGs — from
+``--concurrency`` simultaneous clients sharing one logged-in session:
+
+* ``wsgi``: ``WsgiToAsgi(flask_app)``, the old ``api/index.py`` export;
+* ``async``: ``AsyncRoutes(flask_app)`` from ``app/asgi.py``.
+
+Each client count runs a warm-up round first so caches (search index,
+barcode files, user cache) are equally warm for both. Prints requests per
+second and latency percentiles, and checks every response was a 200.
+
+Usage: python benchmarks/bench_asgi.py [--skus 5000] [--sales 200] [--requests 2000] [--concurrency 1,16,64]
+"""
+import argparse
+import asyncio
+import random
+import time
+from urllib.parse import urlencode
+
+from _common import login, make_app, percentile, seed_products
+
+
+def workload(rng, rows, sale_ids, count):
+    requests = []
+    for _ in range(count):
+        row, pick = rng.choice(rows), rng.random()
+        if pick < 0.5:
+            term = rng.choice([row["barcode"], row["name"].split(" ")[0], row["name"][:2]])
+            requests.append(("/api/products/search", urlencode({"q": term})))
+        elif pick < 0.8:
+            requests.append((f"/api/sale/{rng.choice(sale_ids)}", ""))
+        else:
+            requests.append((f"/barcode/{row['barcode']}.svg", ""))
+    return requests
+
+
+async def call(app, cookie, path, query):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [(b"host", b"localhost"), (b"cookie", f"session={cookie}".encode())],
+        "server": ("localhost", 80),
+        "client": ("127.0.0.1", 5000),
+    }
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+async def run(app, cookie, requests, concurrency):
+    queue = list(reversed(requests))
+    latencies, statuses = [], []
+
+    async def client():
+        while queue:
+            path, query = queue.pop()
+            start = time.perf_counter()
+            statuses.append(await call(app, cookie, path, query))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return len(requests) / (time.perf_counter() - start), latencies, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, default=5000)
+    parser.add_argument("--sales", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", default="1,16,64")
+    parser.add_argument("--database-url", default=None, help="e.g. postgresql://... (default: temp SQLite)")
+    args = parser.parse_args()
+
+    app = make_app(args.database_url)
+    from asgiref.wsgi import WsgiToAsgi
+    from app.asgi import AsyncRoutes
+
+    rng = random.Random(42)
+    with app.app_context():
+        rows = seed_products(args.skus)
+    client = login(app.test_client())
+    sale_ids = []
+    for _ in range(args.sales):
+        items = [{"id": rng.randint(1, args.skus), "qty": 1, "price": 5} for _ in range(rng.randint(1, 6))]
+        sale_ids.append(client.post("/api/sale", json={"items": items}).get_json()["sale_id"])
+    cookie = client.get_cookie("session").value
+
+    apps = {"wsgi": WsgiToAsgi(app), "async": AsyncRoutes(app)}
+    print(f"SKUs: {args.skus}  sales: {args.sales}  requests per run: {args.requests}")
+
+    async def bench():
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            requests = workload(rng, rows, sale_ids, args.requests)
+            for name, asgi_app in apps.items():
+                await run(asgi_app, cookie, requests[: max(50, concurrency)], concurrency)
+                rps, latencies, statuses = await run(asgi_app, cookie, requests, concurrency)
+                bad = len(statuses) - statuses.count(200)
+                print(
+                    f"c={concurrency:<4} {name:>5}: {rps:8.0f} req/s  "
+                    f"p50={percentile(latencies, 50):7.2f} ms  p95={percentile(latencies, 95):7.2f} ms  "
+                    f"p99={percentile(latencies, 99):7.2f} ms" + (f"  non-200={bad}" if bad else "")
+                )
+        await apps["async"].engine.dispose()
+
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
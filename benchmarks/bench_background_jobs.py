@@ -0,0 +1,97 @@
+"""Cashier latency while back-office exports run inline or as background jobs.
+
+A client posts ``--sales`` sales to /api/sale and records their latency in
+three phases: alone; while another thread keeps downloading the sales
+export inline (the old request-path behaviour); and while that thread queues
+``?background=1`` exports one after another, which a separate ``flask jobs
+work``-style process writes to disk.
+
+Usage: python benchmarks/bench_background_jobs.py [--history 10000] [--sales 150]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from _common import login, make_app, percentile, seed_products
+
+
+def drain(database_url, stop):
+    app = make_app(database_url)
+    from app import jobs
+
+    with app.app_context():
+        while not stop.is_set():
+            if not jobs.run_next():
+                time.sleep(0.05)
+
+
+def cashier(client, sales):
+    samples = []
+    for _ in range(sales):
+        start = time.perf_counter()
+        resp = client.post("/api/sale", json={"items": [{"id": 1, "name": "p", "price": 5.0, "qty": 1}]})
+        samples.append((time.perf_counter() - start) * 1000)
+        assert resp.status_code == 200, resp.data
+    return samples
+
+
+def back_office(client, url, stop, done):
+    """Request one export after another (a queued one counts once its file is written)."""
+    while not stop.is_set():
+        resp = client.get(url)
+        resp.get_data()
+        if resp.status_code == 202:
+            status_url = resp.get_json()["status_url"]
+            while not stop.is_set() and client.get(status_url).get_json()["status"] not in ("done", "failed"):
+                time.sleep(0.05)
+        done.append(resp.status_code)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--history", type=int, default=10000, help="existing sales to export")
+    parser.add_argument("--sales", type=int, default=150)
+    args = parser.parse_args()
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'jobs.db')}"
+    app = make_app(database_url)
+    from app import barcode_cache, db
+    from app.models import Sale
+
+    barcode_cache.output_dir = None
+    with app.app_context():
+        seed_products(1)
+        db.session.execute(db.update(db.metadata.tables["products"]).values(stock_qty=10 ** 9))
+        db.session.execute(db.insert(Sale), [
+            {"total": 5.0, "net_total": 5.0, "cashier": "admin"} for _ in range(args.history)
+        ])
+        db.session.commit()
+
+    print(f"{'phase':<12} {'back-office':>11} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for phase, url in (("alone", None), ("inline", "/export/sales"), ("background", "/export/sales?background=1")):
+        stop, done = threading.Event(), []
+        workers = []
+        if url:
+            worker = threading.Thread(target=back_office, args=(login(app.test_client()), url, stop, done))
+            workers.append(worker)
+            if phase == "background":
+                proc_stop = multiprocessing.Event()
+                proc = multiprocessing.Process(target=drain, args=(database_url, proc_stop))
+                proc.start()
+            worker.start()
+        samples = cashier(login(app.test_client()), args.sales)
+        stop.set()
+        for worker in workers:
+            worker.join()
+        if phase == "background":
+            proc_stop.set()
+            proc.join()
+        print(f"{phase:<12} {len(done):>11} {percentile(samples, 50):8.2f} "
+              f"{percentile(samples, 95):8.2f} {percentile(samples, 99):8.2f}")
+
+
+if __name__ == "__main__":
+    main()
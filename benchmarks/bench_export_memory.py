@@ -0,0 +1,75 @@
+"""Show that streaming exports run in constant memory.
+
+Exports the same dataset at two sizes and compares the tracemalloc peak while
+the response body is consumed chunk by chunk. Exits non-zero when the peak
+grows with the row count.
+
+Usage: python benchmarks/bench_export_memory.py [--small 20000] [--large 200000]
+"""
+import argparse
+import time
+import tracemalloc
+
+from _common import login, make_app
+
+
+def seed_sales(count):
+    from app import db
+    from app.models import Sale, SaleItem
+
+    batch = 10_000
+    for start in range(0, count, batch):
+        n = min(batch, count - start)
+        db.session.execute(db.insert(Sale), [
+            {"id": start + i + 1, "total": 10.0, "discount": 0.0, "tax": 0.0, "net_total": 10.0, "cashier": "bench"}
+            for i in range(n)
+        ])
+        db.session.execute(db.insert(SaleItem), [
+            {"sale_id": start + i + 1, "product_name": f"منتج {i}", "qty": 1, "price": 10.0, "total": 10.0}
+            for i in range(n)
+        ])
+    db.session.commit()
+
+
+def measure(count, fmt):
+    app = make_app()
+    with app.app_context():
+        seed_sales(count)
+    client = login(app.test_client())
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    resp = client.get(f"/export/sales?format={fmt}", buffered=False)
+    size = 0
+    for chunk in resp.response:
+        size += len(chunk)
+    resp.close()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--small", type=int, default=20_000)
+    parser.add_argument("--large", type=int, default=200_000)
+    args = parser.parse_args()
+
+    failed = False
+    for fmt in ("csv", "xlsx"):
+        peaks = {}
+        for count in (args.small, args.large):
+            peak, size, elapsed = measure(count, fmt)
+            peaks[count] = peak
+            print(f"{fmt:>4} rows={count:>8} body={size / 1e6:7.1f} MB "
+                  f"peak={peak / 1e6:6.2f} MB time={elapsed:.1f}s")
+        ratio = peaks[args.large] / peaks[args.small]
+        print(f"{fmt:>4} peak ratio large/small: {ratio:.2f}")
+        failed |= ratio > 1.5
+    if failed:
+        raise SystemExit("export memory grows with row count")
+
+
+if __name__ == "__main__":
+    main()
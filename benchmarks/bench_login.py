@@ -0,0 +1,89 @@
+"""Login throughput across bcrypt costs, and per-request cost of load_user.
+
+Part 1 creates ``--users`` accounts hashed at ``--from-rounds`` and logs them
+all in concurrently, three times: at the old cost, right after lowering the
+configured cost to ``--to-rounds`` (each login verifies the old hash and
+rehashes it), and once more (every hash is now at the new cost).
+
+Part 2 requests a ``login_required`` endpoint with the user cache on and
+with ``USER_CACHE_TTL=0``, printing statements and latency per request.
+
+Usage: python benchmarks/bench_login.py [--users 16] [--threads 8] [--from-rounds 12] [--to-rounds 10]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import login, make_app, percentile, timed
+
+
+def login_wave(app, users, threads):
+    def one(username):
+        resp = app.test_client().post("/login", data={"username": username, "password": "secret"})
+        assert resp.status_code == 302 and "/login" not in resp.location, username
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(one, users))
+    return len(users) / (time.perf_counter() - start)
+
+
+def stored_rounds(app):
+    from app.auth import hash_rounds
+    from app.models import User
+
+    with app.app_context():
+        return sorted({hash_rounds(u.password_hash) for u in User.query.filter(User.username != "admin")})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--from-rounds", type=int, default=12)
+    parser.add_argument("--to-rounds", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    app = make_app()
+    from app import barcode_cache, bcrypt, db, user_cache
+    from app.models import User
+    from app.utils.querycount import QueryCounter
+
+    barcode_cache.output_dir = None
+    app.config["BCRYPT_LOG_ROUNDS"] = args.from_rounds
+    bcrypt.init_app(app)
+    users = [f"user{i}" for i in range(args.users)]
+    with app.app_context():
+        password_hash = bcrypt.generate_password_hash("secret").decode("utf-8")
+        db.session.execute(db.insert(User), [
+            {"username": name, "password_hash": password_hash, "role": "cashier"} for name in users
+        ])
+        db.session.commit()
+
+    print(f"--- {args.users} concurrent logins, {args.threads} threads")
+    rate = login_wave(app, users, args.threads)
+    print(f"cost {args.from_rounds:>2}            {rate:7.1f} logins/s  stored={stored_rounds(app)}")
+    app.config["BCRYPT_LOG_ROUNDS"] = args.to_rounds
+    bcrypt.init_app(app)
+    rate = login_wave(app, users, args.threads)
+    print(f"cost {args.to_rounds:>2} (rehashing) {rate:7.1f} logins/s  stored={stored_rounds(app)}")
+    rate = login_wave(app, users, args.threads)
+    print(f"cost {args.to_rounds:>2}            {rate:7.1f} logins/s  stored={stored_rounds(app)}")
+
+    print(f"--- {args.requests} requests to /api/stock-alerts/counts")
+    client = login(app.test_client())
+    with app.app_context():
+        engine = db.engine
+    for label, ttl in (("cache on", app.config["USER_CACHE_TTL"]), ("USER_CACHE_TTL=0", 0)):
+        user_cache.ttl = ttl
+        user_cache.invalidate()
+        client.get("/api/stock-alerts/counts")  # تسخين
+        with QueryCounter(engine) as counter:
+            samples = timed(lambda _: client.get("/api/stock-alerts/counts"), range(args.requests))
+        print(f"{label:<17} {counter.count / args.requests:4.1f} statements/request  "
+              f"p50={percentile(samples, 50):.2f}ms p95={percentile(samples, 95):.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
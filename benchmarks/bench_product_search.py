@@ -0,0 +1,55 @@
+"""Compare /api/products/search lookups: ILIKE scan vs the in-memory index.
+
+Usage: python benchmarks/bench_product_search.py [--skus 100000] [--queries 500]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from _common import make_app, percentile, seed_products, timed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    app = make_app()
+    from app import product_index
+    from app.models import Product
+
+    rng = random.Random(42)
+    with app.app_context():
+        rows = seed_products(args.skus)
+
+        queries = []
+        for _ in range(args.queries):
+            row = rng.choice(rows)
+            queries.append(rng.choice([row["barcode"], row["name"].split(" ")[0], row["name"][:2]]))
+
+        def ilike(q):
+            return (
+                Product.query.filter(
+                    (Product.name.ilike(f"%{q}%")) | (Product.barcode.ilike(f"%{q}%"))
+                )
+                .limit(10)
+                .all()
+            )
+
+        start = time.perf_counter()
+        product_index.search("")
+        build_ms = (time.perf_counter() - start) * 1000
+
+        print(f"SKUs: {args.skus}  queries: {args.queries}  index build: {build_ms:.0f} ms")
+        for label, fn in (("ilike", ilike), ("index", product_index.search)):
+            samples = timed(fn, queries)
+            print(
+                f"{label:>6}: p50={statistics.median(samples):.3f} ms  "
+                f"p99={percentile(samples, 99):.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Query plans and latency for the main routes at realistic data sizes.
+
+Seeds a store-sized database, then for each route prints the p50/p95
+latency over ``--requests`` calls and the plan of every SQL statement the
+route ran (``EXPLAIN QUERY PLAN`` on SQLite, ``EXPLAIN`` on PostgreSQL).
+Scans without an index and temporary sorts are marked with ``!!``; a
+primary-key scan under ``LIMIT`` (newest-first lists) is expected. Run once with
+``--without-indexes`` to see the same routes before migration
+0001_query_indexes.
+
+Usage: python benchmarks/bench_query_plans.py [--scale 1.0] [--requests 30]
+       [--database-url postgresql://...] [--without-indexes]
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, text
+
+from _common import WORDS, login, make_app, percentile, seed_products, timed
+
+SIZES = {
+    "products": 20_000,
+    "customers": 10_000,
+    "sales": 100_000,
+    "items_per_sale": 3,
+    "inventory_log": 50_000,
+    "suppliers": 200,
+    "supplier_invoices": 5_000,
+    "shifts": 2_000,
+}
+BATCH = 10_000
+
+
+def _chunks(rows):
+    for start in range(0, len(rows), BATCH):
+        yield rows[start:start + BATCH]
+
+
+def seed(scale, rng):
+    from app import db
+    from app.models import (Customer, InventoryLog, Sale, SaleItem, Shift, Supplier,
+                            SupplierInvoice, SupplierInvoiceItem)
+
+    n = {k: max(1, int(v * scale)) if k != "items_per_sale" else v for k, v in SIZES.items()}
+    products = seed_products(n["products"])
+    now = datetime.utcnow()
+    days = 365
+
+    from app.customers import name_key, phone_key
+
+    customers = [
+        {"name": f"{WORDS[i % len(WORDS)]} {i}", "phone": f"010{i:08d}", "total_purchases": rng.uniform(0, 5000)}
+        for i in range(n["customers"])
+    ]
+    # الإدخال المجمّع لا يمر بأحداث before_insert؛ نحسب المفاتيح هنا
+    for row in customers:
+        row.update(name_key=name_key(row["name"]), phone_key=phone_key(row["phone"]))
+    db.session.execute(db.insert(Customer), customers)
+    sales = [
+        {"id": i + 1, "customer_id": rng.randint(1, n["customers"]) if i % 3 else None,
+         "total": 100.0, "discount": 0.0, "tax": 0.0, "net_total": 100.0, "cashier": "admin",
+         "created_at": now - timedelta(minutes=rng.randint(0, days * 24 * 60))}
+        for i in range(n["sales"])
+    ]
+    for chunk in _chunks(sales):
+        db.session.execute(db.insert(Sale), chunk)
+    items = []
+    for sale in sales:
+        for _ in range(n["items_per_sale"]):
+            pid = rng.randint(1, n["products"])
+            items.append({"sale_id": sale["id"], "product_id": pid, "product_name": products[pid - 1]["name"],
+                          "qty": 1, "price": 33.3, "total": 33.3})
+    for chunk in _chunks(items):
+        db.session.execute(db.insert(SaleItem), chunk)
+    for chunk in _chunks([
+        {"product_id": rng.randint(1, n["products"]), "change_qty": rng.randint(-5, 20), "note": "bench",
+         "created_at": now - timedelta(minutes=rng.randint(0, days * 24 * 60))}
+        for _ in range(n["inventory_log"])
+    ]):
+        db.session.execute(db.insert(InventoryLog), chunk)
+    db.session.execute(db.insert(Supplier), [
+        {"name": f"مورد {i}", "phone": "", "balance": 0.0} for i in range(n["suppliers"])
+    ])
+    db.session.execute(db.insert(SupplierInvoice), [
+        {"id": i + 1, "supplier_id": rng.randint(1, n["suppliers"]), "total": 500.0, "paid": 500.0,
+         "remaining": 0.0, "created_at": now - timedelta(days=rng.randint(0, days))}
+        for i in range(n["supplier_invoices"])
+    ])
+    db.session.execute(db.insert(SupplierInvoiceItem), [
+        {"invoice_id": rng.randint(1, n["supplier_invoices"]), "product_id": pid,
+         "product_name": products[pid - 1]["name"], "qty": 10, "cost": 5.0, "total": 50.0}
+        for pid in (rng.randint(1, n["products"]) for _ in range(n["supplier_invoices"] * 3))
+    ])
+    db.session.execute(db.insert(Shift), [
+        {"cashier_name": "admin", "opening_cash": 0.0, "start_time": now - timedelta(hours=12 * i),
+         "end_time": None if i == 0 else now - timedelta(hours=12 * i - 8)}
+        for i in range(n["shifts"])
+    ])
+    db.session.commit()
+
+    from app import rollups
+
+    rollups.backfill(db.session)
+    db.session.commit()
+    return n
+
+
+def routes(n, rng):
+    sale_id = rng.randint(1, n["sales"])
+    customer = rng.randint(0, n["customers"] - 1)
+    return [
+        ("products", "/products"),
+        ("products by name", "/products?sort=name"),
+        ("products by stock", "/products?sort=stock&dir=asc"),
+        ("inventory", "/inventory"),
+        ("customers", "/customers"),
+        ("customers by name", "/customers?sort=name"),
+        ("sales", "/sales"),
+        ("invoice", f"/invoice/{sale_id}"),
+        ("sale details", f"/api/sale/{sale_id}"),
+        ("shifts", "/shifts"),
+        ("returns", "/returns"),
+        ("reports", "/reports"),
+        ("supplier invoices", "/supplier-invoices"),
+        ("supplier invoice", f"/supplier-invoice/{rng.randint(1, n['supplier_invoices'])}"),
+        ("product search", "/api/products/search?q=" + WORDS[3]),
+        # نفس استعلامي customers.resolve: بالهاتف أولًا ثم بالاسم
+        ("customer lookup by phone (sale)", ("resolve", "", f"010{customer:08d}")),
+        ("customer lookup by name (sale)", ("resolve", f"{WORDS[customer % len(WORDS)]} {customer}", "")),
+    ]
+
+
+def explain(conn, statement, params):
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    try:
+        rows = conn.exec_driver_sql(prefix + statement, params).all()
+    except Exception as exc:  # تعليمات لا تقبل EXPLAIN (PRAGMA, ...)
+        return [f"(no plan: {exc.__class__.__name__})"]
+    lines = [str(row[-1]) for row in rows]
+    return [("!! " if _full_scan(line) else "   ") + line for line in lines]
+
+
+def _full_scan(line):
+    # SCAN بدون فهرس أو فرز في جدول مؤقت؛ المسح بالمفتاح الأساسي مع LIMIT لا بأس به
+    if "Seq Scan" in line or "TEMP B-TREE" in line:
+        return True
+    return line.startswith("SCAN") and "USING" not in line
+
+
+def drop_indexes():
+    from app import db
+    from app.database import MIGRATIONS
+    from app.models import SchemaMigration
+
+    mid, migrate = MIGRATIONS[0]
+    with db.engine.begin() as conn:
+        for name in migrate.index_names:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        conn.execute(db.delete(SchemaMigration).where(SchemaMigration.id == mid))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--without-indexes", action="store_true")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    app = make_app(args.database_url)
+    from app import db
+
+    with app.app_context():
+        n = seed(args.scale, rng)
+        if args.without_indexes:
+            drop_indexes()
+        db.session.execute(text("ANALYZE"))
+        db.session.commit()
+        engine = db.engine
+    print("rows: " + ", ".join(f"{k}={v}" for k, v in n.items()))
+
+    client = login(app.test_client())
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            captured.append((statement, parameters))
+
+    for label, target in routes(n, rng):
+        if isinstance(target, tuple):
+            _, name, phone = target
+
+            def call(_, name=name, phone=phone):
+                from app.customers import resolve
+
+                with app.app_context():
+                    resolve(name, phone)
+                    db.session.rollback()
+        else:
+            def call(_, url=target):
+                resp = client.get(url)
+                assert resp.status_code == 200, (url, resp.status_code)
+
+        call(None)  # تسخين (فهرس البحث، الكاش)
+        samples = timed(call, range(args.requests))
+        captured.clear()
+        event.listen(engine, "before_cursor_execute", capture)
+        call(None)
+        event.remove(engine, "before_cursor_execute", capture)
+
+        print(f"\n== {label}: p50={percentile(samples, 50):.2f} ms  p95={percentile(samples, 95):.2f} ms  "
+              f"statements={len(captured)}")
+        with engine.connect() as conn:
+            for statement, params in captured:
+                print("  " + " ".join(statement.split())[:140])
+                for line in explain(conn, statement, params):
+                    print("      " + line)
+
+
+if __name__ == "__main__":
+    main()
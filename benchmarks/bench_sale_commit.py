@@ -0,0 +1,52 @@
+"""Post synthetic carts to /api/sale and report statements and latency per sale.
+
+Usage: python benchmarks/bench_sale_commit.py [--skus 5000] [--sales 20]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from _common import login, make_app, percentile, seed_products
+
+CART_SIZES = (1, 10, 60, 200)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, default=5000)
+    parser.add_argument("--sales", type=int, default=20, help="sales per cart size")
+    args = parser.parse_args()
+
+    app = make_app()
+    from app import db
+    from app.utils.querycount import QueryCounter
+
+    rng = random.Random(7)
+    with app.app_context():
+        seed_products(args.skus)
+        engine = db.engine
+    client = login(app.test_client())
+
+    print(f"{'lines':>5} {'stmts/sale':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in CART_SIZES:
+        samples, statements = [], []
+        for _ in range(args.sales):
+            cart = [
+                {"id": pid, "name": f"p{pid}", "price": 5.0, "qty": rng.randint(1, 3)}
+                for pid in rng.sample(range(1, args.skus + 1), size)
+            ]
+            with QueryCounter(engine) as counter:
+                start = time.perf_counter()
+                resp = client.post("/api/sale", json={"items": cart, "customer_name": "bench"})
+                samples.append((time.perf_counter() - start) * 1000)
+            assert resp.status_code == 200, resp.data
+            statements.append(counter.count)
+        print(
+            f"{size:>5} {statistics.mean(statements):>10.1f} "
+            f"{statistics.median(samples):>8.2f} {percentile(samples, 99):>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Time a cold start of the serverless entry point and fail when it regresses.
+
+Each run is a fresh interpreter importing ``api/index.py`` (which creates
+the app) with ``-X importtime``, against a database initialized beforehand
+with ``flask db init``. Reported per run: wall time of the import, SQL
+statements executed while starting, and the slowest modules. The check
+fails if the best run exceeds ``--budget-ms``, if starting touches the
+database, or if a module that should load lazily (``LAZY_MODULES``) was
+imported. Exits non-zero on failure so it can run in CI.
+
+Usage: python benchmarks/check_cold_start.py [--runs 5] [--budget-ms 900] [--top 10]
+       python benchmarks/check_cold_start.py --auto-migrate   # the old start-up, for comparison
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# تُحمّل عند أول استخدام فقط (رسم الباركود، الاستيراد، التصدير)
+LAZY_MODULES = ("barcode", "app.imports", "app.utils.export")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+statements = []
+event.listen(Engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+import api.index
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "ms": elapsed * 1000,
+    "statements": len(statements),
+    "lazy_loaded": [m for m in %r if m in sys.modules],
+}))
+""" % (LAZY_MODULES,)
+
+
+def parse_importtime(stderr, top):
+    """Slowest modules by cumulative import time (ms), outermost first on ties."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit() and name.strip() != "api.index":
+            rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def run_once(env, top):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode:
+        raise SystemExit(proc.stderr[-2000:])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["modules"] = parse_importtime(proc.stderr, top)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=900)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--auto-migrate", action="store_true", help="start with AUTO_MIGRATE=1")
+    args = parser.parse_args()
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'cold.db')}"
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONPATH=ROOT, JOB_WORKERS="0")
+    subprocess.run(
+        [sys.executable, "-m", "flask", "--app", "app", "db", "init"],
+        cwd=ROOT, env=dict(env, AUTO_MIGRATE="0"), check=True, capture_output=True,
+    )
+    env["AUTO_MIGRATE"] = "1" if args.auto_migrate else "0"
+
+    runs = [run_once(env, args.top) for _ in range(args.runs)]
+    best = min(runs, key=lambda r: r["ms"])
+    for i, run in enumerate(runs, 1):
+        print(f"run {i}: {run['ms']:7.1f} ms  sql={run['statements']}")
+    print("slowest imports (cumulative, best run):")
+    for ms, name in best["modules"]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    failures = []
+    if best["ms"] > args.budget_ms:
+        failures.append(f"cold start {best['ms']:.0f} ms > budget {args.budget_ms:.0f} ms")
+    if not args.auto_migrate and best["statements"]:
+        failures.append(f"{best['statements']} SQL statements during start-up (expected 0)")
+    if best["lazy_loaded"]:
+        failures.append("imported at start-up: " + ", ".join(best["lazy_loaded"]))
+    for failure in failures:
+        print("FAIL " + failure)
+    if not failures:
+        print(f"ok   best {best['ms']:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
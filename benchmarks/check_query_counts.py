@@ -0,0 +1,96 @@
+"""Pin the number of SQL statements the list and detail views run.
+
+Each view is requested on a small and on a larger data set (more sales,
+more lines per invoice, more distinct customers and suppliers). The count
+must be the same for both and within ``BUDGETS``; a view that starts
+loading customers, suppliers or lines row by row (N+1) fails here. Exits
+non-zero on failure so it can run in CI.
+
+Usage: python benchmarks/check_query_counts.py [--verbose]
+"""
+import argparse
+import sys
+
+from _common import login, make_app, seed_products
+
+# المستخدم المسجّل يأتي من كاش المستخدمين (USER_CACHE_TTL) فلا يُحسب هنا
+BUDGETS = {
+    "/sales": 1,
+    "/invoice/{sale}": 2,
+    "/api/sale/{sale}": 2,
+    "/supplier-invoices": 2,
+    "/supplier-invoice/{invoice}": 2,
+}
+SIZES = {"small": (2, 1), "large": (60, 25)}  # (عدد الفواتير، أصناف كل فاتورة)
+
+
+def seed(invoices, lines):
+    from app import db
+    from app.models import Customer, Sale, SaleItem, Supplier, SupplierInvoice, SupplierInvoiceItem
+
+    products = seed_products(lines)
+    db.session.execute(db.insert(Customer), [{"name": f"عميل {i}", "phone": ""} for i in range(invoices)])
+    db.session.execute(db.insert(Supplier), [{"name": f"مورد {i}", "phone": ""} for i in range(invoices)])
+    db.session.execute(db.insert(Sale), [
+        {"id": i, "customer_id": i, "total": 10.0, "net_total": 10.0, "cashier": "admin"}
+        for i in range(1, invoices + 1)
+    ])
+    db.session.execute(db.insert(SupplierInvoice), [
+        {"id": i, "supplier_id": i, "total": 10.0, "paid": 10.0, "remaining": 0.0}
+        for i in range(1, invoices + 1)
+    ])
+    db.session.execute(db.insert(SaleItem), [
+        {"sale_id": sid, "product_id": pid, "product_name": products[pid - 1]["name"],
+         "qty": 1, "price": 1.0, "total": 1.0}
+        for sid in range(1, invoices + 1) for pid in range(1, lines + 1)
+    ])
+    db.session.execute(db.insert(SupplierInvoiceItem), [
+        {"invoice_id": iid, "product_id": pid, "product_name": products[pid - 1]["name"],
+         "qty": 1, "cost": 1.0, "total": 1.0}
+        for iid in range(1, invoices + 1) for pid in range(1, lines + 1)
+    ])
+    db.session.commit()
+    return {"sale": invoices, "invoice": invoices}
+
+
+def measure(invoices, lines):
+    from app import barcode_cache, db
+    from app.utils.querycount import QueryCounter
+
+    app = make_app()
+    barcode_cache.output_dir = None
+    with app.app_context():
+        ids = seed(invoices, lines)
+        engine = db.engine
+    client = login(app.test_client())
+    counts = {}
+    for route in BUDGETS:
+        url = route.format(**ids)
+        client.get(url)  # تسخين (كاش الإعدادات)
+        with QueryCounter(engine) as counter:
+            resp = client.get(url)
+        assert resp.status_code == 200, (url, resp.status_code)
+        counts[route] = counter
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    results = {label: measure(*size) for label, size in SIZES.items()}
+    failed = False
+    for route, budget in BUDGETS.items():
+        small, large = results["small"][route], results["large"][route]
+        ok = small.count == large.count and large.count <= budget
+        failed |= not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {route:<30} small={small.count} large={large.count} budget={budget}")
+        if args.verbose or not ok:
+            for statement in large.statements:
+                print("       " + statement[:140])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
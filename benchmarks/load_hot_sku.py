@@ -0,0 +1,96 @@
+"""Hammer one hot SKU from N processes and verify stock and customer totals.
+
+Every worker posts ``--sales`` sales of the same product (qty 1) for the same
+customer. With lost updates the final stock or ``total_purchases`` drifts;
+the script exits non-zero if either is off.
+
+Usage: python benchmarks/load_hot_sku.py [--workers 4] [--sales 50] [--mode clamp|strict]
+       DATABASE_URL=postgresql://... python benchmarks/load_hot_sku.py
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from _common import login, make_app
+
+PRICE = 7.5
+
+
+def worker(database_url, sales, results):
+    app = make_app(database_url)
+    client = login(app.test_client())
+    ok = rejected = 0
+    for _ in range(sales):
+        resp = client.post(
+            "/api/sale",
+            json={
+                "items": [{"id": 1, "name": "hot", "price": PRICE, "qty": 1}],
+                "customer_name": "hot-customer",
+            },
+        )
+        if resp.status_code == 200:
+            ok += 1
+        elif resp.status_code == 409:
+            rejected += 1
+        else:
+            raise RuntimeError(resp.data)
+    results.put((ok, rejected))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--sales", type=int, default=50)
+    parser.add_argument("--stock", type=int, default=None, help="initial stock (default: enough)")
+    parser.add_argument("--mode", choices=["clamp", "strict"], default="strict")
+    args = parser.parse_args()
+
+    os.environ["STOCK_MODE"] = args.mode
+    database_url = os.environ.get("DATABASE_URL") or (
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'load.db')}"
+    )
+    initial = args.stock if args.stock is not None else args.workers * args.sales
+
+    app = make_app(database_url)
+    from app import db
+    from app.models import Customer, Product
+
+    with app.app_context():
+        db.session.add(Product(id=1, name="hot", price=PRICE, stock_qty=initial, barcode="999000000001"))
+        db.session.add(Customer(name="hot-customer", total_purchases=0))
+        db.session.commit()
+
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=worker, args=(database_url, args.sales, results))
+        for _ in range(args.workers)
+    ]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    totals = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    sold = sum(ok for ok, _ in totals)
+    rejected = sum(r for _, r in totals)
+    with app.app_context():
+        stock = db.session.get(Product, 1).stock_qty
+        purchases = Customer.query.filter_by(name="hot-customer").first().total_purchases
+
+    expected_stock = max(0, initial - sold)
+    expected_purchases = sold * PRICE
+    print(f"workers={args.workers} sales={sold} rejected={rejected} "
+          f"elapsed={elapsed:.2f}s ({sold / elapsed:.0f} sales/s)")
+    print(f"stock: {stock} (expected {expected_stock})")
+    print(f"customer total: {purchases:.2f} (expected {expected_purchases:.2f})")
+    if stock != expected_stock or abs(purchases - expected_purchases) > 1e-6:
+        raise SystemExit("MISMATCH: lost updates detected")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()